@@ -20,6 +20,11 @@ Required Packages:
             (https://github.com/mstamy2/PyPDF2)
         pytesseract: Wrapper for the Tesseract API
             (https://github.com/madmaze/pytesseract)
+        tesserocr: Direct binding to the Tesseract API. Needed for OCR in
+            memory (OCRMODE_MEMORY) and for the OCR worker pool to keep the
+            language model loaded; without it, pytesseract starts Tesseract
+            for every page.
+            (https://github.com/sirfz/tesserocr)
         wand: Wrapper for the ImageMagick API
             (https://github.com/dahlia/wand)
         wordcloud: Generate word clouds from text.
@@ -44,21 +49,26 @@ Database Backend:
 import logging
 
 # Local modules and packages
-from gui.GLKminerApp import GLKminerApp
 import lib.constants as constants
 
 
-# Toggle logging
-if constants.DEFAULT_LOGTOCONSOLE:
-    logging.basicConfig(level=logging.INFO)
-    for logname in ['pdfminer.pdfdocument','pdfminer.pdfpage','pdfminer.pdfinterp','pdfminer.converter','pdfminer.cmapdb']:
-        logging.getLogger(logname).setLevel(logging.WARNING)
+# Guard the start-up code, since worker processes of parallel imports
+# re-import this module on platforms that spawn rather than fork processes.
+if __name__ == '__main__':
+    # Toggle logging
+    if constants.DEFAULT_LOGTOCONSOLE:
+        logging.basicConfig(level=logging.INFO)
+        for logname in ['pdfminer.pdfdocument','pdfminer.pdfpage','pdfminer.pdfinterp','pdfminer.converter','pdfminer.cmapdb']:
+            logging.getLogger(logname).setLevel(logging.WARNING)
 
-# Run the UI from where the currently implemented functions can be invoked
-app = GLKminerApp()
-app.run()
+    # Run the UI from where the currently implemented functions can be invoked.
+    # The UI is imported here, so that worker processes re-importing this
+    # module do not load kivy and the rest of the UI.
+    from gui.GLKminerApp import GLKminerApp
+    app = GLKminerApp()
+    app.run()
 
-# Beware that when run in IPython, the kivy framework produces an error on the
-# second and every further start of the app. To ensure proper function, the
-# console must be restarted before the next run.
-exit()
+    # Beware that when run in IPython, the kivy framework produces an error on the
+    # second and every further start of the app. To ensure proper function, the
+    # console must be restarted before the next run.
+    exit()
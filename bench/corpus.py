@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""Generate a synthetic corpus of German grant applications as PDF files.
+
+The corpus is fully determined by its seed, so benchmark runs on different
+machines and at different times see the same files. Three kinds of
+documents are generated in several sizes:
+    text: pages with extractable text only.
+    scanned: pages holding a single full-page image of rendered text, as
+        produced by a scanner.
+    mixed: text pages alternating with scanned pages.
+
+The PDF files are written directly, so no PDF library is needed; images are
+drawn with PIL.
+
+Usage:
+    python -m bench.corpus <folder> [--seed N]
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import argparse, io, os, random, zlib
+
+# Third party modules and packages
+from PIL import Image, ImageDraw, ImageFont
+
+# Constants and other objects
+DEFAULT_SEED = 2018
+DOCUMENT_KINDS = ('text', 'scanned', 'mixed')
+DOCUMENT_SIZES = {'small': 2, 'medium': 12, 'large': 48}
+DOCUMENTS_PER_SIZE = 2
+LINES_PER_PAGE = 40
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+SCAN_RESOLUTION = 150
+
+# Vocabulary of the applications, along with the function words which make
+# up most running text and are removed as stopwords.
+VOCABULARY = (
+        'Antrag Förderung Lehre Lehrprojekt Studierende Hochschule Innovation '
+        'Digitalisierung Lernplattform Seminar Vorlesung Prüfung Kompetenz '
+        'Evaluation Qualitätssicherung Betreuung Tutorium Praxisbezug Forschung '
+        'Methodik Lernziele Curriculum Studiengang Fakultät Modul Übung Projekt '
+        'Zusammenarbeit Nachhaltigkeit Medienkompetenz Feedback Blended-Learning '
+        'Selbststudium Gruppenarbeit Präsentation Reflexion Verstetigung Budget '
+        'Personalmittel Sachmittel Zeitplan Meilenstein Zielgruppe Erfahrungen '
+        'Lehrende Weiterbildung Öffentlichkeit Wissenschaft Gesellschaft').split()
+FUNCTION_WORDS = (
+        'der die das und in zu den mit von für ist im sich auf dem nicht eine '
+        'als auch es an werden aus er hat dass sie nach wird bei einer um am '
+        'sind noch wie einem über einen so zum war haben nur oder aber vor zur '
+        'bis mehr durch man sowie soll können unsere Studierenden').split()
+
+
+# Function definitions
+def sentence(rnd):
+    """Compose a sentence of random words, about a third of them content
+    words."""
+    words = [rnd.choice(VOCABULARY) if rnd.random() < 0.35 else rnd.choice(FUNCTION_WORDS)
+             for i in range(rnd.randint(6, 18))]
+    words[0] = words[0][0].upper() + words[0][1:]
+    text = ' '.join(words)
+    if rnd.random() < 0.2:
+        text+= ' ({0}.{1})'.format(rnd.randint(1, 9), rnd.randint(1, 20))
+
+    return text + rnd.choice('...!?')
+
+
+def pageLines(rnd, count=LINES_PER_PAGE, width=90):
+    """Compose the lines of a page of running text."""
+    lines, line = [], ''
+    while len(lines) < count:
+        for word in sentence(rnd).split():
+            if len(line) + len(word) + 1 > width:
+                lines.append(line)
+                line = ''
+            line = (line + ' ' + word).strip()
+
+    return lines[:count]
+
+
+def _pdfString(text):
+    """Encode text as a PDF string literal in WinAnsiEncoding."""
+    data = text.encode('cp1252', 'replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _scanFont(size):
+    """Return a font for scanned pages, scalable if PIL supports it."""
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def scanPage(lines, rnd, resolution=SCAN_RESOLUTION):
+    """Draw lines of text on a grayscale page image with a little noise, as
+    if the page had been printed and scanned.
+
+    Args:
+        lines (list): the lines of text.
+        rnd (Random): random number generator for the noise.
+        resolution (int, optional): resolution of the image in dpi.
+
+    Returns:
+        PIL.Image: the page image in mode 'L'.
+    """
+
+    scale = resolution / 72
+    image = Image.new('L', (int(PAGE_WIDTH * scale), int(PAGE_HEIGHT * scale)), 255)
+    draw = ImageDraw.Draw(image)
+    font = _scanFont(int(10 * scale))
+    for i, line in enumerate(lines):
+        draw.text((int(50 * scale), int((50 + i * 18) * scale)), line, fill=rnd.randint(0, 40), font=font)
+    for i in range(image.size[0] * image.size[1] // 2000):
+        draw.point((rnd.randrange(image.size[0]), rnd.randrange(image.size[1])), fill=rnd.randint(100, 200))
+
+    return image
+
+
+def writePDF(fullpath, pages):
+    """Write a PDF file with text and image pages.
+
+    Args:
+        fullpath (str): the file to write.
+        pages (list): for each page, a tuple of the kind ('text' or 'image')
+            and either the lines of text or a PIL image in mode 'L'.
+
+    Returns:
+        None
+    """
+
+    objects = []
+
+    def _add(data):
+        objects.append(data)
+        return len(objects)
+
+    font_id = _add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    pages_id = _add(None)
+    kids = []
+    for kind, content in pages:
+        if kind == 'text':
+            stream = b'BT /F1 10 Tf 14 TL 50 792 Td ' + b' '.join(_pdfString(line) + b" '" for line in content) + b' ET'
+            resources = '<< /Font << /F1 {0} 0 R >> >>'.format(font_id).encode()
+        else:
+            pixels = zlib.compress(content.tobytes())
+            image_id = _add('<< /Type /XObject /Subtype /Image /Width {0} /Height {1} /ColorSpace /DeviceGray '
+                            '/BitsPerComponent 8 /Filter /FlateDecode /Length {2} >>\nstream\n'.format(
+                                    content.size[0], content.size[1], len(pixels)).encode() + pixels + b'\nendstream')
+            stream = 'q {0} 0 0 {1} 0 0 cm /Im1 Do Q'.format(PAGE_WIDTH, PAGE_HEIGHT).encode()
+            resources = '<< /XObject << /Im1 {0} 0 R >> >>'.format(image_id).encode()
+        stream = zlib.compress(stream)
+        contents_id = _add('<< /Length {0} /Filter /FlateDecode >>\nstream\n'.format(len(stream)).encode() + stream + b'\nendstream')
+        kids.append(_add('<< /Type /Page /Parent {0} 0 R /MediaBox [0 0 {1} {2}] /Contents {3} 0 R /Resources '.format(
+                pages_id, PAGE_WIDTH, PAGE_HEIGHT, contents_id).encode() + resources + b' >>'))
+    objects[pages_id - 1] = '<< /Type /Pages /Kids [{0}] /Count {1} >>'.format(
+            ' '.join('{0} 0 R'.format(kid) for kid in kids), len(kids)).encode()
+    catalog_id = _add('<< /Type /Catalog /Pages {0} 0 R >>'.format(pages_id).encode())
+
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, data in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write('{0} 0 obj\n'.format(number).encode() + data + b'\nendobj\n')
+    xref = out.tell()
+    out.write('xref\n0 {0}\n0000000000 65535 f \n'.format(len(objects) + 1).encode())
+    for offset in offsets:
+        out.write('{0:010d} 00000 n \n'.format(offset).encode())
+    out.write('trailer\n<< /Size {0} /Root {1} 0 R >>\nstartxref\n{2}\n%%EOF\n'.format(len(objects) + 1, catalog_id, xref).encode())
+
+    with open(fullpath, 'wb') as fw:
+        fw.write(out.getvalue())
+
+
+def documentPages(kind, page_count, rnd):
+    """Compose the pages of a document of a given kind."""
+    pages = []
+    for number in range(page_count):
+        lines = pageLines(rnd)
+        if kind == 'scanned' or (kind == 'mixed' and number % 2):
+            pages.append(('image', scanPage(lines, rnd)))
+        else:
+            pages.append(('text', lines))
+
+    return pages
+
+
+def makeCorpus(folder, seed=DEFAULT_SEED, kinds=DOCUMENT_KINDS, sizes=DOCUMENT_SIZES, per_size=DOCUMENTS_PER_SIZE):
+    """Generate the corpus in a folder, with one subfolder per kind of
+    document. Existing files are kept, so the corpus is generated only once.
+
+    Args:
+        folder (str): the corpus folder.
+        seed (int, optional): seed of the random number generator.
+        kinds (list, optional): kinds of documents to generate.
+        sizes (dict, optional): size names and page counts.
+        per_size (int, optional): number of documents per kind and size.
+
+    Returns:
+        dict: kinds of documents and lists of their files.
+    """
+
+    corpus = {}
+    for kind in kinds:
+        os.makedirs(os.path.join(folder, kind), exist_ok=True)
+        corpus[kind] = []
+        for size, page_count in sorted(sizes.items(), key=lambda item: item[1]):
+            for i in range(per_size):
+                fullpath = os.path.join(folder, kind, 'antrag_{0}_{1}_{2:02d}.pdf'.format(kind, size, i))
+                corpus[kind].append(fullpath)
+                if not os.path.exists(fullpath):
+                    rnd = random.Random('{0}|{1}|{2}|{3}'.format(seed, kind, size, i))
+                    writePDF(fullpath, documentPages(kind, page_count, rnd))
+
+    return corpus
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate the synthetic benchmark corpus.')
+    parser.add_argument('folder', help='target folder')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='seed of the random number generator')
+    args = parser.parse_args()
+    for kind, files in makeCorpus(args.folder, args.seed).items():
+        print('{0}: {1} files'.format(kind, len(files)))
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""An in-memory stand-in for a MongoDB collection.
+
+Only the part of the pymongo collection interface used by GLKminer is
+provided, so benchmarks run without a database server and measure the
+work of GLKminer rather than that of the database. Filters support
+equality and the $regex, $options, $in, $ne, $exists, $gt, $gte, $lt and
+$lte operators on top-level fields; $in also matches arrays holding one
+of its values.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import copy, re
+from collections import namedtuple
+
+# Third party modules and packages
+from bson.objectid import ObjectId
+
+# Constants and other objects
+InsertOneResult = namedtuple('InsertOneResult', ['inserted_id', 'acknowledged'])
+BulkWriteResult = namedtuple('BulkWriteResult', ['upserted_ids', 'modified_count', 'acknowledged'])
+DeleteResult = namedtuple('DeleteResult', ['deleted_count', 'acknowledged'])
+UpdateResult = namedtuple('UpdateResult', ['matched_count', 'modified_count', 'upserted_id', 'acknowledged'])
+
+
+# Classes
+class MemoryCursor:
+    """A cursor over the documents matching a filter."""
+
+    def __init__(self, documents, projection=None):
+        self.documents = documents
+        self.projection = projection
+        self._limit = 0
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def sort(self, key, direction=1):
+        self.documents = sorted(self.documents, key=lambda doc: doc.get(key), reverse=direction < 0)
+        return self
+
+    def count(self, with_limit_and_skip=False):
+        return min(len(self.documents), self._limit) if self._limit else len(self.documents)
+
+    def __iter__(self):
+        documents = self.documents[:self._limit] if self._limit else self.documents
+        for doc in documents:
+            if self.projection:
+                fields = {key for key, value in self.projection.items() if value}
+                yield {key: value for key, value in doc.items() if key in fields or key == '_id'}
+            else:
+                yield doc
+
+
+class MemoryDatabase:
+    """A database holding in-memory collections."""
+
+    def __init__(self, name='bench'):
+        self.name = name
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = MemoryCollection(name, self)
+        return self.collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+
+class MemoryCollection:
+    """An in-memory collection of documents."""
+
+    def __init__(self, name='coll', database=None):
+        self.name = name
+        self.database = database if database is not None else MemoryDatabase()
+        self.full_name = '{0}.{1}'.format(self.database.name, name)
+        self.documents = []
+        self.subcollections = {}
+
+    def __getitem__(self, name):
+        if name not in self.subcollections:
+            self.subcollections[name] = MemoryCollection(self.name + '.' + name, self.database)
+        return self.subcollections[name]
+
+    @staticmethod
+    def _matches(doc, filter):
+        for key, condition in (filter or {}).items():
+            value = doc.get(key)
+            if isinstance(condition, dict) and any(k.startswith('$') for k in condition):
+                for op, operand in condition.items():
+                    if op == '$regex':
+                        flags = re.IGNORECASE if 'i' in condition.get('$options', '') else 0
+                        if not isinstance(value, str) or not re.search(operand, value, flags):
+                            return False
+                    elif op == '$in' and not (any(v in operand for v in value) if isinstance(value, list) else value in operand):
+                        return False
+                    elif op == '$ne' and value == operand:
+                        return False
+                    elif op == '$exists' and (key in doc) != bool(operand):
+                        return False
+                    elif op in ('$gt', '$gte', '$lt', '$lte'):
+                        if value is None:
+                            return False
+                        if ((op == '$gt' and not value > operand) or (op == '$gte' and not value >= operand)
+                                or (op == '$lt' and not value < operand) or (op == '$lte' and not value <= operand)):
+                            return False
+            elif value != condition:
+                return False
+        return True
+
+    def find(self, filter=None, projection=None):
+        return MemoryCursor([doc for doc in self.documents if self._matches(doc, filter)], projection)
+
+    def find_one(self, filter=None, projection=None):
+        return next(iter(self.find(filter, projection).limit(1)), None)
+
+    def count_documents(self, filter):
+        return sum(1 for doc in self.documents if self._matches(doc, filter))
+
+    def insert_one(self, document):
+        document.setdefault('_id', ObjectId())
+        self.documents.append(copy.copy(document))
+        return InsertOneResult(document['_id'], True)
+
+    def insert_many(self, documents, ordered=True):
+        for document in documents:
+            self.insert_one(document)
+
+    def update_one(self, filter, update, upsert=False):
+        # Only the $set, $unset, $inc and $setOnInsert operators are supported
+        document = self.find_one(filter)
+        if document is None:
+            if not upsert:
+                return UpdateResult(0, 0, None, True)
+            document = dict(filter)
+            document.update(update.get('$setOnInsert', {}))
+            document.update(update.get('$set', {}))
+            document.update(update.get('$inc', {}))
+            return UpdateResult(0, 0, self.insert_one(document).inserted_id, True)
+
+        document.update(update.get('$set', {}))
+        for key in update.get('$unset', {}):
+            document.pop(key, None)
+        for key, value in update.get('$inc', {}).items():
+            document[key] = document.get(key, 0) + value
+        return UpdateResult(1, 1, None, True)
+
+    def update_many(self, filter, update):
+        matched = [doc['_id'] for doc in self.find(filter)]
+        for document_id in matched:
+            self.update_one({'_id': document_id}, update)
+        return UpdateResult(len(matched), len(matched), None, True)
+
+    def bulk_write(self, operations, ordered=True):
+        # Only UpdateOne operations are supported. The attributes of
+        # pymongo's UpdateOne are private, hence the access.
+        upserted = {}
+        modified = 0
+        for index, op in enumerate(operations):
+            result = self.update_one(op._filter, op._doc, op._upsert)
+            if result.upserted_id is not None:
+                upserted[index] = result.upserted_id
+            modified+= result.modified_count
+        return BulkWriteResult(upserted, modified, True)
+
+    def replace_one(self, filter, replacement, upsert=False):
+        document = self.find_one(filter)
+        if document is not None:
+            self.documents.remove(document)
+        if document is not None or upsert:
+            self.insert_one(dict(replacement))
+
+    def delete_one(self, filter):
+        document = self.find_one(filter)
+        if document is not None:
+            self.documents.remove(document)
+        return DeleteResult(int(document is not None), True)
+
+    def delete_many(self, filter):
+        count = len(self.documents)
+        self.documents = [doc for doc in self.documents if not self._matches(doc, filter)]
+        return DeleteResult(count - len(self.documents), True)
+
+    def distinct(self, key, filter=None):
+        values = []
+        for doc in self.find(filter):
+            if key in doc and doc[key] not in values:
+                values.append(doc[key])
+        return values
+
+    def create_index(self, keys, **kwargs):
+        return '_'.join('{0}_{1}'.format(key, direction) for key, direction in keys)
+
+    def drop(self):
+        self.documents = []
+        self.subcollections = {}
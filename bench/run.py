@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""Run the GLKminer benchmarks.
+
+The benchmarks run offline against the synthetic corpus of bench.corpus and
+the in-memory database of bench.memdb:
+    import_text, import_scanned, import_mixed: end-to-end import of each
+        kind of document with the default ImportOptions.
+    import_termcounts: import of the text documents with term counts and
+        the corpus view, for comparison with import_text.
+    import_nearduplicates: import of the text documents with near-duplicate
+        detection, for comparison with import_text.
+    ocr: Tesseract on scanned page images, without rendering.
+    stripchars: character stripping as done before tokenization.
+    frequencies: tokenization and frequency collection over the imported
+        text documents, without the stored term counts.
+    wordcloud: rendering a word cloud from the collected frequencies.
+
+Benchmarks needing Tesseract are skipped if it cannot be found. Every
+benchmark is repeated and the median time is reported. The results are
+written to a JSON file and compared against a baseline; a benchmark slower
+than the baseline by more than the threshold is flagged as a regression and
+the exit status is 1.
+
+Usage:
+    python -m bench.run [--repeat N] [--output FILE] [--baseline FILE]
+                        [--save-baseline] [--threshold 0.15]
+                        [--only NAME ...] [--tesseract PATH]
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import argparse, json, os, platform, random, shutil, statistics, subprocess, sys, tempfile, time
+
+# Run from the repository root, as GLKminer itself does
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Third party modules and packages
+from PIL import Image, ImageDraw
+
+# Local modules and packages
+from bench.corpus import makeCorpus, pageLines, scanPage
+from bench.memdb import MemoryCollection
+from lib.bagofwords import collectFrequencies
+from lib.import_conf import DEFAULT_IMPORTOPTIONS
+from lib.importing import importFiles
+from lib.ocr_helper import loadPytesseract, ocrImage, setTesseractCmd, DEFAULT_OCR_LANGUAGE
+from lib.txt_helper import normalizeTexts
+from lib.wordcloud_helper import createWordcloud
+
+# Constants and other objects
+BENCH_FOLDER = os.path.join(ROOT, 'bench')
+DEFAULT_BASELINE = os.path.join(BENCH_FOLDER, 'baseline.json')
+DEFAULT_CORPUS = os.path.join(BENCH_FOLDER, 'corpus')
+DEFAULT_OUTPUT = os.path.join(BENCH_FOLDER, 'results.json')
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.15
+OCR_PAGES = 4
+STRIPCHARS_ROUNDS = 20
+BENCHMARKS = ('import_text', 'import_scanned', 'import_mixed', 'import_termcounts', 'import_nearduplicates', 'ocr', 'stripchars', 'frequencies', 'wordcloud')
+
+# Optional import features, measured by importing the text documents with
+# one of them turned on
+FEATURE_BENCHMARKS = {
+        'import_termcounts': {'termCounts': True},
+        'import_nearduplicates': {'nearDuplicates': True}
+        }
+
+
+# Function definitions
+def tesseractAvailable():
+    """Tell whether the Tesseract binary can be run."""
+    try:
+        loadPytesseract().get_tesseract_version()
+    except Exception:
+        return False
+    return True
+
+
+def countPDFPages(files):
+    """Count the pages of the corpus files without parsing them with
+    GLKminer, from the /Count entry written by bench.corpus."""
+    pages = 0
+    for f in files:
+        with open(f, 'rb') as fr:
+            data = fr.read()
+        pages+= int(data[data.rindex(b'/Count ') + 7:].split()[0])
+    return pages
+
+
+def timeRuns(function, repeat):
+    """Run a function repeatedly.
+
+    Args:
+        function (callable): called without arguments before every run to
+            set up, returns the callable to time.
+        repeat (int): number of runs.
+
+    Returns:
+        list (float): the time of every run in seconds.
+    """
+
+    times = []
+    for i in range(repeat):
+        run = function()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def runBenchmarks(corpus, workdir, repeat=DEFAULT_REPEAT, only=None):
+    """Run the benchmarks.
+
+    Args:
+        corpus (dict): kinds of documents and lists of their files.
+        workdir (str): folder for temporary files.
+        repeat (int, optional): number of runs per benchmark.
+        only (list, optional): names of the benchmarks to run. All if None.
+
+    Returns:
+        dict: benchmark names and their results.
+    """
+
+    results = {}
+    selected = set(only or BENCHMARKS)
+    ocr_ok = tesseractAvailable()
+    options = DEFAULT_IMPORTOPTIONS._replace(imageFolder=os.path.join(workdir, 'img'))
+    state = {}
+
+    def _record(name, times, work=None, unit=None):
+        median = statistics.median(times)
+        results[name] = {'median': median, 'min': min(times), 'runs': times}
+        if work:
+            results[name]['throughput'] = work / median if median else None
+            results[name]['unit'] = unit
+        print('{0:<16} {1:>9.3f} s{2}'.format(name, median,
+              '  ({0:.1f} {1})'.format(work / median, unit) if work and median else ''))
+
+    def _skip(name, reason):
+        results[name] = {'skipped': reason}
+        print('{0:<16} skipped: {1}'.format(name, reason))
+
+    # End-to-end import, into a fresh collection for every run
+    for kind in ('text', 'scanned', 'mixed'):
+        name = 'import_' + kind
+        if name not in selected and not (kind == 'text' and selected & {'frequencies', 'wordcloud'}):
+            continue
+        if kind != 'text' and not ocr_ok:
+            _skip(name, 'Tesseract not available')
+            continue
+
+        def _setup(kind=kind):
+            state[kind] = MemoryCollection('import_' + kind)
+            return lambda: importFiles(corpus[kind], state[kind], options)
+        times = timeRuns(_setup, repeat if name in selected else 1)
+        if name in selected:
+            _record(name, times, countPDFPages(corpus[kind]), 'pages/s')
+
+    # Cost of optional import features, against import_text
+    for name, changes in FEATURE_BENCHMARKS.items():
+        if name in selected:
+            def _setup(name=name, changes=changes):
+                state[name] = MemoryCollection(name)
+                return lambda: importFiles(corpus['text'], state[name], options._replace(**changes))
+            _record(name, timeRuns(_setup, repeat), countPDFPages(corpus['text']), 'pages/s')
+
+    # OCR of page images, without rendering
+    if 'ocr' in selected:
+        if ocr_ok:
+            rnd = random.Random(OCR_PAGES)
+            images = [scanPage(pageLines(rnd), rnd) for i in range(OCR_PAGES)]
+            _record('ocr', timeRuns(lambda: lambda: [ocrImage(image, DEFAULT_OCR_LANGUAGE) for image in images], repeat),
+                    OCR_PAGES, 'pages/s')
+        else:
+            _skip('ocr', 'Tesseract not available')
+
+    # Character stripping and frequency collection over the text documents
+    texts = [doc.get('content', '') for doc in state['text'].find()] if 'text' in state else []
+    if 'stripchars' in selected and texts:
+        def _strip():
+            for i in range(STRIPCHARS_ROUNDS):
+                for text in normalizeTexts(texts):
+                    pass
+        _record('stripchars', timeRuns(lambda: _strip, repeat),
+                STRIPCHARS_ROUNDS * sum(len(text) for text in texts) / 1e6, 'Mchars/s')
+
+    freqs = None
+    if selected & {'frequencies', 'wordcloud'} and 'text' in state:
+        def _frequencies():
+            state['freqs'] = collectFrequencies(state['text'], 'content', options=options)
+        times = timeRuns(lambda: _frequencies, repeat if 'frequencies' in selected else 1)
+        freqs = state['freqs']
+        if 'frequencies' in selected:
+            _record('frequencies', times, len(texts), 'docs/s')
+
+    # Word cloud from the frequencies
+    if 'wordcloud' in selected and freqs:
+        maskfile = os.path.join(workdir, 'mask.png')
+        mask = Image.new('RGBA', (400, 300), (255, 255, 255, 0))
+        ImageDraw.Draw(mask).ellipse((10, 10, 390, 290), fill=(0, 0, 0, 255))
+        mask.save(maskfile)
+        _record('wordcloud', timeRuns(lambda: lambda: createWordcloud(freqs, os.path.join(workdir, 'cloud.png'), maskfile), repeat))
+
+    return results
+
+
+def environmentInfo():
+    """Describe the machine and the code version the benchmarks ran on."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+
+    return {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count()
+            }
+
+
+def compareBaseline(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Flag benchmarks which got slower than in the baseline.
+
+    Args:
+        results (dict): the current results.
+        baseline (dict): the baseline results.
+        threshold (float, optional): tolerated slowdown as a fraction.
+
+    Returns:
+        dict: names of the regressed benchmarks and their slowdown as a
+            fraction of the baseline time.
+    """
+
+    regressions = {}
+    for name, result in results.items():
+        base = baseline.get(name, {})
+        if 'median' in result and base.get('median'):
+            change = result['median'] / base['median'] - 1
+            result['baseline'] = base['median']
+            result['change'] = change
+            if change > threshold:
+                regressions[name] = change
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the GLKminer benchmarks.')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help='corpus folder, generated if missing')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='runs per benchmark')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='results file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='tolerated slowdown, e.g. 0.15 for 15%%')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help='benchmarks to run')
+    parser.add_argument('--tesseract', help='path to the Tesseract binary')
+    args = parser.parse_args(argv)
+
+    if args.tesseract:
+        setTesseractCmd(args.tesseract)
+
+    os.chdir(ROOT)
+    print('Preparing corpus in {0}'.format(args.corpus))
+    corpus = makeCorpus(args.corpus)
+
+    workdir = tempfile.mkdtemp(prefix='glkbench_')
+    try:
+        results = runBenchmarks(corpus, workdir, args.repeat, args.only)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    regressions = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as fr:
+            regressions = compareBaseline(results, json.load(fr)['results'], args.threshold)
+        for name, change in sorted(regressions.items()):
+            print('REGRESSION {0}: {1:+.1%} against baseline'.format(name, change))
+
+    report = {'environment': environmentInfo(), 'results': results, 'regressions': regressions}
+    with open(args.baseline if args.save_baseline else args.output, 'w', encoding='utf-8') as fw:
+        json.dump(report, fw, indent=2)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
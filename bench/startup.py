@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Measure the start-up time of GLKminer modules.
+
+Every module is imported in a fresh interpreter, as happens on start-up and
+in every spawned worker process. The import is timed by the interpreter
+itself with -X importtime, and the slowest modules pulled in along the way
+are listed. The time of an interpreter importing nothing is given for
+reference.
+
+Usage:
+    python -m bench.startup [--repeat N] [--top N] [--output FILE] [module ...]
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import argparse, json, os, statistics, subprocess, sys
+
+# Constants and other objects
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ('lib.constants', 'lib.txt_helper', 'lib.db_helper', 'lib.bagofwords', 'lib.wordcloud_helper',
+                   'lib.ocr_helper', 'lib.pdfutil', 'lib.importing', 'lib.pipeline', 'GLKminer')
+DEFAULT_REPEAT = 5
+DEFAULT_TOP = 5
+
+
+# Function definitions
+def importTimes(module):
+    """Import a module in a fresh interpreter and collect the import times.
+
+    Args:
+        module (str): the module to import, or None to import nothing.
+
+    Returns:
+        tuple: the total import time of the module in seconds, and a dict
+            of all imported modules and their own import time in seconds.
+    """
+
+    code = 'import {0}'.format(module) if module else 'pass'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    total, modules = 0.0, {}
+    for line in result.stderr.splitlines():
+        # Lines read "import time: <self us> | <cumulative us> | <name>"
+        fields = line.split('|')
+        if not line.startswith('import time:') or not fields[0].split(':')[1].strip().isdigit():
+            continue
+        # Nested imports are indented below the one that caused them
+        name = fields[2][1:].rstrip()
+        modules[name.strip()] = int(fields[0].split(':')[1]) / 1e6
+        if not name.startswith(' '):
+            total+= int(fields[1]) / 1e6
+
+    return total, modules
+
+
+def measureStartup(modules, repeat=DEFAULT_REPEAT, top=DEFAULT_TOP):
+    """Measure the import time of modules.
+
+    Args:
+        modules (list): names of the modules.
+        repeat (int, optional): number of imports per module.
+        top (int, optional): number of slowest dependencies to report.
+
+    Returns:
+        dict: module names and their results.
+    """
+
+    results = {}
+    for module in modules:
+        totals, slowest = [], {}
+        try:
+            for i in range(repeat):
+                total, times = importTimes(module)
+                totals.append(total)
+                for name, seconds in times.items():
+                    slowest.setdefault(name, []).append(seconds)
+        except RuntimeError as e:
+            results[module] = {'error': str(e)}
+            print('{0:<22} failed: {1}'.format(module, e))
+            continue
+
+        slowest = sorted(((statistics.median(times), name) for name, times in slowest.items()), reverse=True)[:top]
+        results[module] = {
+                'median': statistics.median(totals),
+                'min': min(totals),
+                'slowest': [[name, seconds] for seconds, name in slowest]
+                }
+        print('{0:<22} {1:>8.1f} ms   {2}'.format(module, results[module]['median'] * 1000,
+              ', '.join('{0} {1:.1f}'.format(name, seconds * 1000) for seconds, name in slowest)))
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the start-up time of GLKminer modules.')
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES, help='modules to import')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='imports per module')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='slowest dependencies to list')
+    parser.add_argument('--output', help='write the results to a JSON file')
+    args = parser.parse_args(argv)
+
+    # Python itself imports a few modules before the first line of code runs
+    times = importTimes(None)[1]
+    print('{0:<22} {1:>8.1f} ms'.format('(interpreter)', sum(times.values()) * 1000))
+    results = measureStartup(args.modules, args.repeat, args.top)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fw:
+            json.dump(results, fw, indent=2)
+
+    return 1 if any('error' in result for result in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
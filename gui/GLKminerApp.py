@@ -13,13 +13,12 @@ import lib.db_conf as dbc
 from lib.db_conf import dbconfig
 
 # Third party modules and packages
-if dbc.DB_USE_BACKEND == dbc.DB_BACKEND_MONGO:
-    from pymongo import MongoClient
-elif dbc.DB_USE_BACKEND == dbc.DB_BACKEND_SQLITE:
+if dbc.DB_USE_BACKEND == dbc.DB_BACKEND_SQLITE:
     import sqlite3    # Currently nonfunctional
 
 # Local modules and packages
 from lib.bagofwords import collectFrequencies
+from lib.db_helper import connectClient
 from lib.importing import importFolder
 from lib.import_conf import DEFAULT_IMPORTOPTIONS, DEFAULT_LOGNAME
 from lib.wordcloud_helper import createWordcloud
@@ -48,7 +47,7 @@ class MainScreen(GridLayout):
         self.add_widget(self.button_createwordcloud)
         
         # Establish connection to database
-        self.client = MongoClient('mongodb://{0}:{1}@{2}:{3}/{4}'.format(dbconfig.username, dbconfig.password, dbconfig.host, dbconfig.port, dbconfig.name))
+        self.client = connectClient(dbconfig)
 
 
     def doDBPopulate(self, instance):
@@ -95,7 +94,8 @@ class MainScreen(GridLayout):
             freqs = collectFrequencies(
                     coll=db.GLKM_innovativelehrprojekte,
                     content_field='content',
-                    filter={'content_source': {'$regex': 'text', '$options': 'i'}}
+                    filter={'content_source': {'$regex': 'text', '$options': 'i'}},
+                    options=DEFAULT_IMPORTOPTIONS._replace(countProcesses=None, termCounts=True)
                     )
             
             Logger.info('Assembling word cloud. This may take even longer.')
@@ -5,55 +5,223 @@
 """
 
 # Python core modulees and packages
-import os, re
-
-# Third party modulees and packages
-import nltk
+import logging, multiprocessing, os
 
 # Local modulees and packages
-from lib.constants import DEFAULT_COMMENTTOKEN
-from lib.import_conf import DEFAULT_IMPORTOPTIONS
-from lib.txt_helper import stripChars
+from lib.corpus_view import viewFrequencies
+from lib.db_helper import combineFilter, connectClient, iterDocumentText, rebuildCorpusView, rebuildTermCounts, DB_TERMCOUNTS_FIELD
+from lib.import_conf import DEFAULT_IMPORTOPTIONS, DEFAULT_LOGNAME
+from lib.near_duplicates import DUPLICATE_FIELD
+from lib.txt_helper import countWords, loadStopwords, DEFAULT_STOPWORDS
+
+# Constants and other objects
+DEFAULT_PARTITIONS_PER_PROCESS = 4
+logger = logging.getLogger(DEFAULT_LOGNAME)
+
+# State of a counting worker process, populated by _initCountWorker()
+_worker = {}
+
 
 # Function definitions
-def collectFrequencies(coll, content_field, filter='', options=DEFAULT_IMPORTOPTIONS):
+def _addFrequencies(freqs, coll, filter, content_field, stopwords):
+    """Add the word frequencies of the documents matching a filter to a
+    dict, each document contributing a cumulative frequency of 1.0."""
+    for doc in coll.find(filter):
+        # Documents stored page by page are counted one page at a time
+        counts = countWords(iterDocumentText(doc, coll, content_field), stopwords)
+
+        # Normalize frequencies so that each document only contributes a
+        # cumulative frequency of 1.0.
+        total = sum(counts.values())
+        for word, count in counts.items():
+            if word in freqs:
+                freqs[word]+= count / total
+            else:
+                freqs[word] = count / total
+
+    return freqs
+
+
+def partitionFilters(coll, filter, partitions):
+    """Split the documents matching a filter into ranges of _id with about
+    the same number of documents each.
+
+    Args:
+        coll: a database collection object.
+        filter (dict): filter for the selected documents.
+        partitions (int): the number of partitions wanted.
+
+    Returns:
+        list: one filter per partition, fewer than asked for if there are
+            fewer documents.
+    """
+
+    filter = filter or {}
+    ids = [doc['_id'] for doc in coll.find(filter, {'_id': True}).sort('_id', 1)]
+    if not ids:
+        return []
+
+    partitions = min(partitions, len(ids))
+    bounds = [ids[len(ids) * i // partitions] for i in range(partitions)]
+    ranges = [{'$gte': low, '$lt': high} for low, high in zip(bounds, bounds[1:])]
+    ranges.append({'$gte': bounds[-1]})
+
+    return [combineFilter(filter, '_id', idrange) for idrange in ranges]
+
+
+def _initCountWorker(database_name, collection_name):
+    """Set up a counting worker process with a database handle of its own.
+
+    Args:
+        database_name (str): name of the database to connect to.
+        collection_name (str): name of the collection to count in.
+
+    Returns:
+        None
+    """
+
+    _worker['client'] = connectClient()
+    _worker['coll'] = _worker['client'][database_name][collection_name]
+
+
+def _countPartition(args):
+    """Collect the word frequencies of one partition in a counting worker."""
+    filter, content_field, stopwords = args
+    return _addFrequencies({}, _worker['coll'], filter, content_field, stopwords)
+
+
+def _mergeFrequencies(freqs, partial):
+    """Add the word frequencies of a part of the documents to a dict."""
+    for word, freq in partial.items():
+        if word in freqs:
+            freqs[word]+= freq
+        else:
+            freqs[word] = freq
+
+    return freqs
+
+
+def aggregateFrequencies(coll, filter=None, stopwords=frozenset()):
+    """Collect word frequencies from the term counts stored with documents,
+    see db_helper.storeDocument(). The counts are summed up by the database
+    server, so no text is read. Documents without term counts are left out.
+
+    Args:
+        coll: a database collection object.
+        filter (dict, optional): filter for the selected documents.
+        stopwords (set, optional): casefolded words to leave out.
+
+    Returns:
+        dict: Words with their relative frequencies, each document
+            contributing a cumulative frequency of 1.0.
+    """
+
+    pipeline = [
+            {'$match': combineFilter(filter, DB_TERMCOUNTS_FIELD, {'$exists': True})},
+            {'$project': {'terms': {'$filter': {
+                    'input': {'$objectToArray': '$' + DB_TERMCOUNTS_FIELD},
+                    'as': 'term',
+                    'cond': {'$not': {'$in': ['$$term.k', sorted(stopwords)]}}}}}},
+            {'$project': {'terms': True, 'total': {'$sum': '$terms.v'}}},
+            {'$match': {'total': {'$gt': 0}}},
+            {'$unwind': '$terms'},
+            {'$group': {'_id': '$terms.k', 'freq': {'$sum': {'$divide': ['$terms.v', '$total']}}}}
+            ]
+
+    return {item['_id']: item['freq'] for item in coll.aggregate(pipeline, allowDiskUse=True)}
+
+
+def collectFrequencies(coll, content_field, filter='', options=DEFAULT_IMPORTOPTIONS, stopwords=DEFAULT_STOPWORDS):
     """Collect word frequencies from a document collection.
 
+    With options.termCounts set, frequencies are read from the corpus view
+    of the collection if it can answer the filter and all selected
+    documents have term counts, see lib.corpus_view. Otherwise, the term
+    counts stored with the documents are summed up by the database, see
+    aggregateFrequencies(). Only documents imported without term counts are
+    read and counted; these can be backfilled with
+    db_helper.rebuildTermCounts().
+
+    Documents stored page by page are read one page at a time, so the text
+    of a whole document is never held in memory.
+
+    With options.countProcesses other than 1, the documents are split into
+    ranges of _id, see partitionFilters(), which are counted by a pool of
+    worker processes. The frequencies of the partitions are merged in the
+    order of their ranges.
+
+    With options.excludeNearDuplicates set, documents marked as
+    near-duplicates of earlier ones on import are left out, see
+    lib.near_duplicates.
+
     Args:
         coll: a database collection object.
         content_field (str): document field from which to extract the text.
         filter (str): A filter for the selected documents.
         options (ImportOptions): tuple holding various settings.
+        stopwords (str|list, optional): names or paths of the stopword
+            lists, see loadStopwords().
 
     Returns:
         dict: Words with their relative frequencies (0...1).
     """
 
-    # Read stopwords from file
-    comment_re=re.compile(r'\s*[{0}]'.format(DEFAULT_COMMENTTOKEN))
-    stopwords = {line.strip() for line in list(open(os.path.join('.','lib','stopwords_german.txt'), encoding='utf-8')) if not comment_re.match(line)}
+    if options.excludeNearDuplicates:
+        filter = combineFilter(filter, DUPLICATE_FIELD, {'$exists': False})
+
+    # The view only holds documents stored with term counts
+    if options.termCounts and not coll.count_documents(combineFilter(filter, DB_TERMCOUNTS_FIELD, {'$exists': False}), limit=1):
+        freqs = viewFrequencies(coll, filter, stopwords)
+        if freqs is not None:
+            return freqs
 
-    # Retrieve and count
+    stopwords = loadStopwords(stopwords)
     freqs = dict()
-    for doc in coll.find(filter):
-        # Get a word list from the content
-        text = stripChars(doc[content_field], replacewith=' ')
-        text = stripChars(text, stripchars='!„"#$%&\'()*+,-–./:;<=>?@[\\]^_`{|}~1234567890')
-        words = nltk.word_tokenize(text)
-
-        # Sanitize word list
-        wordmap = map(lambda word: word.casefold() if ((word.casefold() not in stopwords) and (len(word) > 1)) else None, words)
-        words = [word for word in wordmap if word is not None]
-        
-        # Update frequencies
-        fdist = nltk.FreqDist(words)
-        
-        # Normalize frequencies so that each document only contributes a
-        # cumulative frequency of 1.0.
-        for word in fdist:
-            if word in freqs:
-                freqs[word]+= fdist.freq(word)
-            else:
-                freqs[word] = fdist.freq(word)
+    if options.termCounts:
+        freqs = aggregateFrequencies(coll, filter, stopwords)
+        filter = combineFilter(filter, DB_TERMCOUNTS_FIELD, {'$exists': False})
+
+    if options.countProcesses == 1:
+        return _addFrequencies(freqs, coll, filter, content_field, stopwords)
+
+    processes = options.countProcesses or os.cpu_count()
+    filters = partitionFilters(coll, filter, processes * DEFAULT_PARTITIONS_PER_PROCESS)
+    logger.info('Counting words of {0} partitions in {1} processes.'.format(len(filters), processes))
+
+    # Retrieve and count, then merge the partitions
+    with multiprocessing.Pool(
+            processes=min(processes, max(len(filters), 1)),
+            initializer=_initCountWorker,
+            initargs=(coll.database.name, coll.name)) as pool:
+        for partition in pool.imap(_countPartition, [(f, content_field, stopwords) for f in filters]):
+            _mergeFrequencies(freqs, partition)
+
+    return freqs
+
+
+if __name__ == '__main__':
+    import argparse
+    from lib.db_conf import dbconfig
+
+    parser = argparse.ArgumentParser(description='Maintain the word counts of a document collection.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    rebuild = commands.add_parser('rebuild', help='store the term counts of documents imported without them')
+    rebuild.add_argument('collection', help='collection of the documents')
+    rebuild.add_argument('--database', default=dbconfig.name, help='database of the collection')
+    rebuild.add_argument('--content-field', default='content', help='document field holding the text')
+    rebuild.add_argument('--overwrite', action='store_true', help='recount documents which have term counts')
+    view = commands.add_parser('view', help='build the corpus view from the term counts of the documents')
+    view.add_argument('collection', help='collection of the documents')
+    view.add_argument('--database', default=dbconfig.name, help='database of the collection')
+    view.add_argument('--stopwords', nargs='+', default=DEFAULT_STOPWORDS, help='names or paths of the stopword lists')
+    args = parser.parse_args()
 
-    return freqs
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO)
+    client = connectClient()
+    coll = client[args.database][args.collection]
+    if args.command == 'rebuild':
+        updated = rebuildTermCounts(coll, args.content_field, overwrite=args.overwrite)
+        print('Stored term counts of {0} documents.'.format(updated))
+    elif args.command == 'view':
+        print('Built corpus view of {0} documents.'.format(rebuildCorpusView(coll, args.stopwords)))
+    client.close()
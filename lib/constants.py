@@ -4,9 +4,6 @@
 @author: Malte Persike
 """
 
-# Python core modules and packages
-import unicodedata
-
 # Enable/disable logging to console
 DEFAULT_LOGTOCONSOLE = True
 DEFAULT_COMMENTTOKEN = ';'
@@ -14,5 +11,7 @@ DEFAULT_COMMENTTOKEN = ';'
 # File types for importing
 FILEEXT_PDF = '.pdf'
 
-# Non-printable characters
-CONTROL_CHARS_UNICODE = ''.join(c for c in (chr(i) for i in range(0x110000)) if unicodedata.category(c) in ['Cc', 'C'])
+# Non-printable characters. These are the characters of Unicode category Cc,
+# C0 and C1 controls along with DEL, which by the Unicode stability policy
+# never change. Listing them spares a scan of all code points on import.
+CONTROL_CHARS_UNICODE = ''.join(map(chr, [*range(0x00, 0x20), *range(0x7f, 0xa0)]))
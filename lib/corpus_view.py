@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""Materialized word frequencies of a document collection.
+
+The corpus view holds, for every content source and word, the sum of the
+relative frequencies of the word over all documents from that source. Each
+document contributes a cumulative frequency of 1.0, as in
+bagofwords.collectFrequencies(). The view is kept in two sub-collections of
+the document collection:
+    corpus_freqs: one record per source and word, with the summed frequency
+        and the number of documents containing the word.
+    corpus_state: the stopword lists the view was built with.
+
+Whenever a document with term counts is stored or deleted, its frequencies
+are added to or subtracted from the view with $inc. Reading the frequencies
+of some sources then takes a single indexed query, however many documents
+there are.
+
+A collection only has a view once it was built by db_helper.rebuildCorpusView(),
+or created empty by initCorpusView() before the first import. Until then,
+and after the stopword lists changed, viewFrequencies() returns None and
+frequencies have to be aggregated from the documents.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import functools, hashlib, logging
+from datetime import datetime
+
+# Local modules and packages
+import lib.db_conf as dbc
+from lib.import_conf import DEFAULT_LOGNAME
+from lib.txt_helper import loadStopwords, DEFAULT_STOPWORDS
+
+# Third party modules and packages
+if dbc.DB_USE_BACKEND == dbc.DB_BACKEND_MONGO:
+    from pymongo import ASCENDING, UpdateOne
+    from pymongo.errors import BulkWriteError
+
+# Constants and other objects
+DEFAULT_VIEW_BATCHSIZE = 1000
+VIEW_DUPLICATE_KEY_ERROR = 11000
+VIEW_FREQS_COLLECTION = 'corpus_freqs'
+VIEW_SOURCE_FIELD = 'content_source'
+VIEW_STATE_COLLECTION = 'corpus_state'
+VIEW_STATE_ID = 'state'
+logger = logging.getLogger(DEFAULT_LOGNAME)
+
+
+# Function definitions
+def freqsCollection(db):
+    """Return the collection holding the word records of the corpus view of
+    a document collection."""
+    return db[VIEW_FREQS_COLLECTION]
+
+
+def stateCollection(db):
+    """Return the collection holding the state of the corpus view of a
+    document collection."""
+    return db[VIEW_STATE_COLLECTION]
+
+
+@functools.lru_cache(maxsize=8)
+def stopwordsKey(stopwords):
+    """Identify a set of stopwords by a hash of its words.
+
+    Args:
+        stopwords (frozenset): the stopwords.
+
+    Returns:
+        str: the hash.
+    """
+
+    return hashlib.sha1('\n'.join(sorted(stopwords)).encode('utf-8')).hexdigest()
+
+
+def documentFrequencies(term_counts, stopwords=frozenset()):
+    """Turn the term counts of a document into relative frequencies.
+
+    Args:
+        term_counts (dict): words and their counts.
+        stopwords (set, optional): words to leave out.
+
+    Returns:
+        dict: words and their relative frequencies, adding up to 1.0, or
+            nothing if all words are stopwords.
+    """
+
+    counts = {word: count for word, count in term_counts.items() if word not in stopwords}
+    total = sum(counts.values())
+
+    return {word: count / total for word, count in counts.items()} if total else {}
+
+
+def _viewStopwords(db):
+    """Return the stopwords of the corpus view of a collection, or None if
+    there is no view or its stopword lists changed since it was built."""
+    state = stateCollection(db).find_one({'_id': VIEW_STATE_ID})
+    if state is None:
+        return None
+
+    stopwords = loadStopwords(state['stopwords'])
+    if stopwordsKey(stopwords) != state['stopwords_key']:
+        logger.warning('The stopword lists {0} changed since the corpus view of {1} was built. '
+                       'The view must be rebuilt.'.format(state['stopwords'], db.name))
+        return None
+
+    return stopwords
+
+
+def _writeState(db, lists):
+    """Record the stopword lists of the corpus view of a collection."""
+    if isinstance(lists, str):
+        lists = [lists]
+    freqsCollection(db).create_index([('source', ASCENDING), ('word', ASCENDING)], unique=True)
+    stateCollection(db).replace_one({'_id': VIEW_STATE_ID}, {
+            '_id': VIEW_STATE_ID,
+            'stopwords': list(lists),
+            'stopwords_key': stopwordsKey(loadStopwords(lists)),
+            'built_date': str(datetime.now())
+            }, upsert=True)
+
+
+def initCorpusView(db, stopwords=DEFAULT_STOPWORDS):
+    """Create an empty corpus view for a collection without documents, so
+    that it is kept up to date from the first document on.
+
+    Args:
+        db: a database collection object.
+        stopwords (str|list, optional): names or paths of the stopword lists
+            of the view, see txt_helper.loadStopwords().
+
+    Returns:
+        bool: True if a view was created.
+    """
+
+    if stateCollection(db).find_one({'_id': VIEW_STATE_ID}) is not None or db.find_one({}, {'_id': True}) is not None:
+        return False
+
+    _writeState(db, stopwords)
+    logger.info('Created corpus view of {0}.'.format(db.name))
+    return True
+
+
+def updateCorpusView(db, source, term_counts, sign=1):
+    """Add the frequencies of a document to the corpus view of its
+    collection, or subtract them with sign=-1. Nothing is done if the
+    collection has no current view.
+
+    Args:
+        db: a database collection object.
+        source (str): content source of the document.
+        term_counts (dict): words of the document and their counts.
+        sign (int, optional): 1 for a new document, -1 for a deleted one.
+
+    Returns:
+        bool: True if the view was updated.
+    """
+
+    stopwords = _viewStopwords(db)
+    if stopwords is None:
+        return False
+
+    operations = [UpdateOne({'source': source, 'word': word}, {'$inc': {'freq': sign * freq, 'docs': sign}}, upsert=True)
+                  for word, freq in documentFrequencies(term_counts, stopwords).items()]
+    if operations:
+        try:
+            freqsCollection(db).bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Concurrent upserts of a new word may clash on the unique
+            # index. The record exists by now, so the increment is repeated.
+            retry = [operations[item['index']] for item in e.details.get('writeErrors', [])
+                     if item.get('code') == VIEW_DUPLICATE_KEY_ERROR]
+            if len(retry) < len(e.details.get('writeErrors', [])):
+                raise
+            freqsCollection(db).bulk_write(retry, ordered=False)
+    if sign < 0:
+        freqsCollection(db).delete_many({'source': source, 'docs': {'$lte': 0}})
+
+    return True
+
+
+def buildCorpusView(db, documents, stopwords=DEFAULT_STOPWORDS, batchsize=DEFAULT_VIEW_BATCHSIZE):
+    """Replace the corpus view of a collection.
+
+    Args:
+        db: a database collection object.
+        documents (iterable): content source and term counts of every
+            document of the collection.
+        stopwords (str|list, optional): names or paths of the stopword lists
+            of the view, see txt_helper.loadStopwords().
+        batchsize (int, optional): number of records per insert.
+
+    Returns:
+        int: the number of documents in the view.
+    """
+
+    words = loadStopwords(stopwords)
+    sums = {}
+    count = 0
+    for source, term_counts in documents:
+        count+= 1
+        for word, freq in documentFrequencies(term_counts, words).items():
+            entry = sums.get((source, word))
+            if entry is None:
+                sums[(source, word)] = [freq, 1]
+            else:
+                entry[0]+= freq
+                entry[1]+= 1
+
+    freqsCollection(db).drop()
+    records = [{'source': source, 'word': word, 'freq': freq, 'docs': docs} for (source, word), (freq, docs) in sums.items()]
+    for start in range(0, len(records), batchsize):
+        freqsCollection(db).insert_many(records[start:start+batchsize], ordered=False)
+    _writeState(db, stopwords)
+    logger.info('Built corpus view of {0} from {1} documents.'.format(db.name, count))
+
+    return count
+
+
+def viewFrequencies(db, filter=None, stopwords=DEFAULT_STOPWORDS):
+    """Read word frequencies from the corpus view of a collection.
+
+    The view can only answer for filters on the content source, e.g.
+    {'content_source': {'$regex': 'text', '$options': 'i'}}, and for the
+    stopword lists it was built with. Documents stored without term counts
+    are not in the view, so it is only complete if all selected documents
+    have them, see bagofwords.collectFrequencies().
+
+    Args:
+        db: a database collection object.
+        filter (dict, optional): filter for the selected documents.
+        stopwords (str|list, optional): names or paths of the stopword
+            lists, see txt_helper.loadStopwords().
+
+    Returns:
+        dict: Words with their relative frequencies, each document
+            contributing a cumulative frequency of 1.0, or None if the view
+            cannot answer.
+    """
+
+    filter = filter or {}
+    if set(filter) - {VIEW_SOURCE_FIELD}:
+        return None
+    view_stopwords = _viewStopwords(db)
+    if view_stopwords is None or view_stopwords != loadStopwords(stopwords):
+        return None
+
+    # The condition on the sources is applied to the sources in the view
+    query = {}
+    if VIEW_SOURCE_FIELD in filter:
+        sources = freqsCollection(db).distinct('source', {'source': filter[VIEW_SOURCE_FIELD]})
+        query = {'source': {'$in': sources}}
+
+    freqs = {}
+    for record in freqsCollection(db).find(query, {'word': True, 'freq': True}):
+        word = record['word']
+        if word in freqs:
+            freqs[word]+= record['freq']
+        else:
+            freqs[word] = record['freq']
+
+    return freqs
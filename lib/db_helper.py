@@ -5,14 +5,289 @@
 """
 
 # Python core modules and packages
-import logging, os
+import logging, os, threading, time
 from datetime import datetime
 
+# Local modules and packages
+import lib.db_conf as dbc
+import lib.metrics as metrics
+from lib.corpus_view import buildCorpusView, updateCorpusView
+from lib.db_conf import dbconfig
+from lib.import_conf import STORAGE_PAGES
+from lib.near_duplicates import clearSignatures, indexSignature, removeSignature, textSignature, DEFAULT_DUPLICATE_THRESHOLD, DUPLICATE_FIELD, MINHASH_FIELD
+from lib.txt_helper import countWords, DEFAULT_STOPWORDS
+
+# Third party modules and packages
+if dbc.DB_USE_BACKEND == dbc.DB_BACKEND_MONGO:
+    from bson.objectid import ObjectId
+    from pymongo import ASCENDING, MongoClient, UpdateOne
+    from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
+
 # Constants and other objects
+DB_PAGES_COLLECTION = 'pages'
+DB_DUPLICATE_INDEX = 'duplicate_record'
+DB_DUPLICATE_FIELDS = ['content_name', 'filecreated_date']
+DB_DUPLICATE_KEY_ERROR = 11000
+DB_TERMCOUNTS_FIELD = 'term_counts'
+DEFAULT_WRITE_BATCHSIZE = 100
+DEFAULT_WRITE_INTERVAL = 5.0
 logger = logging.getLogger(__name__)
 
+# Page collections whose index was ensured by this process
+_indexed = set()
+
+# The buffered writers of this process, see getBufferedWriter()
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+# Classes
+class BufferedWriter:
+    """Collect documents and write them to a collection in unordered bulk
+    writes. The buffer is flushed when it holds batchsize documents, and at
+    the latest interval seconds after the first document was queued into
+    the empty buffer, by a timer thread.
+
+    Duplicates are detected by a unique index on the fields in
+    DB_DUPLICATE_FIELDS: every document is written as an upsert which only
+    inserts if no document with the same identifiers exists. Documents which
+    were duplicates or could not be written are reported individually in the
+    statistics, see stats(). If a bulk write fails as a whole, e.g. because
+    the server cannot be reached, all of its documents are reported as
+    failed.
+
+    Documents stored page by page have their page records written before
+    the document. If the document turns out to be a duplicate or cannot be
+    written, its page records are deleted again.
+
+    With the journal of an import job, a file is only marked as completed
+    once its document is written or found to be a duplicate, and forgotten
+    if it cannot be written, so an interrupted job never skips a file whose
+    document was still queued.
+    """
+
+    def __init__(self, db, batchsize=DEFAULT_WRITE_BATCHSIZE, interval=DEFAULT_WRITE_INTERVAL, journal=None):
+        self.db = db
+        self.journal = journal
+        self.batchsize = batchsize or DEFAULT_WRITE_BATCHSIZE
+        self.interval = interval if interval is not None else DEFAULT_WRITE_INTERVAL
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.operations = []
+        self.filenames = []
+        self.documents = []
+        self.last_flush = time.monotonic()
+        self.timer = None
+        self.inserted = 0
+        self.duplicates = []
+        self.failed = []
+        try:
+            db.create_index([(field, ASCENDING) for field in DB_DUPLICATE_FIELDS], unique=True, name=DB_DUPLICATE_INDEX)
+        except OperationFailure as e:
+            # Existing duplicates prevent a unique index. Upserts still avoid
+            # new duplicates, except for concurrent writes of the same file.
+            logger.warning('Cannot create unique index on {0}: {1}'.format(DB_DUPLICATE_FIELDS, e))
+
+
+    def add(self, document, filename):
+        """Queue a document for writing.
+
+        Args:
+            document (dict): the document.
+            filename (str): full path to the file the document was taken from.
+
+        Returns:
+            None
+        """
+
+        record = {key: document[key] for key in DB_DUPLICATE_FIELDS}
+        if metrics.metricsEnabled():
+            metrics.count('db_bytes', len((document.get('content') or '').encode('utf-8')))
+        with self.lock:
+            self.operations.append(UpdateOne(record, {'$setOnInsert': document}, upsert=True))
+            self.filenames.append(filename)
+            self.documents.append(document)
+            due = (len(self.operations) >= self.batchsize
+                   or time.monotonic() - self.last_flush >= self.interval)
+            if not due and self.timer is None:
+                # Flush a slow trickle of documents in time
+                self.timer = threading.Timer(self.interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if due:
+            self.flush()
+
+
+    def flush(self):
+        """Write all queued documents in one unordered bulk write.
+
+        Returns:
+            None
+        """
+
+        # Flushes by the timer and by other threads write one after the other
+        with self.flush_lock:
+            with self.lock:
+                operations, filenames, documents = self.operations, self.filenames, self.documents
+                self.operations, self.filenames, self.documents = [], [], []
+                self.last_flush = time.monotonic()
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+            if not operations:
+                return
+
+            # Write outside the lock, so other threads can go on queueing
+            errors = {}
+            with metrics.stage('db'):
+                try:
+                    upserted = self.db.bulk_write(operations, ordered=False).upserted_ids
+                except BulkWriteError as e:
+                    upserted = {item['index']: item['_id'] for item in e.details.get('upserted', [])}
+                    errors = {item['index']: item for item in e.details.get('writeErrors', [])}
+                except PyMongoError as e:
+                    # Nothing is known to be written. This may run in the
+                    # timer thread, so the error must not escape.
+                    logger.error('Bulk write of {0} documents failed: {1}'.format(len(operations), e))
+                    upserted = {}
+                    errors = {index: {'errmsg': str(e)} for index in range(len(operations))}
+            metrics.count('db_documents', len(upserted))
+
+            # Only inserted documents count towards the corpus view and are
+            # checked for near-duplicates
+            for index in upserted:
+                if DB_TERMCOUNTS_FIELD in documents[index]:
+                    updateCorpusView(self.db, documents[index]['content_source'], documents[index][DB_TERMCOUNTS_FIELD])
+                if MINHASH_FIELD in documents[index]:
+                    indexSignature(self.db, upserted[index], documents[index][MINHASH_FIELD])
+
+            # Page records of documents which were not inserted are orphans
+            try:
+                for index, document in enumerate(documents):
+                    if index not in upserted:
+                        deleteOrphanPages(self.db, document)
+            except PyMongoError as e:
+                logger.error('Cannot delete page records of unwritten documents: {0}'.format(e))
+
+            finished, forgotten = [], []
+            with self.lock:
+                for index, filename in enumerate(filenames):
+                    if index in upserted:
+                        self.inserted+= 1
+                        finished.append(filename)
+                        logger.info("Content for file {0} stored in database.".format(filename))
+                    elif index in errors and errors[index].get('code') != DB_DUPLICATE_KEY_ERROR:
+                        reason = errors[index].get('errmsg', '')
+                        self.failed.append((filename, reason))
+                        forgotten.append(filename)
+                        logger.error("Storing '{0}' failed: {1}".format(filename, reason))
+                    else:
+                        # Matched an existing document, or lost the race for
+                        # inserting it against a concurrent upsert
+                        self.duplicates.append(filename)
+                        finished.append(filename)
+                        logger.warning("Possible duplicate database entry found. Content for file {0} was not stored in database.".format(filename))
+                journal = self.journal
+
+            if journal is not None:
+                for filename in finished:
+                    journal.finishFile(filename)
+                for filename in forgotten:
+                    journal.forgetFile(filename)
+
+
+    def stats(self):
+        """Report the outcome of all flushed writes.
+
+        Returns:
+            dict: the number of inserted documents, the filenames of
+                duplicates and (filename, reason) tuples of failed writes.
+        """
+
+        with self.lock:
+            return {'inserted': self.inserted, 'duplicates': list(self.duplicates), 'failed': list(self.failed)}
+
 
 # Function definitions
+def connectClient(config=dbconfig):
+    """Open a new connection to the database server.
+
+    Every process needs a client of its own, since database connections must
+    not be shared across process boundaries.
+
+    Args:
+        config (mongoDB, optional): database configuration tuple.
+
+    Returns:
+        MongoClient: a new client object.
+    """
+
+    return MongoClient('mongodb://{0}:{1}@{2}:{3}/{4}'.format(config.username, config.password, config.host, config.port, config.name))
+
+
+def getBufferedWriter(db, batchsize=DEFAULT_WRITE_BATCHSIZE, interval=DEFAULT_WRITE_INTERVAL, journal=None):
+    """Return the buffered writer of the current process for a collection,
+    creating it on first use.
+
+    Args:
+        db: a database collection object.
+        batchsize (int, optional): number of documents per bulk write.
+        interval (float, optional): maximum age of the buffer in seconds.
+        journal (ImportJournal, optional): journal of the import job, in
+            which the writer marks files once their documents are written.
+
+    Returns:
+        BufferedWriter: the writer.
+    """
+
+    key = (os.getpid(), db.full_name)
+    with _writers_lock:
+        if key not in _writers:
+            _writers[key] = BufferedWriter(db, batchsize, interval, journal)
+        elif journal is not None:
+            with _writers[key].lock:
+                _writers[key].journal = journal
+
+    return _writers[key]
+
+
+def closeBufferedWriters():
+    """Flush and discard all buffered writers of the current process.
+
+    Returns:
+        list (dict): the statistics of each writer, see BufferedWriter.stats().
+    """
+
+    pid = os.getpid()
+    with _writers_lock:
+        writers = [_writers.pop(key) for key in list(_writers) if key[0] == pid]
+
+    stats = []
+    for writer in writers:
+        writer.flush()
+        stats.append(writer.stats())
+
+    return stats
+
+
+def combineFilter(filter, field, condition):
+    """Add a condition on a field to a filter.
+
+    Args:
+        filter (dict): the filter, may be empty or None.
+        field (str): the field.
+        condition: the condition on the field.
+
+    Returns:
+        dict: a new filter matching both.
+    """
+
+    filter = filter or {}
+    if field in filter:
+        return {'$and': [filter, {field: condition}]}
+    return dict(filter, **{field: condition})
+
+
 def documentExists(record, db):
     """Test if a document with a given set of identifiers exists in the database.
 
@@ -31,8 +306,136 @@ def documentExists(record, db):
         return False
 
 
-def storeDocument(content, source, filename, db, skipduplicate=False):
-    """Store a record in the database.
+def newDocumentId(previous=None):
+    """Create an identifier for a document before it is stored, so that
+    its pages can refer to it.
+
+    Args:
+        previous (str, optional): an identifier in its str form, e.g. as
+            recorded in the journal of an import job, to restore instead.
+
+    Returns:
+        ObjectId: a new or the restored document identifier.
+    """
+
+    return ObjectId(previous)
+
+
+def pageCollection(db):
+    """Return the collection holding the page records of the documents in
+    a collection.
+
+    Args:
+        db: a database collection object.
+
+    Returns:
+        a database collection object.
+    """
+
+    return db[DB_PAGES_COLLECTION]
+
+
+def deleteOrphanPages(db, document):
+    """Delete the page records of a document stored page by page which was
+    not inserted, e.g. because it was a duplicate.
+
+    Args:
+        db: the collection of the documents.
+        document (dict): the document which was not inserted.
+
+    Returns:
+        int: the number of deleted page records.
+    """
+
+    if document.get('content_storage') != STORAGE_PAGES or '_id' not in document:
+        return 0
+    return deletePages(db, document['_id'])
+
+
+def deletePages(db, document_id):
+    """Delete the page records of a document.
+
+    Args:
+        db: the collection of the documents.
+        document_id (ObjectId): identifier of the document.
+
+    Returns:
+        int: the number of deleted page records.
+    """
+
+    with metrics.stage('db'):
+        return pageCollection(db).delete_many({'document_id': document_id}).deleted_count
+
+
+def storePage(document_id, page_number, source, text, db):
+    """Store the text of a single page as a record of its own.
+
+    Args:
+        document_id (ObjectId): identifier of the document.
+        page_number (int): zero-based page number.
+        source (str): 'OCR' or 'Text'.
+        text (str): the text of the page.
+        db: the collection of the documents.
+
+    Returns:
+        bool: True if storing successful, False otherwise.
+    """
+
+    pages = pageCollection(db)
+    if pages.full_name not in _indexed:
+        pages.create_index([('document_id', ASCENDING), ('page', ASCENDING)])
+        _indexed.add(pages.full_name)
+
+    if metrics.metricsEnabled():
+        metrics.count('db_pages')
+        metrics.count('db_bytes', len(text.encode('utf-8')))
+    with metrics.stage('db'):
+        return pages.insert_one({
+                'document_id': document_id,
+                'page': page_number,
+                'source': source,
+                'text': text
+                }).acknowledged
+
+
+def iterDocumentText(doc, db, content_field='content'):
+    """Iterate through the text of a document without loading all of it at
+    once. Documents stored page by page are read one page at a time.
+
+    Args:
+        doc (dict): the document as retrieved from the database.
+        db: the collection of the document.
+        content_field (str, optional): document field holding the text of
+            documents stored as a whole.
+
+    Yields:
+        str: the text of the document, or of one page after the other.
+    """
+
+    if content_field in doc:
+        yield doc[content_field]
+    elif doc.get('content_storage') == STORAGE_PAGES:
+        for page in pageCollection(db).find({'document_id': doc['_id']}, {'text': True}).sort('page', ASCENDING):
+            yield page['text']
+
+
+def storeDocument(content, source, filename, db, skipduplicate=False, metadata=None, document_id=None, writer=None, term_counts=None, signature=None):
+    """Store a record in the database. If the text has been stored page by
+    page, content is None and metadata holds the 'content_storage' and
+    'content_pages' fields.
+
+    Term counts are stored in the DB_TERMCOUNTS_FIELD of the document, from
+    where bagofwords.aggregateFrequencies() sums them up without reading the
+    text again, and added to the corpus view of the collection, see
+    lib.corpus_view.
+
+    A MinHash signature is stored in the MINHASH_FIELD of the document, and
+    the document is added to the near-duplicate index of the collection once
+    it is written, see near_duplicates.indexSignature().
+
+    With a BufferedWriter, the document is only queued and no duplicate
+    check is made, since the writer leaves duplicates to a unique index.
+    The result then tells whether the document was queued.
     
     Args:
         content (str): body of data to be stored.
@@ -40,6 +443,14 @@ def storeDocument(content, source, filename, db, skipduplicate=False):
         filename (str): full path to the PDF file.
         db: a database object.
         skipduplicate (bool, optional): whether to skip possible duplicates.
+        metadata (dict, optional): additional fields to store with the
+            document.
+        document_id (ObjectId, optional): identifier for the document.
+        writer (BufferedWriter, optional): writer to queue the document with.
+        term_counts (dict, optional): words of the document and their
+            counts, see txt_helper.countWords().
+        signature (bytes, optional): MinHash signature of the text, see
+            near_duplicates.textSignature().
 
     Returns:
         bool: True if storing successful, False otherwise.
@@ -55,19 +466,177 @@ def storeDocument(content, source, filename, db, skipduplicate=False):
             'content_source': source,
             'content': content
             }
+    if metadata:
+        document.update(metadata)
+    if document_id is not None:
+        document['_id'] = document_id
+    if term_counts is not None:
+        document[DB_TERMCOUNTS_FIELD] = dict(term_counts)
+    if signature is not None:
+        document[MINHASH_FIELD] = signature
+    if content is None:
+        del document['content']
     
+    if writer is not None:
+        if content or document.get('content_pages'):
+            writer.add(document, filename)
+            return True
+        return False
+
     # Record for duplicate check
-    record = {key: document[key] for key in ['content_name', 'filecreated_date']}
+    record = {key: document[key] for key in DB_DUPLICATE_FIELDS}
     
     # Check if record exists and store if not.
     stored = False
-    docexists = documentExists(record, db)
+    with metrics.stage('db'):
+        docexists = documentExists(record, db)
     if skipduplicate and docexists:
-        logger.warning('Possible duplicate database entry found. Content was not stored in database.\nDuplicate information: ' + record)
-    elif content:
-        stored = db.insert_one(document).acknowledged
+        logger.warning('Possible duplicate database entry found. Content was not stored in database.\nDuplicate information: ' + str(record))
+        deleteOrphanPages(db, document)
+    elif content or document.get('content_pages'):
+        with metrics.stage('db'):
+            stored = db.insert_one(document).acknowledged
+            if stored and term_counts is not None:
+                updateCorpusView(db, source, document[DB_TERMCOUNTS_FIELD])
+            if stored and signature is not None:
+                indexSignature(db, document['_id'], signature)
+        if metrics.metricsEnabled():
+            metrics.count('db_documents')
+            metrics.count('db_bytes', len((content or '').encode('utf-8')))
         if docexists:
-            logger.info('Possible duplicate database entry found.\nDuplicate information: ' + record)
+            logger.info('Possible duplicate database entry found.\nDuplicate information: ' + str(record))
         logger.info("Content for file {0} stored in database.".format(filename))
 
     return stored
+
+
+def rebuildTermCounts(db, content_field='content', filter=None, overwrite=False, batchsize=DEFAULT_WRITE_BATCHSIZE):
+    """Compute and store the term counts of documents which were imported
+    without them, see storeDocument(). Documents are updated in unordered
+    bulk writes of batchsize documents, and the corpus view of the
+    collection is updated along with them.
+
+    Args:
+        db: a database collection object.
+        content_field (str, optional): document field holding the text of
+            documents stored as a whole.
+        filter (dict, optional): filter for the selected documents.
+        overwrite (bool, optional): recount documents which have term counts
+            already.
+        batchsize (int, optional): number of documents per bulk write.
+
+    Returns:
+        int: the number of updated documents.
+    """
+
+    query = filter or {}
+    if not overwrite:
+        query = combineFilter(query, DB_TERMCOUNTS_FIELD, {'$exists': False})
+
+    updated = 0
+    operations, changes = [], []
+
+    def _write():
+        with metrics.stage('db'):
+            result = db.bulk_write(operations, ordered=False).modified_count
+        for source, old_counts, term_counts in changes:
+            if old_counts is not None:
+                updateCorpusView(db, source, old_counts, sign=-1)
+            updateCorpusView(db, source, term_counts)
+        return result
+
+    for doc in db.find(query, {content_field: True, 'content_storage': True, 'content_source': True, DB_TERMCOUNTS_FIELD: True}):
+        with metrics.stage('terms'):
+            term_counts = dict(countWords(iterDocumentText(doc, db, content_field)))
+        operations.append(UpdateOne({'_id': doc['_id']}, {'$set': {DB_TERMCOUNTS_FIELD: term_counts}}))
+        changes.append((doc.get('content_source'), doc.get(DB_TERMCOUNTS_FIELD), term_counts))
+        if len(operations) >= batchsize:
+            updated+= _write()
+            operations, changes = [], []
+            logger.info('Stored term counts of {0} documents.'.format(updated))
+    if operations:
+        updated+= _write()
+
+    return updated
+
+
+def rebuildCorpusView(db, stopwords=DEFAULT_STOPWORDS):
+    """Build the corpus view of a collection from the term counts of its
+    documents, see lib.corpus_view. Documents without term counts are left
+    out, see rebuildTermCounts().
+
+    Args:
+        db: a database collection object.
+        stopwords (str|list, optional): names or paths of the stopword lists
+            of the view, see txt_helper.loadStopwords().
+
+    Returns:
+        int: the number of documents in the view.
+    """
+
+    documents = db.find({DB_TERMCOUNTS_FIELD: {'$exists': True}}, {'content_source': True, DB_TERMCOUNTS_FIELD: True})
+    return buildCorpusView(db, ((doc.get('content_source'), doc[DB_TERMCOUNTS_FIELD]) for doc in documents), stopwords)
+
+
+def rebuildNearDuplicates(db, content_field='content', threshold=DEFAULT_DUPLICATE_THRESHOLD):
+    """Build the near-duplicate index of a collection anew, see
+    lib.near_duplicates. The signatures of documents imported without them
+    are computed and stored. Documents are indexed in the order of their
+    ids, so the earliest document of a cluster is its original.
+
+    Args:
+        db: a database collection object.
+        content_field (str, optional): document field holding the text of
+            documents stored as a whole.
+        threshold (float, optional): minimum estimated similarity of
+            near-duplicates.
+
+    Returns:
+        int: the number of indexed documents.
+    """
+
+    clearSignatures(db)
+    db.update_many({DUPLICATE_FIELD: {'$exists': True}}, {'$unset': {DUPLICATE_FIELD: ''}})
+
+    indexed = 0
+    for doc in db.find({}, {'_id': True}).sort('_id', ASCENDING):
+        doc = db.find_one({'_id': doc['_id']}, {content_field: True, 'content_storage': True, MINHASH_FIELD: True})
+        signature = doc.get(MINHASH_FIELD)
+        if signature is None:
+            signature = textSignature(iterDocumentText(doc, db, content_field))
+            if signature is None:
+                continue
+            db.update_one({'_id': doc['_id']}, {'$set': {MINHASH_FIELD: signature}})
+        indexSignature(db, doc['_id'], signature, threshold)
+        indexed+= 1
+        if indexed % DEFAULT_WRITE_BATCHSIZE == 0:
+            logger.info('Indexed {0} documents for near-duplicates.'.format(indexed))
+
+    return indexed
+
+
+def deleteDocuments(db, filter):
+    """Delete documents along with their page records, subtract their
+    frequencies from the corpus view of the collection and remove them from
+    its near-duplicate index.
+
+    Args:
+        db: a database collection object.
+        filter (dict): filter for the documents to delete.
+
+    Returns:
+        int: the number of deleted documents.
+    """
+
+    deleted = 0
+    for doc in db.find(filter, {'content_source': True, 'content_storage': True, DB_TERMCOUNTS_FIELD: True, MINHASH_FIELD: True}):
+        if doc.get('content_storage') == STORAGE_PAGES:
+            pageCollection(db).delete_many({'document_id': doc['_id']})
+        if db.delete_one({'_id': doc['_id']}).deleted_count:
+            deleted+= 1
+            if DB_TERMCOUNTS_FIELD in doc:
+                updateCorpusView(db, doc.get('content_source'), doc[DB_TERMCOUNTS_FIELD], sign=-1)
+            if MINHASH_FIELD in doc:
+                removeSignature(db, doc['_id'])
+
+    return deleted
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""Sparse document-term matrix of a document collection.
+
+Every document is a row and every word a column of a matrix in compressed
+sparse row (CSR) format, held in three arrays:
+    data: the counts of the words, row after row.
+    indices: the column of every count, ascending within a row.
+    indptr: where every row starts in data and indices, plus the end.
+Columns are numbered in the order in which words were first seen, so the
+mapping of words to columns stays the same as documents are added.
+
+A matrix is saved to a folder as one .npy file per array, which can be
+memory mapped on loading, and a JSON file with the words and the ids and
+sources of the documents. New documents are appended to the files in place.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import json, logging, os, struct
+
+# Third party modules and packages
+import numpy as np
+
+# Local modules and packages
+from lib.db_helper import iterDocumentText, DB_TERMCOUNTS_FIELD
+from lib.import_conf import DEFAULT_LOGNAME
+from lib.txt_helper import countWords
+
+# Constants and other objects
+DEFAULT_DTM_BATCHSIZE = 500
+DTM_ARRAYS = ('data', 'indices', 'indptr')
+DTM_DTYPES = {'data': np.int32, 'indices': np.int32, 'indptr': np.int64}
+DTM_FORMAT = 1
+DTM_HEADER_SIZE = 128
+DTM_INFO_FILE = 'dtm.json'
+logger = logging.getLogger(DEFAULT_LOGNAME)
+
+
+# Classes
+class DocumentTermMatrix:
+    """A document-term matrix in CSR format with a stable vocabulary.
+
+    Documents are added with addDocument() or addCollection() and kept apart
+    from the stored rows until the matrix is saved or its arrays are
+    requested, see arrays().
+    """
+
+    def __init__(self):
+        self.terms = []
+        self.vocabulary = {}
+        self.documents = []
+        self.sources = []
+        self.folder = None
+        self._index = {}
+        self._data = np.zeros(0, dtype=DTM_DTYPES['data'])
+        self._indices = np.zeros(0, dtype=DTM_DTYPES['indices'])
+        self._indptr = np.zeros(1, dtype=DTM_DTYPES['indptr'])
+        self._pending = []
+        self._saved = None
+
+
+    def __len__(self):
+        return len(self.documents)
+
+
+    def __contains__(self, document_id):
+        return str(document_id) in self._index
+
+
+    @property
+    def shape(self):
+        """tuple: the number of documents and of words."""
+        return (len(self.documents), len(self.terms))
+
+
+    def row(self, document_id):
+        """Return the row of a document, or None if it is not in the matrix."""
+        return self._index.get(str(document_id))
+
+
+    def addDocument(self, document_id, term_counts, source=None):
+        """Add a document as a new row. Words not seen before get new columns.
+
+        Args:
+            document_id: id of the document, stored as a str.
+            term_counts (dict): words of the document and their counts.
+            source (str, optional): content source of the document.
+
+        Returns:
+            bool: False if the document is already in the matrix.
+        """
+
+        document_id = str(document_id)
+        if document_id in self._index:
+            return False
+
+        columns = []
+        for word in term_counts:
+            column = self.vocabulary.get(word)
+            if column is None:
+                column = self.vocabulary[word] = len(self.terms)
+                self.terms.append(word)
+            columns.append(column)
+
+        columns = np.array(columns, dtype=DTM_DTYPES['indices'])
+        counts = np.fromiter(term_counts.values(), dtype=DTM_DTYPES['data'], count=len(columns))
+        order = np.argsort(columns)
+        self._pending.append((columns[order], counts[order]))
+        self._index[document_id] = len(self.documents)
+        self.documents.append(document_id)
+        self.sources.append(source)
+
+        return True
+
+
+    def addCollection(self, db, filter=None, content_field='content', batchsize=DEFAULT_DTM_BATCHSIZE):
+        """Add the documents of a collection which are not in the matrix yet.
+        The term counts stored with the documents are used, see
+        db_helper.storeDocument(); the text of documents without them is
+        read and counted.
+
+        Args:
+            db: a database collection object.
+            filter (dict, optional): filter for the selected documents.
+            content_field (str, optional): document field holding the text.
+            batchsize (int, optional): number of documents read per query.
+
+        Returns:
+            int: the number of documents added.
+        """
+
+        # Only the ids are read to find the new documents, which are then
+        # read in batches
+        missing = [doc['_id'] for doc in db.find(filter or {}, {'_id': True}) if doc['_id'] not in self]
+        added = 0
+        for start in range(0, len(missing), batchsize):
+            for doc in db.find({'_id': {'$in': missing[start:start+batchsize]}}):
+                term_counts = doc.get(DB_TERMCOUNTS_FIELD)
+                if term_counts is None:
+                    term_counts = countWords(iterDocumentText(doc, db, content_field))
+                added+= self.addDocument(doc['_id'], term_counts, doc.get('content_source'))
+
+        return added
+
+
+    def arrays(self):
+        """Return the arrays of the matrix, including all added documents.
+
+        Returns:
+            tuple: the data, indices and indptr arrays, see the module
+                description.
+        """
+
+        if self._pending:
+            lengths = np.fromiter((len(columns) for columns, counts in self._pending), dtype=DTM_DTYPES['indptr'])
+            self._indptr = np.concatenate([self._indptr, self._indptr[-1] + np.cumsum(lengths)])
+            self._indices = np.concatenate([self._indices] + [columns for columns, counts in self._pending])
+            self._data = np.concatenate([self._data] + [counts for columns, counts in self._pending])
+            self._pending = []
+
+        return self._data, self._indices, self._indptr
+
+
+    def tocsr(self):
+        """Return the matrix as a scipy.sparse.csr_matrix, which shares the
+        arrays of the matrix.
+
+        Returns:
+            csr_matrix: the matrix.
+        """
+        # scipy is only needed by those who want a scipy matrix
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix(self.arrays(), shape=self.shape)
+
+
+    def save(self, folder=None):
+        """Save the matrix to a folder. If the matrix was loaded from or last
+        saved to the same folder, only the documents added since are
+        appended to the arrays.
+
+        Args:
+            folder (str, optional): the folder. Defaults to the folder the
+                matrix was loaded from.
+
+        Returns:
+            None
+        """
+
+        folder = folder or self.folder
+        os.makedirs(folder, exist_ok=True)
+        append = self._saved is not None and os.path.abspath(folder) == os.path.abspath(self.folder)
+        rows, nnz = self._saved if append else (-1, 0)
+
+        # The arrays are written first; the info file tells how much of them
+        # belongs to the matrix, so an interrupted write leaves it intact.
+        arrays = dict(zip(DTM_ARRAYS, self.arrays()))
+        for name, start in (('data', nnz), ('indices', nnz), ('indptr', rows + 1)):
+            path = os.path.join(folder, name + '.npy')
+            if not append:
+                _writeArray(path, arrays[name])
+            elif len(arrays[name]) > start:
+                _appendArray(path, arrays[name], start)
+
+        _writeInfo(folder, {
+                'format': DTM_FORMAT,
+                'rows': len(self.documents),
+                'nnz': int(arrays['indptr'][-1]),
+                'terms': self.terms,
+                'documents': self.documents,
+                'sources': self.sources
+                })
+        self.folder = folder
+        self._saved = (len(self.documents), int(arrays['indptr'][-1]))
+        logger.info('Saved document-term matrix of {0} documents and {1} words to {2}.'.format(*self.shape, folder))
+
+
+    @classmethod
+    def load(cls, folder, mmap=True):
+        """Load a matrix saved with save().
+
+        Args:
+            folder (str): the folder.
+            mmap (bool, optional): memory map the arrays instead of reading
+                them. The mapped arrays are read-only.
+
+        Returns:
+            DocumentTermMatrix: the matrix.
+        """
+
+        with open(os.path.join(folder, DTM_INFO_FILE), 'r', encoding='utf-8') as fr:
+            info = json.load(fr)
+        if info['format'] != DTM_FORMAT:
+            raise ValueError('Unknown document-term matrix format {0} in {1}'.format(info['format'], folder))
+
+        matrix = cls()
+        matrix.terms = info['terms']
+        matrix.vocabulary = {word: column for column, word in enumerate(matrix.terms)}
+        matrix.documents = info['documents']
+        matrix.sources = info['sources']
+        matrix._index = {document_id: row for row, document_id in enumerate(matrix.documents)}
+        lengths = {'data': info['nnz'], 'indices': info['nnz'], 'indptr': info['rows'] + 1}
+        for name in DTM_ARRAYS:
+            array = np.load(os.path.join(folder, name + '.npy'), mmap_mode='r' if mmap else None)
+            setattr(matrix, '_' + name, array[:lengths[name]])
+        matrix.folder = folder
+        matrix._saved = (info['rows'], info['nnz'])
+
+        return matrix
+
+
+# Function definitions
+def _arrayHeader(array, length):
+    """Build a .npy header for a one-dimensional array of a given length.
+    The header has a fixed size, so that it can be rewritten in place when
+    the array grows."""
+    header = repr({'descr': np.lib.format.dtype_to_descr(array.dtype), 'fortran_order': False, 'shape': (length,)})
+    preamble = np.lib.format.MAGIC_PREFIX + bytes([1, 0]) + struct.pack('<H', DTM_HEADER_SIZE - 10)
+    return preamble + header.ljust(DTM_HEADER_SIZE - 11).encode('latin1') + b'\n'
+
+
+def _writeArray(path, array):
+    """Write an array to a .npy file."""
+    with open(path + '.tmp', 'wb') as fw:
+        fw.write(_arrayHeader(array, len(array)))
+        fw.write(np.ascontiguousarray(array).tobytes())
+    os.replace(path + '.tmp', path)
+
+
+def _appendArray(path, array, start):
+    """Write the items of an array from start on to the end of a .npy file
+    holding its first start items."""
+    with open(path, 'r+b') as fw:
+        fw.seek(DTM_HEADER_SIZE + start * array.itemsize)
+        fw.truncate()
+        fw.write(np.ascontiguousarray(array[start:]).tobytes())
+        fw.seek(0)
+        fw.write(_arrayHeader(array, len(array)))
+
+
+def _writeInfo(folder, info):
+    """Write the info file of a saved matrix."""
+    path = os.path.join(folder, DTM_INFO_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as fw:
+        json.dump(info, fw, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+def updateMatrix(db, folder, filter=None, content_field='content'):
+    """Bring the document-term matrix of a collection saved in a folder up to
+    date. The matrix is created if the folder holds none.
+
+    Args:
+        db: a database collection object.
+        folder (str): folder of the matrix.
+        filter (dict, optional): filter for the selected documents.
+        content_field (str, optional): document field holding the text.
+
+    Returns:
+        DocumentTermMatrix: the matrix.
+    """
+
+    if os.path.exists(os.path.join(folder, DTM_INFO_FILE)):
+        matrix = DocumentTermMatrix.load(folder)
+    else:
+        matrix = DocumentTermMatrix()
+
+    added = matrix.addCollection(db, filter, content_field)
+    if added or matrix.folder is None:
+        matrix.save(folder)
+    logger.info('Added {0} documents to the document-term matrix in {1}.'.format(added, folder))
+
+    return matrix
+
+
+if __name__ == '__main__':
+    import argparse
+    from lib.db_conf import dbconfig
+    from lib.db_helper import connectClient
+
+    parser = argparse.ArgumentParser(description='Build or update the document-term matrix of a document collection.')
+    parser.add_argument('collection', help='collection of the documents')
+    parser.add_argument('folder', help='folder of the matrix')
+    parser.add_argument('--database', default=dbconfig.name, help='database of the collection')
+    parser.add_argument('--content-field', default='content', help='document field holding the text')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    client = connectClient()
+    matrix = updateMatrix(client[args.database][args.collection], args.folder, content_field=args.content_field)
+    print('Document-term matrix of {0} documents and {1} words.'.format(*matrix.shape))
+    client.close()
@@ -49,13 +49,13 @@ def determineImagetype(stream_first_4_bytes):
     
     file_type = None
     bytes_as_hex = b2a_hex(stream_first_4_bytes)
-    if bytes_as_hex.startswith('ffd8'):
+    if bytes_as_hex.startswith(b'ffd8'):
         file_type = '.jpeg'
-    elif bytes_as_hex == '89504e47':
-        file_type = ',png'
-    elif bytes_as_hex == '47494638':
+    elif bytes_as_hex == b'89504e47':
+        file_type = '.png'
+    elif bytes_as_hex == b'47494638':
         file_type = '.gif'
-    elif bytes_as_hex.startswith('424d'):
+    elif bytes_as_hex.startswith(b'424d'):
         file_type = '.bmp'
         
     return file_type
@@ -96,9 +96,8 @@ def divineImagefile(src_name='', number=None, count=None, number_prefix=None, ex
     else:
         number_str = ''
 
-    file_name = ''
-    while not file_name or os.path.exists(file_name):
-        file_name = '{0}{1}_{2}{3}'.format(os.path.splitext(os.path.basename(src_name))[0], number_str, uuid.uuid4().hex, ext)
+    # A random UUID makes the name unique without checking the target folder
+    file_name = '{0}{1}_{2}{3}'.format(os.path.splitext(os.path.basename(src_name))[0], number_str, uuid.uuid4().hex, ext)
     
     return unicodedata.normalize('NFKD', file_name).encode('ASCII', 'ignore').decode()
 
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed store for images extracted from PDF files.
+
+Each image is named after the hash of its data and written only once, no
+matter how many pages or documents it appears on. A reference index in an
+sqlite file maps each source document and page to the hashes of the images
+found there, each image once per page, so importing a document again adds
+no references. Image files are written by a background thread, so extraction
+does not wait for the disk.
+
+Layout of the store folder:
+    index.sqlite: the images and references tables.
+    ab/abcdef....jpeg: the image files, in subfolders named after the first
+        two characters of the hash.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import hashlib, logging, os, queue, sqlite3, threading
+
+# Local modules and packages
+import lib.metrics as metrics
+from lib.fileutil import writeFile
+from lib.import_conf import DEFAULT_LOGNAME
+
+# Constants and other objects
+DEFAULT_INDEXFILE = 'index.sqlite'
+DEFAULT_INDEX_TIMEOUT = 30
+logger = logging.getLogger(DEFAULT_LOGNAME)
+
+# The stores opened by this process, see openImageStore()
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+# Classes
+class ImageStore:
+    """A content-addressed image store with a reference index."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(folder, DEFAULT_INDEXFILE), timeout=DEFAULT_INDEX_TIMEOUT, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS images (hash TEXT PRIMARY KEY, path TEXT, size INTEGER)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS refs (document TEXT, page INTEGER, hash TEXT)')
+            # Indexes written before references were unique may hold duplicates
+            if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'refs_unique'").fetchone():
+                self.conn.execute('DELETE FROM refs WHERE rowid NOT IN (SELECT MIN(rowid) FROM refs GROUP BY document, page, hash)')
+                self.conn.execute('DROP INDEX IF EXISTS refs_document')
+                self.conn.execute('CREATE UNIQUE INDEX refs_unique ON refs (document, page, hash)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS refs_hash ON refs (hash)')
+        self.known = {row[0] for row in self.conn.execute('SELECT hash FROM images')}
+        self.new_images = []
+        self.new_refs = []
+        self.writes = queue.Queue()
+        self.writer = threading.Thread(target=self._write, daemon=True)
+        self.writer.start()
+
+
+    def add(self, data, ext, document, page):
+        """Add an image to the store. The image file is queued for writing
+        unless an image with the same data is known already.
+
+        Args:
+            data (bytes): the image data.
+            ext (str): the file extension for the image type, may be None.
+            document (str): identifier of the source document.
+            page (int): zero-based number of the source page.
+
+        Returns:
+            str: the path of the image file relative to the store folder.
+        """
+
+        digest = hashlib.sha1(data).hexdigest()
+        relpath = os.path.join(digest[:2], digest + (ext or ''))
+        with self.lock:
+            if digest not in self.known:
+                self.known.add(digest)
+                self.new_images.append((digest, relpath, len(data)))
+                self.writes.put((relpath, data))
+                metrics.count('image_bytes', len(data))
+            self.new_refs.append((document, page, digest))
+
+        return relpath
+
+
+    def _write(self):
+        """Write queued image files in the background. Every file is written
+        to a temporary file first and renamed when complete, so an existing
+        file is always a complete image. If writing fails, the image is
+        forgotten, so it is neither indexed nor taken as stored later.
+        """
+        while True:
+            relpath, data = self.writes.get()
+            fullpath = os.path.join(self.folder, relpath)
+            temppath = '{0}.{1}.tmp'.format(fullpath, os.getpid())
+            try:
+                if not os.path.exists(fullpath):
+                    os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+                    if not writeFile(temppath, data, flags='wb'):
+                        raise OSError('Cannot write {0}'.format(temppath))
+                    os.replace(temppath, fullpath)
+            except OSError as e:
+                logger.error('Storing image {0} failed: {1}'.format(relpath, e))
+                digest = os.path.splitext(os.path.basename(relpath))[0]
+                with self.lock:
+                    self.known.discard(digest)
+                    self.new_images = [image for image in self.new_images if image[0] != digest]
+                if os.path.exists(temppath):
+                    os.remove(temppath)
+            finally:
+                self.writes.task_done()
+
+
+    def flush(self):
+        """Wait until all queued image files are written and commit the new
+        entries of the reference index.
+
+        Returns:
+            None
+        """
+
+        self.writes.join()
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO images VALUES (?, ?, ?)', self.new_images)
+            self.conn.executemany('INSERT OR IGNORE INTO refs VALUES (?, ?, ?)', self.new_refs)
+            if self.new_images or self.new_refs:
+                logger.info('Image store: {0} new images, {1} references.'.format(len(self.new_images), len(self.new_refs)))
+            self.new_images = []
+            self.new_refs = []
+
+
+    def references(self, document):
+        """List the images found in a document.
+
+        Args:
+            document (str): identifier of the source document.
+
+        Returns:
+            list (tuple): page number and path of the image file relative to
+                the store folder, in page order.
+        """
+
+        with self.lock:
+            return self.conn.execute(
+                    'SELECT refs.page, images.path FROM refs JOIN images ON refs.hash = images.hash '
+                    'WHERE refs.document = ? ORDER BY refs.page', (document,)).fetchall()
+
+
+# Function definitions
+def openImageStore(folder):
+    """Return the image store in a folder, opening it on first use in the
+    current process. Stores are not shared with forked children.
+
+    Args:
+        folder (str): the store folder.
+
+    Returns:
+        ImageStore: the store.
+    """
+
+    key = (os.getpid(), folder)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ImageStore(folder)
+
+    return _stores[key]
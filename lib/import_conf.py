@@ -12,17 +12,98 @@ from collections import namedtuple
 DEFAULT_IMGFOLDER = '.'
 DEFAULT_LOGNAME = 'importing'
 
+# Import modes. The pipeline overlaps parsing with OCR and database writes,
+# but parses in a single interpreter; only the processes mode parses on
+# several cores.
+IMPORTMODE_SERIAL = 'serial'
+IMPORTMODE_PROCESSES = 'processes'
+IMPORTMODE_PIPELINE = 'pipeline'
+
+# Extraction levels, from highest fidelity to highest speed: full layout
+# analysis, text lines without the hierarchical grouping of text boxes, and
+# text decoded straight from the content stream.
+EXTRACTION_LAYOUT = 'layout'
+EXTRACTION_NOLAYOUT = 'nolayout'
+EXTRACTION_RAW = 'raw'
+
+# Storage modes: one content string per document, or one record per page
+STORAGE_DOCUMENT = 'document'
+STORAGE_PAGES = 'pages'
+
+# OCR modes: each page goes through a temporary image file, or pages are
+# rendered in memory and their pixels passed to Tesseract. Only with the
+# tesserocr package does the memory mode avoid temporary files; pytesseract
+# still writes every image to a temporary file for the Tesseract binary.
+OCRMODE_FILES = 'files'
+OCRMODE_MEMORY = 'memory'
+
 # Options for importing 
 ImportOptions = namedtuple('ImportOptions', [
+        'classifyPages',
+        'countProcesses',
         'createSubfolders',
+        'excludeNearDuplicates',
+        'extractionLevel',
+        'failedLog',
+        'fileTimeout',
         'imageFolder',
         'imageResolution',
-        'saveImages'
+        'imageStore',
+        'importMode',
+        'journalFile',
+        'manifestFile',
+        'metricsFile',
+        'nearDuplicates',
+        'ocrCacheFile',
+        'ocrCacheSize',
+        'ocrMode',
+        'ocrProcesses',
+        'ocrWorkers',
+        'pageChunkSize',
+        'pageProcesses',
+        'pageTimeout',
+        'parseWorkers',
+        'processes',
+        'queueSize',
+        'saveImages',
+        'storageMode',
+        'storeWorkers',
+        'termCounts',
+        'writeBatchSize',
+        'writeInterval'
         ])
 
 DEFAULT_IMPORTOPTIONS = ImportOptions(
+        classifyPages= False,
+        countProcesses= 1,
         createSubfolders= True,
+        excludeNearDuplicates= False,
+        extractionLevel= EXTRACTION_LAYOUT,
+        failedLog= None,
+        fileTimeout= None,
         imageFolder= os.path.join('.','data','img'),
         imageResolution= 600,
-        saveImages= False
+        imageStore= False,
+        importMode= IMPORTMODE_SERIAL,
+        journalFile= None,
+        manifestFile= None,
+        metricsFile= None,
+        nearDuplicates= False,
+        ocrCacheFile= None,
+        ocrCacheSize= 256 * 1024 * 1024,
+        ocrMode= OCRMODE_FILES,
+        ocrProcesses= None,
+        ocrWorkers= 4,
+        pageChunkSize= 20,
+        pageProcesses= 1,
+        pageTimeout= None,
+        parseWorkers= 1,
+        processes= None,
+        queueSize= 16,
+        saveImages= False,
+        storageMode= STORAGE_DOCUMENT,
+        storeWorkers= 1,
+        termCounts= False,
+        writeBatchSize= 0,
+        writeInterval= 5.0
         )
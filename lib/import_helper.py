@@ -5,18 +5,216 @@
 """
 
 # Python core modules and packages
-import os, logging
+import hashlib, os, logging, re
 # Third party modules and packages
 from pdfminer.layout import LTFigure, LTImage, LTTextBox, LTTextLine
+from pdfminer.pdfdevice import PDFDevice
+from pdfminer.pdffont import PDFUnicodeNotDefined
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import PDFStream, resolve1
 # Local modules and packages
+import lib.metrics as metrics
 from lib.import_conf import DEFAULT_IMPORTOPTIONS, DEFAULT_LOGNAME
 from lib.fileutil import determineImagetype, divineImagefile, writeFile
+from lib.image_store import openImageStore
 
 # Constants and other objects
 logger = logging.getLogger(DEFAULT_LOGNAME)
 
+# Page types as determined by classifyPage()
+PAGETYPE_EMPTY = 'empty'
+PAGETYPE_IMAGE = 'image'
+PAGETYPE_MIXED = 'mixed'
+PAGETYPE_TEXT = 'text'
+
+# Share of the page area above which an image counts as full-page image
+FULLPAGE_IMAGE_COVERAGE = 0.5
+
+# Content stream operators: text showing operators follow a string or an
+# array operand; images are drawn with Do (preceded by a cm transformation
+# in the usual case) or embedded inline between BI and ID.
+TEXTSHOW_RE = re.compile(rb'[)\]>]\s*(?:Tj|TJ|\'|")(?![A-Za-z])')
+DO_RE = re.compile(rb'(?:((?:[-+]?[\d.]+\s+){6})cm\s*)?/([^\s/\[\]()<>{}%]+)\s*Do(?![A-Za-z])')
+INLINEIMAGE_RE = re.compile(rb'(?<![A-Za-z])BI\s')
+
+
+# Classes
+class RawTextDevice(PDFDevice):
+    """A pdfminer device collecting the text shown on a page in content
+    stream order. Glyph positions are not computed and no layout objects are
+    created, which makes this the fastest way to get at the text. Text drawn
+    after moving to a new line or text position is separated by a line
+    break; large negative offsets in TJ arrays count as spaces.
+    """
+
+    # TJ offset in thousandths of an em beyond which a gap counts as a space
+    SPACE_OFFSET = 200
+
+    def __init__(self, rsrcmgr):
+        super().__init__(rsrcmgr)
+        self.chunks = []
+        self.linematrix = None
+
+
+    def begin_page(self, page, ctm):
+        self.chunks = []
+        self.linematrix = None
+
+
+    def render_string(self, textstate, seq, *args):
+        font = textstate.font
+        if font is None:
+            return
+
+        position = (tuple(textstate.matrix), tuple(textstate.linematrix))
+        if self.chunks and position != self.linematrix:
+            self.chunks.append('\n')
+        self.linematrix = position
+
+        for obj in seq:
+            if isinstance(obj, bytes):
+                for cid in font.decode(obj):
+                    try:
+                        self.chunks.append(font.to_unichr(cid))
+                    except PDFUnicodeNotDefined:
+                        pass
+            elif isinstance(obj, (int, float)) and -obj > self.SPACE_OFFSET:
+                self.chunks.append(' ')
+
+
+    def get_result(self):
+        """Return the text of the last processed page."""
+        return ''.join(self.chunks)
+
 
 # Function definitions
+def countPages(document):
+    """Determine the number of pages in a PDF document. The page count is
+    taken from the page tree root and only if that fails, the pages are
+    enumerated.
+
+    Args:
+        document (PDFDocument): the parsed PDF document.
+
+    Returns:
+        int: the number of pages.
+    """
+
+    try:
+        count = resolve1(resolve1(document.catalog['Pages'])['Count'])
+    except (KeyError, TypeError):
+        count = None
+
+    if not isinstance(count, int):
+        count = sum(1 for page in PDFPage.create_pages(document))
+
+    return count
+
+
+def classifyPage(page):
+    """Classify a page by a quick scan of its content streams and resources,
+    without interpreting the page.
+
+    Args:
+        page (PDFPage): the page.
+
+    Returns:
+        tuple: the page type (one of the PAGETYPE_* constants) and whether
+            the page holds an image covering most of the page.
+    """
+
+    try:
+        x0, y0, x1, y1 = page.mediabox
+        page_area = abs((x1 - x0) * (y1 - y0)) or None
+    except (TypeError, ValueError):
+        page_area = None
+
+    found = {'text': False, 'image': False, 'fullpage': False}
+    seen = set()
+
+    def _scan(contents, resources):
+        resources = resolve1(resources) or {}
+        fonts = resolve1(resources.get('Font')) or {}
+        xobjects = resolve1(resources.get('XObject')) or {}
+        for stream in contents:
+            stream = resolve1(stream)
+            if not isinstance(stream, PDFStream):
+                continue
+            data = stream.get_data() or b''
+            if fonts and TEXTSHOW_RE.search(data):
+                found['text'] = True
+            if INLINEIMAGE_RE.search(data):
+                found['image'] = True
+            for matrix, name in DO_RE.findall(data):
+                xobj = resolve1(xobjects.get(name.decode('latin-1')))
+                if not isinstance(xobj, PDFStream) or id(xobj) in seen:
+                    continue
+                seen.add(id(xobj))
+                subtype = resolve1(xobj.get('Subtype'))
+                subtype = getattr(subtype, 'name', subtype)
+                if subtype == 'Image':
+                    found['image'] = True
+                    if matrix and page_area:
+                        a, b, c, d = (float(v) for v in matrix.split()[:4])
+                        if abs(a * d - b * c) >= FULLPAGE_IMAGE_COVERAGE * page_area:
+                            found['fullpage'] = True
+                elif subtype == 'Form':
+                    _scan([xobj], xobj.get('Resources') or resources)
+
+    contents = page.contents if isinstance(page.contents, list) else [page.contents]
+    _scan(contents, page.resources)
+
+    if found['text'] and found['image']:
+        pagetype = PAGETYPE_MIXED
+    elif found['text']:
+        pagetype = PAGETYPE_TEXT
+    elif found['image']:
+        pagetype = PAGETYPE_IMAGE
+    else:
+        pagetype = PAGETYPE_EMPTY
+
+    return pagetype, found['fullpage']
+
+
+def pageFingerprint(page):
+    """Hash everything that determines the appearance of a page: its
+    content streams and the raw data of all XObjects it draws, including
+    those nested in form XObjects. The hash is cheap to compute, since no
+    content is interpreted and image data is not decoded.
+
+    Args:
+        page (PDFPage): the page.
+
+    Returns:
+        str: hexadecimal SHA-256 hash of the page content.
+    """
+
+    sha = hashlib.sha256()
+
+    def _hashStream(stream):
+        data = stream.rawdata if stream.rawdata is not None else stream.get_data()
+        sha.update(data or b'')
+
+    def _hashResources(resources, seen):
+        xobjects = resolve1((resolve1(resources) or {}).get('XObject')) or {}
+        for name in sorted(xobjects):
+            xobj = resolve1(xobjects[name])
+            if isinstance(xobj, PDFStream) and id(xobj) not in seen:
+                seen.add(id(xobj))
+                sha.update(name.encode('utf-8', 'replace') if isinstance(name, str) else bytes(name))
+                _hashStream(xobj)
+                _hashResources(xobj.get('Resources'), seen)
+
+    contents = page.contents if isinstance(page.contents, list) else [page.contents]
+    for stream in contents:
+        stream = resolve1(stream)
+        if isinstance(stream, PDFStream):
+            _hashStream(stream)
+    _hashResources(page.resources, set())
+
+    return sha.hexdigest()
+
+
 def saveLtImage (lt_image, src_fullpath, dst_folder='.', page_number=None):
     """Save the image data from an LTImage object in a given folder with a
     self-generated filename and return the file name, if successful.
@@ -47,13 +245,48 @@ def saveLtImage (lt_image, src_fullpath, dst_folder='.', page_number=None):
         imgfullpath = os.path.join(dst_folder, imgfile)
         
         # Save image file
-        if writeFile(imgfullpath, lt_image.stream.get_rawdata(), flags='wb'):
-            result = imgfullpath
+        with metrics.stage('images'):
+            if writeFile(imgfullpath, file_stream, flags='wb'):
+                result = imgfullpath
+                metrics.count('images')
+                metrics.count('image_bytes', len(file_stream))
 
     return result
 
 
-def parseLtObjs(lt_objs, src_fullpath, page_number, dst_folder='.', options=DEFAULT_IMPORTOPTIONS, text=[]):
+def storeLtImage(lt_image, src_fullpath, store_folder, page_number=None):
+    """Add the image data from an LTImage object to the content-addressed
+    image store in a folder. Images already in the store are not written
+    again, only a reference to them is recorded.
+
+    Args:
+        lt_image (LTImage): image object.
+        src_fullpath (str): filename with path from where the image was taken.
+        store_folder (str): folder of the image store.
+        page_number (int, optional): number of the page from where the image
+            was taken.
+
+    Returns:
+        str: full path to the stored image.
+    """
+
+    result = None
+    if lt_image.stream:
+        file_stream = lt_image.stream.get_rawdata()
+        if file_stream:
+            with metrics.stage('images'):
+                relpath = openImageStore(store_folder).add(
+                        file_stream,
+                        determineImagetype(file_stream[0:4]),
+                        src_fullpath,
+                        page_number)
+            result = os.path.join(store_folder, relpath)
+            metrics.count('images')
+
+    return result
+
+
+def parseLtObjs(lt_objs, src_fullpath, page_number, dst_folder='.', options=DEFAULT_IMPORTOPTIONS, text=None):
     """Iterate through the list of LT* objects and capture the text or image
     data contained in each.
     
@@ -63,30 +296,40 @@ def parseLtObjs(lt_objs, src_fullpath, page_number, dst_folder='.', options=DEFA
         page_number (int): the page number from where the lt_objs stem.
         dst_folder (str): the path where to store extracted images, if any.
         options (ImportOptions): tuple holding various settings.
-        text (list): a list of str to which to append the extracted text.
+        text (list, optional): a list of str to which to append the
+            extracted text. A new list is used if None.
 
     Returns:
         str: text extracted from the PDF.
     """
 
-    text_content = text
+    text_content = text if text is not None else []
     for lt_obj in lt_objs:
         if isinstance(lt_obj, (LTTextBox, LTTextLine)):
             text_content.append(lt_obj.get_text())
         elif options.saveImages and isinstance(lt_obj, LTImage):
-            # an image, so save it to the designated folder, and note it's place in the text
-            saved_file = saveLtImage(
-                    lt_image=lt_obj,
-                    src_fullpath=src_fullpath,
-                    dst_folder=dst_folder,
-                    page_number=page_number)
+            # an image, so save it to the designated folder or the image
+            # store, and note it's place in the text
+            if options.imageStore:
+                saved_file = storeLtImage(
+                        lt_image=lt_obj,
+                        src_fullpath=src_fullpath,
+                        store_folder=options.imageFolder,
+                        page_number=page_number)
+            else:
+                saved_file = saveLtImage(
+                        lt_image=lt_obj,
+                        src_fullpath=src_fullpath,
+                        dst_folder=dst_folder,
+                        page_number=page_number)
             if saved_file:
                 # use html style <img /> tag to mark the position of the image within the text
                 text_content.append('<img src="'+saved_file+'" />')
             else:
                 logger.error("Error saving image <{0}> on page {1}.".format(lt_obj.__repr__, page_number))
         elif options.saveImages and isinstance(lt_obj, LTFigure):
-            # LTFigure objects are containers for other LT* objects, so recurse through the children
-            text_content.append(parseLtObjs(lt_obj.objs, src_fullpath, page_number, options, text_content))
+            # LTFigure objects are containers for other LT* objects, so recurse through the children.
+            # Their text is appended to text_content directly.
+            parseLtObjs(lt_obj, src_fullpath, page_number, dst_folder, options, text_content)
 
     return '\n'.join(text_content)
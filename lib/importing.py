@@ -5,12 +5,13 @@
 """
 
 # Python core modules and packages
-import logging, os
+import logging, multiprocessing, os, threading, time
+from collections import Counter, deque, namedtuple
+from multiprocessing.util import Finalize
+from operator import attrgetter
 from datetime import datetime
 
 # Third party modules and packages
-import pytesseract as pt
-pt.pytesseract.tesseract_cmd = r'C:\Program Files (x86)\Tesseract-OCR\tesseract'
 from pdfminer.pdfparser import PDFParser
 from pdfminer.pdfdocument import PDFDocument
 from pdfminer.pdfpage import PDFPage
@@ -20,17 +21,36 @@ from pdfminer.converter import PDFPageAggregator
 
 # Local modules and packages
 import lib.constants as constants
-from lib.db_helper import documentExists, storeDocument
-from lib.import_helper import parseLtObjs
-from lib.import_conf import DEFAULT_IMPORTOPTIONS, DEFAULT_LOGNAME
-from lib.pdfutil import savePDFPageAsImage, DEFAULT_RESOLUTION
-from lib.fileutil import collectFiles, divineImagefolder
+import lib.metrics as metrics
+from lib.corpus_view import initCorpusView
+from lib.db_helper import closeBufferedWriters, connectClient, deletePages, documentExists, getBufferedWriter, newDocumentId, storeDocument, storePage
+from lib.import_helper import classifyPage, countPages, pageFingerprint, parseLtObjs, RawTextDevice, PAGETYPE_EMPTY, PAGETYPE_IMAGE
+from lib.import_conf import DEFAULT_IMPORTOPTIONS, DEFAULT_LOGNAME, EXTRACTION_NOLAYOUT, EXTRACTION_RAW, IMPORTMODE_PIPELINE, IMPORTMODE_PROCESSES, OCRMODE_MEMORY, STORAGE_PAGES
+from lib.ocr_cache import OCRCache, openOCRCache
+from lib.ocr_helper import getOCRPool, loadPytesseract, loadTesserocr, ocrImage, DEFAULT_OCR_LANGUAGE
+from lib.pdfutil import renderPDFPages, savePDFPageAsImage, DEFAULT_RESOLUTION
+from lib.fileutil import collectFiles, divineImagefolder, writeFile
+from lib.image_store import openImageStore
+from lib.journal import openJournal
+from lib.manifest import changeReport, ImportManifest, STATUS_FAILED, STATUS_IMPORTED, STATUS_SKIPPED
+from lib.near_duplicates import minhashSignature, shingleHashes, textSignature
+from lib.txt_helper import countWords
+from lib.watchdog import heartbeat, runWatched
 
 # Constants and other objects
-DEFAULT_OCR_LANGUAGE = 'deu'
+DEFAULT_OCR_PENDING = 2
 DEFAULT_OCR_SAVEEXTENSION = '.txt'
 logger = logging.getLogger(DEFAULT_LOGNAME)
 
+# Text of a single page. The fingerprint identifies the page content for the
+# OCR cache and is only computed for pages without extractable text. The
+# page type is one of the import_helper.PAGETYPE_* constants, or None if
+# pages are not classified.
+PageText = namedtuple('PageText', ['number', 'text', 'hadtext', 'fingerprint', 'pagetype'])
+
+# State of an import worker process, populated by _initImportWorker()
+_worker = {}
+
 
 def runOCRonPDF(filename, tmp_folder='.', pages=[], filetype='.tif', resolution=DEFAULT_RESOLUTION):
     """Run Tesseract OCR on a given set of pages from a PDF file. Pages are
@@ -58,12 +78,16 @@ def runOCRonPDF(filename, tmp_folder='.', pages=[], filetype='.tif', resolution=
             resolution=resolution)
     
     if imgfullpath:
-        if pt.pytesseract.run_tesseract(
-                input_filename=imgfullpath,
-                output_filename_base=os.path.splitext(imgfullpath)[0],
-                extension=DEFAULT_OCR_SAVEEXTENSION.strip('.'),
-                lang=DEFAULT_OCR_LANGUAGE):
-            txtfullpath = os.path.splitext(imgfullpath)[0] + DEFAULT_OCR_SAVEEXTENSION
+        # Older versions of pytesseract return True on success, newer ones
+        # return None, so success is told by the text file
+        txtfullpath = os.path.splitext(imgfullpath)[0] + DEFAULT_OCR_SAVEEXTENSION
+        with metrics.stage('ocr'):
+            loadPytesseract().pytesseract.run_tesseract(
+                    input_filename=imgfullpath,
+                    output_filename_base=os.path.splitext(imgfullpath)[0],
+                    extension=DEFAULT_OCR_SAVEEXTENSION.strip('.'),
+                    lang=DEFAULT_OCR_LANGUAGE)
+        if os.path.exists(txtfullpath):
             with open(txtfullpath, 'r', encoding="utf8") as fr:
                 content = str(fr.read())
             os.remove(txtfullpath)
@@ -72,24 +96,555 @@ def runOCRonPDF(filename, tmp_folder='.', pages=[], filetype='.tif', resolution=
     return content
 
 
-def readFromPDF(filename, db, options=DEFAULT_IMPORTOPTIONS):
+def ocrPages(filename, pages, img_folder='.', options=DEFAULT_IMPORTOPTIONS, fingerprints=None, callback=None):
+    """Run OCR on a set of pages from a PDF file.
+
+    With options.ocrMode set to OCRMODE_MEMORY, the PDF file is opened once,
+    all pages are rendered in batches and their pixels are passed to
+    Tesseract in memory. This needs tesserocr; with pytesseract, every image
+    still goes to Tesseract through a temporary file. If options.ocrProcesses
+    is set, the images are handed to the persistent OCR pool of
+    lib.ocr_helper while rendering goes on, with at most DEFAULT_OCR_PENDING
+    pages per worker waiting for OCR. Otherwise, every page goes through
+    runOCRonPDF() and its temporary image and text files.
+
+    If options.ocrCacheFile is set, pages with a fingerprint are looked up
+    in the OCR cache first. Cache hits are neither rendered nor OCR'ed.
+    Pages without recognized text are not cached, since OCR may have
+    failed, so they are tried again by the next run.
+
+    Args:
+        filename (str): PDF file to run OCR on.
+        pages (list): zero-based numbers of the pages to run OCR on.
+        img_folder (str, optional): folder for temporary image files.
+        options (ImportOptions, optional): tuple holding various settings.
+        fingerprints (dict, optional): page numbers and the fingerprints of
+            their content, see import_helper.pageFingerprint().
+        callback (callable, optional): called with the page number and the
+            text of every page as soon as its text is available.
+
+    Returns:
+        dict: page numbers and their recognized text.
+    """
+
+    texts = {}
+    if not pages:
+        return texts
+
+    # Serve what we can from the cache
+    cache, keys = None, {}
+    if options.ocrCacheFile and fingerprints:
+        cache = openOCRCache(options.ocrCacheFile, options.ocrCacheSize)
+        keys = {page_number: OCRCache.key(fingerprints[page_number], options.imageResolution, DEFAULT_OCR_LANGUAGE)
+                for page_number in pages if fingerprints.get(page_number)}
+        cached = cache.get(keys.values())
+        for page_number, key in keys.items():
+            if key in cached:
+                texts[page_number] = cached[key]
+        pages = [page_number for page_number in pages if page_number not in texts]
+        if texts:
+            logger.info('Took OCR text of {0} pages from the cache.'.format(len(texts)))
+            metrics.count('ocr_cache_hits', len(texts))
+            if callback:
+                for page_number in sorted(texts):
+                    callback(page_number, texts[page_number])
+
+    ocr_texts = {}
+    metrics.count('ocr_pages', len(pages))
+    if options.ocrMode == OCRMODE_MEMORY and pages:
+        pool = getOCRPool(options.ocrProcesses, DEFAULT_OCR_LANGUAGE) if options.ocrProcesses else None
+        pending = deque()
+
+        def _collect():
+            page_number, result = pending.popleft()
+            heartbeat(page_number)
+            with metrics.stage('ocr_wait'):
+                ocr_texts[page_number] = result.get()
+            if callback:
+                callback(page_number, ocr_texts[page_number])
+
+        heartbeat(min(pages))
+        for page_number, image in renderPDFPages(filename, pages, options.imageResolution):
+            logger.info('Running OCR on p. {0}'.format(page_number+1))
+            if pool:
+                # Rendering goes on while the pool is busy, but every queued
+                # job holds a full page bitmap, so only a few may be pending
+                while len(pending) >= DEFAULT_OCR_PENDING * pool.processes:
+                    _collect()
+                pending.append((page_number, pool.submit(image)))
+            else:
+                with metrics.stage('ocr'):
+                    ocr_texts[page_number] = ocrImage(image, DEFAULT_OCR_LANGUAGE)
+                heartbeat(page_number)
+                if callback:
+                    callback(page_number, ocr_texts[page_number])
+        while pending:
+            _collect()
+    else:
+        for page_number in pages:
+            heartbeat(page_number)
+            ocr_texts[page_number] = runOCRonPDF(
+                    filename=filename,
+                    tmp_folder=img_folder,
+                    pages=[page_number],
+                    resolution=options.imageResolution
+                    )
+            if callback:
+                callback(page_number, ocr_texts[page_number])
+
+    if cache:
+        cache.put({keys[page_number]: text for page_number, text in ocr_texts.items() if page_number in keys and text.strip()})
+    texts.update(ocr_texts)
+
+    return texts
+
+
+def duplicateRecord(filename):
+    """Build the identifier record used for duplicate checking. This could be
+    user-definable.
+
+    Args:
+        filename (str): full path to the PDF file.
+
+    Returns:
+        dict: the identifiers of the document.
+    """
+
+    return {
+            'content_name': os.path.basename(filename),
+            'filecreated_date': str(datetime.fromtimestamp(os.stat(filename).st_ctime))
+            }
+
+
+def contentSource(page_hadextractabletext):
+    """Describe where the content of a document came from.
+
+    Args:
+        page_hadextractabletext (list): for each page, whether the page had
+            extractable text (True) or was OCR'ed (False).
+
+    Returns:
+        str: 'Text', 'OCR' or 'OCR|Text'.
+    """
+
+    return '|'.join([['OCR', 'Text'][idx] for idx in set(page_hadextractabletext)])
+
+
+def documentMetadata(pages, options=DEFAULT_IMPORTOPTIONS):
+    """Compile the extraction settings and per-page information stored
+    along with a document.
+
+    Args:
+        pages (list): PageText tuples of the document in page order.
+        options (ImportOptions, optional): the options used for extraction.
+
+    Returns:
+        dict: additional document fields.
+    """
+
+    metadata = {'extraction_level': options.extractionLevel}
+    if any(page.pagetype for page in pages):
+        metadata['page_types'] = [page.pagetype for page in pages]
+
+    return metadata
+
+
+def storeExtracted(pages, filename, db, options=DEFAULT_IMPORTOPTIONS):
+    """Store the extracted pages of a document in the database.
+
+    With options.storageMode set to STORAGE_PAGES, each page with text is
+    written as a record of its own as soon as it comes in, and only the page
+    information without the text is kept until the document record is
+    stored. Otherwise, the pages are sorted and joined to one content string.
+    With options.journalFile set, the document identifier is recorded in the
+    journal before the first page is stored. A resumed file reuses it and
+    its page records from the interrupted run are deleted first, so none
+    are left behind.
+
+    With options.termCounts set, the words of the document are counted and
+    stored with the document record, see db_helper.storeDocument().
+
+    With options.nearDuplicates set, the MinHash signature of the text is
+    stored with the document record, which is then checked against the
+    near-duplicate index of the collection, see lib.near_duplicates.
+
+    If options.writeBatchSize is set, the document record is queued with the
+    buffered writer of the current process and written in a bulk write
+    later, see db_helper.BufferedWriter. With options.journalFile set, the
+    writer marks the file as completed in the journal once it is written.
+
+    Args:
+        pages (iterable): PageText tuples of the document in any order.
+        filename (str): full path to the PDF file.
+        db: a database collection object.
+        options (ImportOptions, optional): tuple holding various settings.
+
+    Returns:
+        bool: True if storing successful, False otherwise.
+    """
+
+    journal = openJournal(options.journalFile) if options.journalFile else None
+    writer = getBufferedWriter(db, options.writeBatchSize, options.writeInterval, journal) if options.writeBatchSize else None
+    if options.storageMode == STORAGE_PAGES:
+        previous = journal.documentId(filename) if journal else None
+        # The id is only free if the interrupted run did not get to store
+        # the document record itself.
+        if previous and not db.count_documents({'_id': newDocumentId(previous)}, limit=1):
+            document_id = newDocumentId(previous)
+            deleted = deletePages(db, document_id)
+            if deleted:
+                logger.info("Replacing {0} page records of '{1}' from an interrupted run.".format(deleted, filename))
+        else:
+            document_id = newDocumentId()
+            if journal:
+                journal.recordDocument(filename, document_id)
+        summary = []
+        stored = 0
+        term_counts = Counter() if options.termCounts else None
+        shingles = set() if options.nearDuplicates else None
+        for page in pages:
+            if page.text:
+                stored+= storePage(document_id, page.number, ['OCR', 'Text'][page.hadtext], page.text, db)
+                if term_counts is not None:
+                    with metrics.stage('terms'):
+                        term_counts.update(countWords([page.text]))
+                if shingles is not None:
+                    with metrics.stage('minhash'):
+                        shingles|= shingleHashes([page.text])
+            summary.append(page._replace(text=None))
+        summary.sort(key=attrgetter('number'))
+
+        metadata = documentMetadata(summary, options)
+        metadata['content_storage'] = STORAGE_PAGES
+        metadata['content_pages'] = stored
+        signature = None
+        if shingles is not None:
+            with metrics.stage('minhash'):
+                signature = minhashSignature(shingles)
+        return storeDocument(None, contentSource([page.hadtext for page in summary]), filename, db, metadata=metadata, document_id=document_id, writer=writer, term_counts=term_counts, signature=signature)
+    else:
+        pages = sorted(pages, key=attrgetter('number'))
+        content = ''.join(['\n' + page.text for page in pages if page.text])
+        term_counts = None
+        if options.termCounts:
+            with metrics.stage('terms'):
+                term_counts = countWords([content])
+        signature = None
+        if options.nearDuplicates:
+            with metrics.stage('minhash'):
+                signature = textSignature([content])
+        return storeDocument(content, contentSource([page.hadtext for page in pages]), filename, db, metadata=documentMetadata(pages, options), writer=writer, term_counts=term_counts, signature=signature)
+
+
+def flushImageStore(options=DEFAULT_IMPORTOPTIONS):
+    """Wait for the image store of the current process to write its
+    pending images and references, if the image store is in use.
+
+    Args:
+        options (ImportOptions, optional): tuple holding various settings.
+
+    Returns:
+        None
+    """
+
+    if options.saveImages and options.imageStore:
+        openImageStore(options.imageFolder).flush()
+
+
+def splitDuplicateFiles(files):
+    """Separate files sharing the duplicate record of an earlier file in the
+    list. Concurrent import paths only hand out the first of those, since
+    concurrent workers could otherwise store them before seeing each other
+    in the database.
+
+    Args:
+        files (list): a list of filenames.
+
+    Returns:
+        tuple: the list of unique files and the list of duplicates.
+    """
+
+    unique, duplicates = [], []
+    records = set()
+    for f in files:
+        record = tuple(sorted(duplicateRecord(f).items()))
+        if record in records:
+            logger.warning('Possible duplicate database entry found. Content was not stored in database.\nDuplicate information: ' + str(dict(record)))
+            duplicates.append(f)
+        else:
+            records.add(record)
+            unique.append(f)
+
+    return unique, duplicates
+
+
+def iterPages(document, filename, img_folder, options=DEFAULT_IMPORTOPTIONS, pagenos=None, rsrcmgr=None, ocr=True):
+    """Extract the text of the pages of a PDF document page by page.
+
+    With options.classifyPages set, each page is classified by a quick scan
+    of its content stream first. Layout analysis is skipped for pages which
+    cannot produce text, i.e., image-only and empty pages, unless images are
+    to be saved. The classification is a heuristic and off by default.
+
+    options.extractionLevel selects how text is extracted: EXTRACTION_LAYOUT
+    runs the full pdfminer layout analysis, EXTRACTION_NOLAYOUT skips the
+    hierarchical grouping of text boxes, and EXTRACTION_RAW decodes the text
+    operators of the content stream without any layout objects. Images are
+    not saved at the raw level.
+
+    Args:
+        document (PDFDocument): the parsed PDF document.
+        filename (str): filename of the document.
+        img_folder (str): folder for saved and temporary image files.
+        options (ImportOptions, optional): tuple holding various settings.
+        pagenos (set, optional): zero-based numbers of the pages to extract.
+            All pages are extracted if None.
+        rsrcmgr (PDFResourceManager, optional): resource manager to reuse.
+            A new one is created if None.
+        ocr (bool, optional): whether to OCR pages without extractable text.
+            If False, the text of such pages is left empty.
+
+    Yields:
+        PageText: the text of each page, in page order.
+    """
+
+    # Create PDFResourceManager object that stores shared resources such as fonts or images
+    if rsrcmgr is None:
+        rsrcmgr = PDFResourceManager()
+
+    if options.extractionLevel == EXTRACTION_RAW:
+        # Collect decoded text straight from the text operators
+        device = RawTextDevice(rsrcmgr)
+    else:
+        # Set parameters for analysis. Without boxes_flow, pdfminer skips
+        # the costly hierarchical grouping of text boxes.
+        if options.extractionLevel == EXTRACTION_NOLAYOUT:
+            laparams = LAParams(boxes_flow=None)
+        else:
+            laparams = LAParams()
+
+        # Create a PDFDevice object which translates interpreted information into desired format
+        # Device needs to be connected to resource manager to store shared resources
+        # device = PDFDevice(rsrcmgr)
+        # Extract the decive to page aggregator to get LT object elements
+        device = PDFPageAggregator(rsrcmgr, laparams=laparams)
+
+    # Create interpreter object to process page content from PDFDocument
+    # Interpreter needs to be connected to resource manager for shared resources and device
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+
+    # Now that we have everything to process a pdf document, lets process it page by page
+    last_pageno = max(pagenos) if pagenos else None
+    for page_number, page in enumerate(PDFPage.create_pages(document)):
+        if pagenos is not None:
+            if page_number > last_pageno:
+                break
+            if page_number not in pagenos:
+                continue
+
+        heartbeat(page_number)
+        metrics.count('pages')
+
+        # Out of the many LT objects within layout, we are interested in LTTextBox and LTTextLine
+        page_text = ''
+        page_chunks = []
+
+        pagetype = None
+        if options.classifyPages:
+            with metrics.stage('classify'):
+                pagetype = classifyPage(page)[0]
+        if pagetype in (PAGETYPE_EMPTY, PAGETYPE_IMAGE) and not options.saveImages:
+            logger.info('Skipping layout analysis of {0} p. {1}.'.format(pagetype, page_number+1))
+        else:
+            logger.info('Extracting text from p. {0}'.format(page_number+1))
+
+            # As the interpreter processes the page stored in PDFDocument object
+            with metrics.stage('layout'):
+                interpreter.process_page(page)
+
+            if options.extractionLevel == EXTRACTION_RAW:
+                page_text = device.get_result()
+            else:
+                # The device renders the layout from interpreter
+                layout = device.get_result()
+
+                # Traverse all objects in the PDF file
+                with metrics.stage('text'):
+                    for lt_obj in layout:
+                        page_chunks.append(parseLtObjs(
+                                lt_objs=[lt_obj],
+                                src_fullpath=filename,
+                                page_number=page_number,
+                                dst_folder=img_folder,
+                                options=options))
+                    page_text = ''.join(page_chunks)
+
+        page_hadextractabletext = bool(page_text)
+        fingerprint = None
+
+        # No text will be extracted from an image-only page. In such
+        # cases, try OCR.
+        if not page_hadextractabletext:
+            if options.ocrCacheFile:
+                with metrics.stage('fingerprint'):
+                    fingerprint = pageFingerprint(page)
+            if ocr:
+                logger.info('Page {0} had no extractable text. Trying OCR.'.format(page_number+1))
+                page_text+= ocrPages(filename, [page_number], img_folder, options, {page_number: fingerprint}).get(page_number, '')
+
+        yield PageText(page_number, page_text, page_hadextractabletext, fingerprint, pagetype)
+
+
+def streamPages(document, filename, img_folder, options=DEFAULT_IMPORTOPTIONS, pagenos=None, rsrcmgr=None):
+    """Extract the text of the pages of a PDF document. Pages with
+    extractable text are passed on as soon as they are extracted. Pages
+    without are OCR'ed in one batch after text extraction and passed on
+    thereafter, so pages do not come in page order.
+
+    If options.journalFile is set, pages already recorded in the journal of
+    the import job are passed on first and not extracted again. Every other
+    page is recorded as soon as it is complete, OCR'ed pages as soon as
+    their text is recognized.
+
+    Args:
+        see iterPages().
+
+    Yields:
+        PageText: the text of each page.
+    """
+
+    journal = None
+    if options.journalFile:
+        journal = openJournal(options.journalFile)
+        journaled = {n: PageText(*page) for n, page in journal.pages(filename).items()
+                     if pagenos is None or n in pagenos}
+        if journaled:
+            logger.info("Resuming '{0}' with {1} pages from the journal.".format(filename, len(journaled)))
+            yield from journaled.values()
+            if pagenos is None:
+                pagenos = range(countPages(document))
+            pagenos = set(pagenos) - set(journaled)
+            if not pagenos:
+                return
+
+    ocr_pages = {}
+    for page in iterPages(document, filename, img_folder, options, pagenos, rsrcmgr, ocr=False):
+        if page.hadtext:
+            if journal:
+                journal.recordPage(filename, page)
+            yield page
+        else:
+            ocr_pages[page.number] = page
+
+    if ocr_pages:
+        logger.info('{0} pages had no extractable text. Trying OCR.'.format(len(ocr_pages)))
+        callback = None
+        if journal:
+            def callback(page_number, text):
+                page = ocr_pages[page_number]
+                journal.recordPage(filename, page._replace(text=page.text + text))
+        texts = ocrPages(filename, sorted(ocr_pages), img_folder, options,
+                         {page.number: page.fingerprint for page in ocr_pages.values()}, callback)
+        for page_number in sorted(ocr_pages):
+            page = ocr_pages[page_number]
+            yield page._replace(text=page.text + texts.get(page_number, ''))
+
+
+def extractPages(document, filename, img_folder, options=DEFAULT_IMPORTOPTIONS, pagenos=None, rsrcmgr=None):
+    """Extract the text of the pages of a PDF document. Pages without
+    extractable text are OCR'ed in one batch after text extraction.
+
+    Args:
+        see iterPages().
+
+    Returns:
+        list (PageText): the text of each page, in page order.
+    """
+
+    return sorted(streamPages(document, filename, img_folder, options, pagenos, rsrcmgr), key=attrgetter('number'))
+
+
+def _extractPageChunk(args):
+    """Extract a chunk of pages in a worker process. The worker opens and
+    parses the PDF file on its own.
+
+    Args:
+        args (tuple): filename, image folder, ImportOptions and the list of
+            zero-based page numbers in the chunk.
+
+    Returns:
+        list (tuple): see extractPages().
+    """
+
+    filename, img_folder, options, pagenos = args
+    metrics.enableMetrics(options.metricsFile)
+    metrics.setFile(filename)
+    with open(filename, 'rb') as fp:
+        with metrics.stage('parse'):
+            document = PDFDocument(PDFParser(fp), '')
+        pages = extractPages(document, filename, img_folder, options, pagenos=set(pagenos))
+    flushImageStore(options)
+    metrics.finishFile(filename, chunk=True)
+
+    return pages
+
+
+def _extractPagesParallel(filename, page_count, img_folder, options):
+    """Split the pages of a PDF file into chunks of options.pageChunkSize
+    pages and extract them on up to options.pageProcesses worker processes.
+
+    Args:
+        filename (str): filename of the document.
+        page_count (int): number of pages in the document.
+        img_folder (str): folder for saved and temporary image files.
+        options (ImportOptions): tuple holding various settings.
+
+    Yields:
+        PageText: the text of each page, in page order.
+    """
+
+    chunks = [list(range(start, min(start + options.pageChunkSize, page_count)))
+              for start in range(0, page_count, options.pageChunkSize)]
+    logger.info("Extracting {0} pages of '{1}' in {2} chunks.".format(page_count, filename, len(chunks)))
+
+    # pool.imap() keeps the chunk order, so pages come back in page order
+    with multiprocessing.Pool(processes=min(options.pageProcesses, len(chunks))) as pool:
+        for chunk in pool.imap(_extractPageChunk, [(filename, img_folder, options, chunk) for chunk in chunks]):
+            yield from chunk
+
+
+def readFromPDF(filename, db, options=DEFAULT_IMPORTOPTIONS, rsrcmgr=None):
     """Extract contents from a PDF file using either text extraction or OCR.
+
+    The text is stored as it comes in if options.storageMode is
+    STORAGE_PAGES, see storeExtracted().
+
+    If options.journalFile is set, the file is marked as completed in the
+    journal of the import job once it is stored or found to be a duplicate.
+    Documents queued with a buffered writer are marked by the writer once
+    they are written, see storeExtracted().
+
+    If options.pageProcesses is larger than 1, documents with more than
+    options.pageChunkSize pages are split into chunks of pages which are
+    processed by several worker processes. This is not possible from within
+    the worker processes of a parallel import, so such documents are then
+    processed serially.
     
     Args:
         filename (str): filename from which to extract content.
         db: a database object.
         options (ImportOptions, optional): tuple holding various settings.
+        rsrcmgr (PDFResourceManager, optional): resource manager to reuse
+            across files. A new one is created if None.
 
     Returns:
         bool: True if at least one character of text was imported,
             False otherwise.
     """
 
-    # Build identifier record for duplicate checking. This could be user-definable.
-    record = {
-            'content_name': os.path.basename(filename), 
-            'filecreated_date': str(datetime.fromtimestamp(os.stat(filename).st_ctime))
-            }
+    metrics.enableMetrics(options.metricsFile)
+    metrics.setFile(filename)
+    record = duplicateRecord(filename)
 
     parsed_ok = False    
     if not documentExists(record, db):
@@ -107,27 +662,12 @@ def readFromPDF(filename, db, options=DEFAULT_IMPORTOPTIONS):
             parser = PDFParser(fp)
     
             # Store the parsed content in PDFDocument object
-            document = PDFDocument(parser, '')
+            with metrics.stage('parse'):
+                document = PDFDocument(parser, '')
     
             # Check if document is extractable, if not abort
             if not document.is_extractable:
                 logger.error("Text extraction not allowed in '{0}'.".format(filename))
-            	
-            # Create PDFResourceManager object that stores shared resources such as fonts or images
-            rsrcmgr = PDFResourceManager()
-            
-            # Set parameters for analysis
-            laparams = LAParams()
-            
-            # Create a PDFDevice object which translates interpreted information into desired format
-            # Device needs to be connected to resource manager to store shared resources
-            # device = PDFDevice(rsrcmgr)
-            # Extract the decive to page aggregator to get LT object elements
-            device = PDFPageAggregator(rsrcmgr, laparams=laparams)
-
-            # Create interpreter object to process page content from PDFDocument
-            # Interpreter needs to be connected to resource manager for shared resources and device 
-            interpreter = PDFPageInterpreter(rsrcmgr, device)
 
             # We might have to save image files, so get a folder name for them.
             img_folder = divineImagefolder(
@@ -136,92 +676,381 @@ def readFromPDF(filename, db, options=DEFAULT_IMPORTOPTIONS):
                 as_subfolder=options.createSubfolders,
                 create=True)
 
-            # Now that we have everything to process a pdf document, lets process it page by page
-            content = ''
-            page_hadextractabletext = []
-            for page_number, page in enumerate(PDFPage.create_pages(document)):
-                logger.info('Extracting text from p. {0}'.format(page_number+1))
-
-                # As the interpreter processes the page stored in PDFDocument object
-                interpreter.process_page(page)
-
-                # The device renders the layout from interpreter
-                layout = device.get_result()
-
-                # Out of the many LT objects within layout, we are interested in LTTextBox and LTTextLine
-                page_text = ''
-
-                # Traverse all objects in the PDF file            
-                for lt_obj in layout:
-                    page_text+= parseLtObjs(
-                            lt_objs=[lt_obj],
-                            src_fullpath=filename,
-                            page_number=page_number,
-                            dst_folder=img_folder,
-                            options=options)
-
-                page_hadextractabletext+= [bool(page_text)]
-
-                # No text will be extracted from an image-only page. In such
-                # cases, try OCR.
-                if not page_hadextractabletext[-1]:
-                    logger.info('Page {0} had no extractable text. Trying OCR.'.format(page_number+1))
-                    page_text+= runOCRonPDF(
-                            filename=filename,
-                            tmp_folder=img_folder,
-                            pages=[page_number],
-                            resolution=options.imageResolution
-                            )
-
-                if page_text:
-                    content+= '\n' + page_text
+            # Daemonic worker processes may not have children of their own
+            page_count = countPages(document)
+            if (options.pageProcesses > 1 and page_count > options.pageChunkSize
+                    and not multiprocessing.current_process().daemon):
+                pages = _extractPagesParallel(filename, page_count, img_folder, options)
+            else:
+                pages = streamPages(document, filename, img_folder, options, rsrcmgr=rsrcmgr)
 
             # Store, finally
-            parsed_ok = storeDocument(content, '|'.join([['OCR', 'Text'][idx] for idx in set(page_hadextractabletext)]), filename, db)
+            parsed_ok = storeExtracted(pages, filename, db, options)
+            flushImageStore(options)
 
-        fp.close()
+            fp.close()
+            if options.journalFile and not (parsed_ok and options.writeBatchSize):
+                openJournal(options.journalFile).finishFile(filename)
     else:
         logger.warning('Possible duplicate database entry found. Content was not stored in database.\nDuplicate information: ' + str(record))
+        if options.journalFile:
+            openJournal(options.journalFile).finishFile(filename)
+
+    metrics.finishFile(filename)
 
     return parsed_ok
 
 
-def importFiles(files, db, options=DEFAULT_IMPORTOPTIONS):
+def _initImportWorker(database_name, collection_name, stats_queue=None):
+    """Set up an import worker process with a database handle and a pdfminer
+    resource manager of its own.
+
+    With a stats queue, the buffered writers of the worker are flushed when
+    the worker exits, and their statistics are put into the queue.
+
+    Args:
+        database_name (str): name of the database to connect to.
+        collection_name (str): name of the collection to store documents in.
+        stats_queue (SimpleQueue, optional): queue for writer statistics.
+
+    Returns:
+        None
+    """
+
+    _worker['client'] = connectClient()
+    _worker['db'] = _worker['client'][database_name][collection_name]
+    _worker['rsrcmgr'] = PDFResourceManager()
+    if stats_queue is not None:
+        Finalize(None, _flushImportWorker, args=(stats_queue,), exitpriority=10)
+
+
+def _flushImportWorker(stats_queue):
+    """Flush the buffered writers of an exiting import worker and report
+    their statistics."""
+    for stats in closeBufferedWriters():
+        stats_queue.put(stats)
+    metrics.finishFile('')
+
+
+def _importWorkerFile(args):
+    """Import a single file in a worker process.
+
+    Args:
+        args (tuple): filename and ImportOptions.
+
+    Returns:
+        tuple: the filename and the result of readFromPDF().
+    """
+
+    filename, options = args
+    logger.info("Processing file: '{0}'".format(filename))
+    return filename, readFromPDF(filename, _worker['db'], options, rsrcmgr=_worker['rsrcmgr'])
+
+
+def _importFilesSerial(files, db, options):
+    """Import files one after the other in the current process.
+
+    Args:
+        files (list): a list of PDF filenames.
+        db: a database collection object.
+        options (ImportOptions): options for importing.
+
+    Yields:
+        tuple: filename and the result of readFromPDF() for each file.
+    """
+
+    rsrcmgr = PDFResourceManager()
+    for f in files:
+        logger.info("Processing file: '{0}'".format(f))
+        yield f, readFromPDF(f, db, options, rsrcmgr=rsrcmgr)
+
+
+def _importFilesParallel(files, db, options, writer_stats=None):
+    """Distribute files across a pool of worker processes and import them.
+
+    With options.writeBatchSize set, the workers write documents through
+    buffered writers, which are flushed when the workers exit.
+
+    Args:
+        files (list): a list of PDF filenames.
+        db: a database collection object.
+        options (ImportOptions): options for importing.
+        writer_stats (list, optional): list to which the statistics of the
+            buffered writers of the workers are appended.
+
+    Yields:
+        tuple: filename and the result of readFromPDF() for each file.
+    """
+
+    files, duplicates = splitDuplicateFiles(files)
+    for f in duplicates:
+        yield f, False
+
+    stats_queue = multiprocessing.SimpleQueue() if options.writeBatchSize else None
+    processes = options.processes or os.cpu_count()
+    with multiprocessing.Pool(
+            processes=min(processes, max(len(files), 1)),
+            initializer=_initImportWorker,
+            initargs=(db.database.name, db.name, stats_queue)) as pool:
+        yield from pool.imap_unordered(_importWorkerFile, [(f, options) for f in files])
+
+        # Let the workers exit normally, so they flush their writers. Their
+        # statistics are read while they exit, since a worker blocks on a
+        # full queue and could not be joined otherwise.
+        pool.close()
+        if stats_queue is not None:
+            drainer = threading.Thread(target=_drainStats, args=(stats_queue, writer_stats))
+            drainer.start()
+        pool.join()
+        if stats_queue is not None:
+            stats_queue.put(None)
+            drainer.join()
+
+
+def _drainStats(stats_queue, writer_stats=None):
+    """Read writer statistics from a queue until None comes in."""
+    for stats in iter(stats_queue.get, None):
+        if writer_stats is not None:
+            writer_stats.append(stats)
+
+
+def _importWatchedFile(filename, options, database_name, collection_name):
+    """Import a single file in a watched child process.
+
+    Args:
+        filename (str): the PDF file to import.
+        options (ImportOptions): options for importing.
+        database_name (str): name of the database to connect to.
+        collection_name (str): name of the collection to store documents in.
+
+    Returns:
+        bool: the result of readFromPDF().
+    """
+
+    _initImportWorker(database_name, collection_name)
+    logger.info("Processing file: '{0}'".format(filename))
+    return readFromPDF(filename, _worker['db'], options, rsrcmgr=_worker['rsrcmgr'])
+
+
+def _importFilesWatched(files, db, options, failed):
+    """Import every file in a child process of its own which is abandoned
+    when the file exceeds options.fileTimeout or one of its pages exceeds
+    options.pageTimeout. In IMPORTMODE_PROCESSES, up to options.processes
+    children run at the same time.
+
+    Args:
+        files (list): a list of PDF filenames.
+        db: a database collection object.
+        options (ImportOptions): options for importing.
+        failed (list): list to which (filename, reason) tuples of abandoned
+            files are appended.
+
+    Yields:
+        tuple: filename and the result of readFromPDF() for each file.
+    """
+
+    files, duplicates = splitDuplicateFiles(files)
+    for f in duplicates:
+        yield f, False
+
+    if options.importMode == IMPORTMODE_PROCESSES:
+        processes = options.processes or os.cpu_count()
+    else:
+        processes = 1
+
+    # Every child imports a single file, so there is nothing to buffer
+    options = options._replace(writeBatchSize=0)
+    jobs = ((f, (f, options, db.database.name, db.name)) for f in files)
+    for f, imported, reason in runWatched(jobs, _importWatchedFile, processes, options.fileTimeout, options.pageTimeout):
+        if reason:
+            recordFailure(f, reason, failed, options)
+        yield f, bool(imported)
+
+
+def recordFailure(filename, reason, failed=None, options=DEFAULT_IMPORTOPTIONS):
+    """Record a file which could not be imported. The file is logged, added
+    to the list of failures and appended to options.failedLog, if set.
+
+    Args:
+        filename (str): the file which failed.
+        reason (str): why the file failed.
+        failed (list, optional): list to which a (filename, reason) tuple is
+            appended.
+        options (ImportOptions, optional): options for importing.
+
+    Returns:
+        None
+    """
+
+    logger.warning("Import of '{0}' abandoned: {1}".format(filename, reason))
+    if failed is not None:
+        failed.append((filename, reason))
+    if options.failedLog:
+        writeFile(options.failedLog, '{0}\t{1}\t{2}\n'.format(datetime.now(), filename, reason), flags='a')
+
+
+def importFiles(files, db, options=DEFAULT_IMPORTOPTIONS, failed=None):
     """Iterate through a list of files, extract their content and store those
     in a database.
+
+    With options.importMode set to IMPORTMODE_PROCESSES, the files are handed
+    to a pool of options.processes worker processes (all cores if None), each
+    holding its own database connection. IMPORTMODE_PIPELINE runs the files
+    through the staged pipeline of lib.pipeline instead.
+
+    If options.fileTimeout or options.pageTimeout is set, every file is
+    imported in a watched child process and abandoned when it exceeds its
+    time budget, so a single pathological file cannot stall the batch. The
+    pipeline mode does not support time budgets; they are ignored with a
+    warning.
+
+    If options.journalFile is set, files completed by an earlier run of the
+    same import job are skipped, and interrupted files are resumed with the
+    pages recorded in the journal, see streamPages().
+
+    If options.writeBatchSize is set, documents are written in bulk by
+    buffered writers. Files whose documents turn out to be duplicates are
+    not counted; failed writes are recorded like abandoned files. Files
+    are only recorded in the manifest once the writers have been flushed,
+    so files whose documents were lost with an interrupted run are imported
+    again. The watched import writes every document directly.
+
+    If options.metricsFile is set, stage timings and counters are written to
+    the metrics file for every file, and a summary of the run is logged, see
+    lib.metrics.
+
+    If options.manifestFile is set, the outcome for every file is recorded
+    in the import manifest. Abandoned files are marked as failed, so they
+    are retried by the next importFolder() run.
+
+    With options.ocrMode set to OCRMODE_MEMORY, pages are only passed to
+    Tesseract in memory if tesserocr is installed; otherwise a warning is
+    logged, see ocrPages().
+
+    With options.termCounts set, an empty collection gets a corpus view,
+    which is kept up to date as documents are stored, see lib.corpus_view.
     
     Args:
         files (list): a list of filenames from which to extract content.
         db: a database object.
         options (ImportOptions): options for importing.
+        failed (list, optional): list to which (filename, reason) tuples of
+            abandoned files are appended.
     
     Returns:
         int: the number of imported files
     """
 
-    count_imported = 0
+    pdffiles = []
     for f in files:
         ext = os.path.splitext(f)
         if ext and (ext[-1].casefold() in constants.FILEEXT_PDF):
-            logger.info("Processing file: '{0}'".format(f))
-            count_imported+= readFromPDF(f, db, options)
+            pdffiles.append(f)
         else:
-            logger.warning("'{0}' files are currently not supported.".format(ext.uppper()))
+            logger.warning("'{0}' files are currently not supported.".format(ext[-1].upper()))
+
+    if options.journalFile:
+        completed = openJournal(options.journalFile).completed()
+        resumed = len(pdffiles)
+        pdffiles = [f for f in pdffiles if os.path.abspath(f) not in completed]
+        resumed-= len(pdffiles)
+        if resumed:
+            logger.info('Skipping {0} files completed by this import job before.'.format(resumed))
+
+    if options.termCounts:
+        initCorpusView(db)
+    if options.ocrMode == OCRMODE_MEMORY and loadTesserocr() is None:
+        logger.warning('tesserocr is not installed. OCR in memory falls back to pytesseract, '
+                       'which passes every page to Tesseract through a temporary file.')
+
+    run_start = time.time()
+    metrics.enableMetrics(options.metricsFile)
+    failures = failed if failed is not None else []
+    previous_failures = len(failures)
+    writer_stats = []
+    if options.importMode == IMPORTMODE_PIPELINE:
+        # Imported here, since lib.pipeline builds on this module
+        from lib.pipeline import ImportPipeline
+        if options.fileTimeout or options.pageTimeout:
+            logger.warning('The pipeline import does not support time budgets. '
+                           'fileTimeout and pageTimeout are ignored.')
+        results = ImportPipeline(db, options).run(pdffiles)
+    elif options.fileTimeout or options.pageTimeout:
+        results = _importFilesWatched(pdffiles, db, options, failures)
+    elif options.importMode == IMPORTMODE_PROCESSES and pdffiles:
+        results = _importFilesParallel(pdffiles, db, options, writer_stats)
+    else:
+        results = _importFilesSerial(pdffiles, db, options)
+
+    manifest = ImportManifest(options.manifestFile) if options.manifestFile else None
+    count_imported = 0
+    queued = []
+    for f, imported in results:
+        count_imported+= imported
+        if imported and options.writeBatchSize:
+            queued.append(f)
+        elif manifest:
+            manifest.record(f, STATUS_IMPORTED if imported else STATUS_SKIPPED)
+
+    # Documents queued with buffered writers count as imported until the
+    # writers report them as duplicates or failures. The writers forget
+    # failed files in the journal themselves.
+    if options.writeBatchSize:
+        unwritten = set()
+        for stats in writer_stats + closeBufferedWriters():
+            count_imported-= len(stats['duplicates']) + len(stats['failed'])
+            unwritten.update(stats['duplicates'])
+            for f in stats['duplicates']:
+                if manifest:
+                    manifest.record(f, STATUS_SKIPPED)
+            for f, reason in stats['failed']:
+                unwritten.add(f)
+                recordFailure(f, reason, failures, options)
+        if manifest:
+            for f in queued:
+                if f not in unwritten:
+                    manifest.record(f, STATUS_IMPORTED)
+
+    if manifest:
+        for f, reason in failures[previous_failures:]:
+            manifest.record(f, STATUS_FAILED)
+        manifest.close()
+
+    if options.ocrCacheFile:
+        logger.info('OCR cache statistics: {0}'.format(openOCRCache(options.ocrCacheFile, options.ocrCacheSize).stats()))
+
+    if options.metricsFile:
+        logger.info('Import metrics:\n' + metrics.formatSummary(metrics.summarizeMetrics(run_start)))
 
     return count_imported
 
 
-def importFolder(folder, db, options=DEFAULT_IMPORTOPTIONS):
+def importFolder(folder, db, options=DEFAULT_IMPORTOPTIONS, failed=None):
     """Iterates through a folder, extracts file content and store those
     in a database.
+
+    If options.manifestFile is set, the files are first compared against the
+    import manifest and only new, modified and previously failed files are
+    imported. The changes since the last run are logged, and files which
+    went missing are removed from the manifest.
     
     Args:
         folder (str): a folder containing the files from which to extract content.
         db: a database object.
         options (ImportOptions): options for importing.
+        failed (list, optional): list to which (filename, reason) tuples of
+            abandoned files are appended.
             
     Returns:
         int: the number of imported files
     """
     files = collectFiles(folder, '\.pdf$')
-    return importFiles(files, db, options)
+    if options.manifestFile:
+        manifest = ImportManifest(options.manifestFile)
+        plan = manifest.plan(files, folder)
+        manifest.forget(plan.missing)
+        manifest.close()
+        logger.info('Changes since last import:\n' + changeReport(plan))
+        files = plan.new + plan.modified + plan.retry
+
+    return importFiles(files, db, options, failed)
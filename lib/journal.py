@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""Journal of the progress of an import job.
+
+An import job records its progress in an sqlite file: which files are
+completed, and the text of every page extracted or OCR'ed so far for the
+files in progress. Running the import again with the same journal resumes
+the job. Completed files are skipped, and files which were interrupted
+continue with the first page not in the journal, so neither extraction nor
+OCR is repeated. Page texts are dropped from the journal once their
+document is stored.
+
+Documents stored page by page have the identifier of their document
+recorded as well. A resumed file reuses it, so the page records written by
+the interrupted run can be replaced instead of being left behind.
+
+Every page is committed as soon as it is recorded, so a job which is killed
+loses at most the pages being processed at that moment. Several processes
+may write to one journal.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import logging, os, sqlite3, threading, time
+
+# Local modules and packages
+from lib.import_conf import DEFAULT_LOGNAME
+
+# Constants and other objects
+DEFAULT_JOURNAL_TIMEOUT = 30
+logger = logging.getLogger(DEFAULT_LOGNAME)
+
+# Status of a file in the journal
+JOURNAL_STARTED = 'started'
+JOURNAL_DONE = 'done'
+
+# The journals opened by this process, see openJournal()
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+# Classes
+class ImportJournal:
+    """The journal of an import job in an sqlite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=DEFAULT_JOURNAL_TIMEOUT, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, status TEXT, updated REAL)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS pages (path TEXT, page INTEGER, text TEXT, hadtext INTEGER, fingerprint TEXT, pagetype TEXT, '
+                              'PRIMARY KEY (path, page))')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS documents (path TEXT PRIMARY KEY, document_id TEXT)')
+
+
+    def completed(self):
+        """List the files completed by the job.
+
+        Returns:
+            set (str): absolute paths of the completed files.
+        """
+
+        with self.lock:
+            return {row[0] for row in self.conn.execute('SELECT path FROM files WHERE status = ?', (JOURNAL_DONE,))}
+
+
+    def pages(self, filename):
+        """Return the pages of a file recorded so far.
+
+        Args:
+            filename (str): the file.
+
+        Returns:
+            dict: page numbers and tuples of page number, text, whether the
+                page had extractable text, fingerprint and page type.
+        """
+
+        with self.lock:
+            rows = self.conn.execute('SELECT page, text, hadtext, fingerprint, pagetype FROM pages WHERE path = ?',
+                                     (os.path.abspath(filename),)).fetchall()
+
+        return {row[0]: (row[0], row[1], bool(row[2]), row[3], row[4]) for row in rows}
+
+
+    def documentId(self, filename):
+        """Return the identifier of the document of a file recorded so far.
+
+        Args:
+            filename (str): the file.
+
+        Returns:
+            str: the identifier, or None if none was recorded.
+        """
+
+        with self.lock:
+            row = self.conn.execute('SELECT document_id FROM documents WHERE path = ?', (os.path.abspath(filename),)).fetchone()
+
+        return row[0] if row else None
+
+
+    def recordDocument(self, filename, document_id):
+        """Record the identifier of the document of a file before any of its
+        pages are stored.
+
+        Args:
+            filename (str): the file.
+            document_id: the identifier, stored as a str.
+
+        Returns:
+            None
+        """
+
+        path = os.path.abspath(filename)
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO files VALUES (?, ?, ?)', (path, JOURNAL_STARTED, time.time()))
+            self.conn.execute('INSERT OR REPLACE INTO documents VALUES (?, ?)', (path, str(document_id)))
+
+
+    def recordPage(self, filename, page):
+        """Record the completed text of a page.
+
+        Args:
+            filename (str): the file.
+            page (tuple): page number, text, whether the page had extractable
+                text, fingerprint and page type, e.g. a PageText.
+
+        Returns:
+            None
+        """
+
+        path = os.path.abspath(filename)
+        number, text, hadtext, fingerprint, pagetype = page
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO files VALUES (?, ?, ?)', (path, JOURNAL_STARTED, time.time()))
+            self.conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)', (path, number, text, int(hadtext), fingerprint, pagetype))
+
+
+    def finishFile(self, filename):
+        """Mark a file as completed and drop its page texts and document
+        identifier.
+
+        Args:
+            filename (str): the file.
+
+        Returns:
+            None
+        """
+
+        path = os.path.abspath(filename)
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (path, JOURNAL_DONE, time.time()))
+            self.conn.execute('DELETE FROM pages WHERE path = ?', (path,))
+            self.conn.execute('DELETE FROM documents WHERE path = ?', (path,))
+
+
+    def forgetFile(self, filename):
+        """Remove a file from the journal, so it is imported from scratch by
+        the next run, e.g. because storing its document failed.
+
+        Args:
+            filename (str): the file.
+
+        Returns:
+            None
+        """
+
+        path = os.path.abspath(filename)
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM files WHERE path = ?', (path,))
+            self.conn.execute('DELETE FROM pages WHERE path = ?', (path,))
+            self.conn.execute('DELETE FROM documents WHERE path = ?', (path,))
+
+
+# Function definitions
+def openJournal(path):
+    """Return the journal in a file, opening it on first use in the current
+    process. Connections are not shared with forked children.
+
+    Args:
+        path (str): the journal file.
+
+    Returns:
+        ImportJournal: the journal.
+    """
+
+    key = (os.getpid(), path)
+    with _journals_lock:
+        if key not in _journals:
+            _journals[key] = ImportJournal(path)
+
+    return _journals[key]
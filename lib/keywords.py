@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Keyword extraction by TF-IDF over a document-term matrix.
+
+Words are weighted by their frequency in a document times their inverse
+document frequency in the corpus, so that words common to all documents
+rank low and words distinctive for a document rank high. The weights of all
+documents are computed at once by array operations on the CSR arrays of a
+lib.dtm.DocumentTermMatrix, and so is the selection of the top words.
+
+The keywords are returned as dicts of words and weights, which can be
+passed to wordcloud_helper.createWordcloud() like the frequencies of
+bagofwords.collectFrequencies().
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import logging, re
+
+# Third party modules and packages
+import numpy as np
+
+# Local modules and packages
+from lib.import_conf import DEFAULT_LOGNAME
+from lib.txt_helper import loadStopwords, DEFAULT_STOPWORDS
+
+# Constants and other objects
+DEFAULT_DOCUMENT_KEYWORDS = 20
+DEFAULT_CORPUS_KEYWORDS = 100
+logger = logging.getLogger(DEFAULT_LOGNAME)
+
+
+# Function definitions
+def termMask(matrix, stopwords=DEFAULT_STOPWORDS):
+    """Tell which columns of a matrix are not stopwords.
+
+    Args:
+        matrix (DocumentTermMatrix): the matrix.
+        stopwords (str|list, optional): names or paths of the stopword
+            lists, see txt_helper.loadStopwords().
+
+    Returns:
+        ndarray: a bool per column, False for stopwords.
+    """
+
+    words = loadStopwords(stopwords)
+    return np.fromiter((term not in words for term in matrix.terms), dtype=bool, count=len(matrix.terms))
+
+
+def rowNumbers(indptr):
+    """Return the row of every stored entry of a CSR matrix."""
+    return np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+
+def sourceRows(matrix, pattern, flags=re.IGNORECASE):
+    """Select the documents of a matrix by their content source, like the
+    filter {'content_source': {'$regex': pattern, '$options': 'i'}}.
+
+    Args:
+        matrix (DocumentTermMatrix): the matrix.
+        pattern (str): regular expression searched for in the sources.
+        flags (int, optional): flags of the regular expression.
+
+    Returns:
+        ndarray: the selected rows.
+    """
+
+    pattern = re.compile(pattern, flags)
+    return np.flatnonzero([bool(source and pattern.search(source)) for source in matrix.sources])
+
+
+def tfidfWeights(matrix, stopwords=DEFAULT_STOPWORDS, sublinear=False, normalize=True):
+    """Compute the TF-IDF weight of every entry of a document-term matrix.
+
+    The term frequency is the relative frequency of a word in a document,
+    or 1 + log(count) with sublinear set. The inverse document frequency is
+    log((1 + n) / (1 + df)) + 1 for n documents, df of which contain the
+    word. Stopwords get a weight of 0.
+
+    Args:
+        matrix (DocumentTermMatrix): the matrix.
+        stopwords (str|list, optional): names or paths of the stopword
+            lists, see txt_helper.loadStopwords().
+        sublinear (bool, optional): dampen the counts logarithmically.
+        normalize (bool, optional): scale the weights of every document to
+            a Euclidean length of 1, so that long and short documents
+            weigh the same.
+
+    Returns:
+        ndarray: the weights, in the order of the entries of the matrix.
+    """
+
+    data, indices, indptr = matrix.arrays()
+    rows = rowNumbers(indptr)
+    keep = termMask(matrix, stopwords)[indices]
+
+    df = np.bincount(indices[keep], minlength=len(matrix.terms))
+    idf = np.log((1 + len(matrix)) / (1 + df)) + 1
+
+    counts = np.where(keep, data, 0).astype(np.float64)
+    if sublinear:
+        tf = np.log(counts, out=np.zeros_like(counts), where=counts > 0)
+        tf[counts > 0]+= 1
+    else:
+        totals = np.bincount(rows, weights=counts, minlength=len(matrix))
+        tf = np.divide(counts, totals[rows], out=np.zeros_like(counts), where=totals[rows] > 0)
+    weights = tf * idf[indices]
+
+    if normalize:
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(matrix)))
+        weights = np.divide(weights, norms[rows], out=np.zeros_like(weights), where=norms[rows] > 0)
+
+    return weights
+
+
+def documentKeywords(matrix, k=DEFAULT_DOCUMENT_KEYWORDS, rows=None, stopwords=DEFAULT_STOPWORDS, sublinear=False):
+    """Find the words of the highest TF-IDF weight in every document.
+
+    Args:
+        matrix (DocumentTermMatrix): the matrix.
+        k (int, optional): number of keywords per document.
+        rows (array, optional): rows of the documents, e.g. from
+            sourceRows(). All documents if None.
+        stopwords (str|list, optional): names or paths of the stopword
+            lists, see txt_helper.loadStopwords().
+        sublinear (bool, optional): see tfidfWeights().
+
+    Returns:
+        dict: document ids and dicts of their keywords and weights, in
+            descending order of weight.
+    """
+
+    data, indices, indptr = matrix.arrays()
+    weights = tfidfWeights(matrix, stopwords, sublinear)
+    entries = rowNumbers(indptr)
+    selected = weights > 0
+    if rows is not None:
+        selected&= np.isin(entries, rows)
+
+    # Sort the entries by row and descending weight, then keep those ranked
+    # below k within their row
+    entries, columns, weights = entries[selected], indices[selected], weights[selected]
+    order = np.lexsort((-weights, entries))
+    entries, columns, weights = entries[order], columns[order], weights[order]
+    starts = np.searchsorted(entries, entries)
+    top = np.arange(len(entries)) - starts < k
+    entries, columns, weights = entries[top], columns[top], weights[top]
+
+    keywords = {matrix.documents[row]: {} for row in (range(len(matrix)) if rows is None else rows)}
+    for row, column, weight in zip(entries.tolist(), columns.tolist(), weights.tolist()):
+        keywords[matrix.documents[row]][matrix.terms[column]] = weight
+
+    return keywords
+
+
+def corpusKeywords(matrix, k=DEFAULT_CORPUS_KEYWORDS, rows=None, stopwords=DEFAULT_STOPWORDS, sublinear=False):
+    """Find the words of the highest TF-IDF weight summed over documents.
+    With the weights of every document normalized, each document has the
+    same say, as in bagofwords.collectFrequencies().
+
+    Args:
+        matrix (DocumentTermMatrix): the matrix.
+        k (int, optional): number of keywords.
+        rows (array, optional): rows of the documents, e.g. from
+            sourceRows(). All documents if None.
+        stopwords (str|list, optional): names or paths of the stopword
+            lists, see txt_helper.loadStopwords().
+        sublinear (bool, optional): see tfidfWeights().
+
+    Returns:
+        dict: the keywords and their weights, in descending order of
+            weight.
+    """
+
+    data, indices, indptr = matrix.arrays()
+    weights = tfidfWeights(matrix, stopwords, sublinear)
+    if rows is not None:
+        selected = np.isin(rowNumbers(indptr), rows)
+        indices, weights = indices[selected], weights[selected]
+
+    scores = np.bincount(indices, weights=weights, minlength=len(matrix.terms))
+    top = np.flatnonzero(scores > 0)
+    if len(top) > k:
+        top = top[np.argpartition(-scores[top], k - 1)[:k]]
+    top = top[np.argsort(-scores[top], kind='stable')]
+
+    return {matrix.terms[column]: float(scores[column]) for column in top}
+
+
+if __name__ == '__main__':
+    import argparse
+    from lib.dtm import DocumentTermMatrix
+
+    parser = argparse.ArgumentParser(description='List the keywords of a document-term matrix, see lib.dtm.')
+    parser.add_argument('folder', help='folder of the matrix')
+    parser.add_argument('--top', type=int, default=DEFAULT_DOCUMENT_KEYWORDS, help='number of keywords')
+    parser.add_argument('--source', help='regular expression selecting documents by content source')
+    parser.add_argument('--documents', action='store_true', help='list the keywords of every document')
+    parser.add_argument('--stopwords', nargs='+', default=DEFAULT_STOPWORDS, help='names or paths of the stopword lists')
+    args = parser.parse_args()
+
+    matrix = DocumentTermMatrix.load(args.folder)
+    rows = sourceRows(matrix, args.source) if args.source else None
+    if args.documents:
+        for document_id, keywords in documentKeywords(matrix, args.top, rows, args.stopwords).items():
+            print('{0}: {1}'.format(document_id, ', '.join(keywords)))
+    else:
+        for word, weight in corpusKeywords(matrix, args.top, rows, args.stopwords).items():
+            print('{0:<30} {1:.4f}'.format(word, weight))
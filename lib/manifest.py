@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""Local manifest of imported files.
+
+The manifest is an sqlite file recording the path, size, modification time,
+content hash and import status of every file seen by an import. Before a
+folder is imported, its files are compared against the manifest without any
+database queries: files whose size and modification time are unchanged are
+skipped in bulk. If only the modification time differs, the content hash
+decides whether the file really changed.
+
+Files whose import failed are retried on the next run.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import hashlib, logging, os, sqlite3
+from collections import namedtuple
+
+# Local modules and packages
+from lib.import_conf import DEFAULT_LOGNAME
+
+# Constants and other objects
+DEFAULT_MANIFEST_TIMEOUT = 30
+DEFAULT_COMMIT_INTERVAL = 100
+HASH_BLOCKSIZE = 1024 * 1024
+logger = logging.getLogger(DEFAULT_LOGNAME)
+
+# Import status of a file
+STATUS_IMPORTED = 'imported'
+STATUS_SKIPPED = 'skipped'
+STATUS_FAILED = 'failed'
+
+# Comparison of a list of files against the manifest. Files are new, modified
+# since they were recorded, unchanged, or to be retried after a failure.
+# Missing files are recorded in the manifest but no longer present.
+ManifestPlan = namedtuple('ManifestPlan', ['new', 'modified', 'unchanged', 'retry', 'missing'])
+
+
+# Classes
+class ImportManifest:
+    """The import manifest in an sqlite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = 0
+        self.hashes = {}
+        self.conn = sqlite3.connect(path, timeout=DEFAULT_MANIFEST_TIMEOUT)
+        with self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, hash TEXT, status TEXT)')
+
+
+    def plan(self, files, folder=None):
+        """Compare a list of files against the manifest.
+
+        Args:
+            files (list): the filenames.
+            folder (str, optional): the folder the files were collected from.
+                Recorded files in this folder which are not in the list are
+                reported as missing. No files are missing if None.
+
+        Returns:
+            ManifestPlan: the files sorted by their state.
+        """
+
+        plan = ManifestPlan([], [], [], [], [])
+        known = {row[0]: row[1:] for row in self.conn.execute('SELECT path, size, mtime, hash, status FROM files')}
+        seen = set()
+        for f in files:
+            path = os.path.abspath(f)
+            seen.add(path)
+            if path not in known:
+                plan.new.append(f)
+                continue
+
+            size, mtime, digest, status = known[path]
+            stat = os.stat(path)
+            if stat.st_size != size:
+                plan.modified.append(f)
+            elif stat.st_mtime != mtime and self.fileHash(path) != digest:
+                plan.modified.append(f)
+            elif status == STATUS_FAILED:
+                plan.retry.append(f)
+            else:
+                if stat.st_mtime != mtime:
+                    # Touched, but identical content
+                    self.record(f, status)
+                plan.unchanged.append(f)
+
+        if folder is not None:
+            prefix = os.path.join(os.path.abspath(folder), '')
+            plan.missing.extend(p for p in known if p.startswith(prefix) and p not in seen)
+        self.commit()
+
+        return plan
+
+
+    def fileHash(self, path):
+        """Compute the SHA-256 hash of a file. Hashes are remembered until
+        the file is recorded, so no file is read twice.
+
+        Args:
+            path (str): absolute path to the file.
+
+        Returns:
+            str: hexadecimal hash of the file content.
+        """
+
+        if path not in self.hashes:
+            sha = hashlib.sha256()
+            with open(path, 'rb') as fp:
+                for block in iter(lambda: fp.read(HASH_BLOCKSIZE), b''):
+                    sha.update(block)
+            self.hashes[path] = sha.hexdigest()
+
+        return self.hashes[path]
+
+
+    def record(self, filename, status):
+        """Record the current state of a file and its import status. Changes
+        are committed in batches, see commit().
+
+        Args:
+            filename (str): the file.
+            status (str): one of the STATUS_* constants.
+
+        Returns:
+            None
+        """
+
+        path = os.path.abspath(filename)
+        try:
+            stat = os.stat(path)
+            digest = self.fileHash(path)
+        except OSError as e:
+            logger.warning("Cannot record '{0}' in import manifest: {1}".format(filename, e))
+            return
+
+        self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)', (path, stat.st_size, stat.st_mtime, digest, status))
+        self.hashes.pop(path, None)
+        self.pending+= 1
+        if self.pending >= DEFAULT_COMMIT_INTERVAL:
+            self.commit()
+
+
+    def forget(self, paths):
+        """Remove files from the manifest, e.g. files which went missing.
+
+        Args:
+            paths (list): the files.
+
+        Returns:
+            None
+        """
+
+        self.conn.executemany('DELETE FROM files WHERE path = ?', [(os.path.abspath(p),) for p in paths])
+        self.commit()
+
+
+    def commit(self):
+        """Commit recorded changes to the manifest file."""
+        self.conn.commit()
+        self.pending = 0
+
+
+    def close(self):
+        """Commit recorded changes and close the manifest file."""
+        self.commit()
+        self.conn.close()
+
+
+# Function definitions
+def changeReport(plan):
+    """Summarize the changes since the last run.
+
+    Args:
+        plan (ManifestPlan): the result of ImportManifest.plan().
+
+    Returns:
+        str: a report listing new, modified, missing and retried files.
+    """
+
+    lines = ['{0} new, {1} modified, {2} missing, {3} to retry, {4} unchanged files.'.format(
+            len(plan.new), len(plan.modified), len(plan.missing), len(plan.retry), len(plan.unchanged))]
+    for label, files in [('New', plan.new), ('Modified', plan.modified), ('Missing', plan.missing), ('Retry', plan.retry)]:
+        lines.extend('{0}: {1}'.format(label, f) for f in files)
+
+    return '\n'.join(lines)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""Timing and throughput instrumentation for the import.
+
+Code on the import path wraps its stages in stage() and counts pages, OCR
+runs and bytes written with count(). The figures are collected per file and
+written as one JSON line per file to the metrics file once the file is
+done, see finishFile(). At the end of a run, summarizeMetrics() adds up the
+lines of the run.
+
+Instrumentation is off until enableMetrics() is called with a file name,
+and again after it is called with None, as every import does without a
+metrics file. While it is off, stage() returns a shared no-op context manager and count()
+returns at once, so the cost is a function call and a test per call.
+
+Every record holds the time it was written, the process id and a type:
+    'file': stages and counters of a file, or of a chunk of its pages
+        processed by a worker process ('chunk' is then true). Figures not
+        attributed to any file, e.g. of the final bulk write, are written
+        under the empty file name.
+    'summary': the totals of a run.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import contextlib, json, logging, os, threading, time
+
+# Local modules and packages
+from lib.import_conf import DEFAULT_LOGNAME
+
+# Constants and other objects
+logger = logging.getLogger(DEFAULT_LOGNAME)
+
+# The metrics file of this process, None while instrumentation is off
+_path = None
+
+# Figures collected so far, by file. Figures outside of any file are
+# collected under the empty name.
+_files = {}
+_lock = threading.Lock()
+_local = threading.local()
+_nullstage = contextlib.nullcontext()
+
+
+# Classes
+class _Stage:
+    """Context manager adding the time spent in it to a stage."""
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            stages = _figures()['stages']
+            total = stages.setdefault(self.name, [0, 0.0])
+            total[0]+= 1
+            total[1]+= elapsed
+        return False
+
+
+# Function definitions
+def enableMetrics(path):
+    """Switch instrumentation on or off for the current process. Figures
+    collected before it is switched off are discarded.
+
+    Args:
+        path (str): the metrics file, to which JSON lines are appended, or
+            None to switch instrumentation off.
+
+    Returns:
+        None
+    """
+
+    global _path
+    _path = path or None
+    if _path is None:
+        with _lock:
+            _files.clear()
+
+
+def metricsEnabled():
+    """Tell whether instrumentation is on."""
+    return _path is not None
+
+
+def _figures():
+    """Return the figures of the current file of the calling thread. Must
+    be called with _lock held."""
+    name = getattr(_local, 'file', '')
+    if name not in _files:
+        _files[name] = {'stages': {}, 'counters': {}}
+    return _files[name]
+
+
+def setFile(filename):
+    """Attribute the figures collected by the calling thread to a file.
+
+    Args:
+        filename (str): the file, or None to stop attributing to a file.
+
+    Returns:
+        None
+    """
+
+    if _path is not None:
+        _local.file = filename or ''
+
+
+def stage(name):
+    """Time a stage of the import.
+
+    Args:
+        name (str): name of the stage.
+
+    Returns:
+        a context manager.
+    """
+
+    if _path is None:
+        return _nullstage
+    return _Stage(name)
+
+
+def count(name, n=1):
+    """Add to a counter.
+
+    Args:
+        name (str): name of the counter.
+        n (int, optional): the amount to add.
+
+    Returns:
+        None
+    """
+
+    if _path is None:
+        return
+    with _lock:
+        counters = _figures()['counters']
+        counters[name] = counters.get(name, 0) + n
+
+
+def _writeRecord(record):
+    """Append a record to the metrics file as a single JSON line."""
+    record['time'] = time.time()
+    record['pid'] = os.getpid()
+    line = json.dumps(record) + '\n'
+    with _lock, open(_path, 'a', encoding='utf-8') as fw:
+        fw.write(line)
+
+
+def finishFile(filename, chunk=False):
+    """Write the figures collected for a file to the metrics file and
+    discard them.
+
+    Args:
+        filename (str): the file.
+        chunk (bool, optional): whether the figures cover only a chunk of the
+            pages of the file.
+
+    Returns:
+        None
+    """
+
+    if _path is None:
+        return
+    with _lock:
+        figures = _files.pop(filename, None)
+    if figures:
+        record = {'type': 'file', 'file': filename}
+        if chunk:
+            record['chunk'] = True
+        record.update(figures)
+        _writeRecord(record)
+    if getattr(_local, 'file', '') == filename:
+        _local.file = ''
+
+
+def summarizeMetrics(since, write=True):
+    """Add up the records written to the metrics file since a point in time.
+
+    Args:
+        since (float): start of the run as returned by time.time().
+        write (bool, optional): whether to append the summary to the metrics
+            file as well.
+
+    Returns:
+        dict: number of files, wall time, total time and number of runs per
+            stage, the sum of each counter and the pages per second. None if
+            instrumentation is off.
+    """
+
+    if _path is None:
+        return None
+
+    # Figures not attributed to any file belong to the summary as well
+    finishFile('')
+
+    stages, counters, files = {}, {}, set()
+    try:
+        with open(_path, 'r', encoding='utf-8') as fr:
+            for line in fr:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('time', 0) < since or record.get('type') == 'summary':
+                    continue
+                if record.get('type') == 'file' and record.get('file'):
+                    files.add(record['file'])
+                for name, (n, seconds) in record.get('stages', {}).items():
+                    total = stages.setdefault(name, [0, 0.0])
+                    total[0]+= n
+                    total[1]+= seconds
+                for name, value in record.get('counters', {}).items():
+                    counters[name] = counters.get(name, 0) + value
+    except IOError as e:
+        logger.error(e)
+
+    wall = time.time() - since
+    summary = {
+            'type': 'summary',
+            'files': len(files),
+            'wall': wall,
+            'stages': stages,
+            'counters': counters,
+            'pages_per_sec': counters.get('pages', 0) / wall if wall > 0 else None
+            }
+    if write:
+        _writeRecord(summary)
+
+    return summary
+
+
+def formatSummary(summary):
+    """Render a summary as text for the log.
+
+    Args:
+        summary (dict): the result of summarizeMetrics().
+
+    Returns:
+        str: one line per stage and counter.
+    """
+
+    lines = ['{0} files in {1:.1f} s, {2:.2f} pages/s'.format(summary['files'], summary['wall'], summary['pages_per_sec'] or 0)]
+    for name, (n, seconds) in sorted(summary['stages'].items(), key=lambda item: -item[1][1]):
+        lines.append('  {0:<12} {1:>10.2f} s {2:>8d} x'.format(name, seconds, n))
+    for name, value in sorted(summary['counters'].items()):
+        lines.append('  {0:<12} {1:>10}'.format(name, value))
+
+    return '\n'.join(lines)
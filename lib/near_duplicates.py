@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""Detection of near-duplicate documents by MinHash and locality-sensitive
+hashing (LSH).
+
+A document is broken into shingles, i.e. runs of DEFAULT_SHINGLE_SIZE
+consecutive words, and summarized by a MinHash signature: for each of
+DEFAULT_PERMUTATIONS random hash functions, the smallest hash of any of its
+shingles. The share of equal values in the signatures of two documents
+estimates the Jaccard similarity of their shingles.
+
+The signature is cut into DEFAULT_BANDS bands, and every band is hashed to a
+key. Documents sharing a band key are candidates, whose similarity is then
+estimated from their signatures. With 16 bands of 8 values, pairs with a
+similarity of 0.9 become candidates with a probability of over 99.9%, pairs
+with a similarity of 0.8 of about 95% and pairs with a similarity of 0.5 of
+about 6%. Finding the near-duplicates of a document thus takes one indexed
+query, however many documents there are.
+
+The band keys and signatures are kept in the sub-collection minhash of the
+document collection, and the signature of a document also in its
+MINHASH_FIELD, so the index can be rebuilt without reading the text. A
+document found to be a near-duplicate of earlier
+documents gets the DUPLICATE_FIELD, holding the id of the first document of
+its cluster, so near-duplicates can be excluded by a filter.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import functools, hashlib, logging, zlib
+
+# Local modules and packages
+import lib.db_conf as dbc
+from lib.import_conf import DEFAULT_LOGNAME
+from lib.txt_helper import tokenizeText
+
+# Third party modules and packages
+if dbc.DB_USE_BACKEND == dbc.DB_BACKEND_MONGO:
+    from pymongo import ASCENDING
+
+# Constants and other objects
+DEFAULT_BANDS = 16
+DEFAULT_DUPLICATE_THRESHOLD = 0.8
+DEFAULT_PERMUTATIONS = 128
+DEFAULT_SHINGLE_SIZE = 5
+DUPLICATE_FIELD = 'near_duplicate_of'
+MINHASH_CHUNKSIZE = 4096
+MINHASH_COLLECTION = 'minhash'
+MINHASH_FIELD = 'minhash_signature'
+MINHASH_PRIME = (1 << 31) - 1
+MINHASH_SEED = 1
+logger = logging.getLogger(DEFAULT_LOGNAME)
+
+
+# Function definitions
+def signatureCollection(db):
+    """Return the collection holding the signatures and band keys of the
+    documents in a collection."""
+    return db[MINHASH_COLLECTION]
+
+
+def clearSignatures(db):
+    """Drop the LSH index of a collection, see indexSignature()."""
+    signatureCollection(db).drop()
+
+
+def shingleHashes(texts, size=DEFAULT_SHINGLE_SIZE):
+    """Hash the shingles of a text. The words are those of
+    txt_helper.tokenizeText(), casefolded. Texts of fewer words than the
+    shingle size make a single shingle.
+
+    Args:
+        texts (iterable): the texts, e.g. the pages of a document. Shingles
+            do not reach across texts.
+        size (int, optional): number of words per shingle.
+
+    Returns:
+        set: the 32 bit hashes of the shingles.
+    """
+
+    hashes = set()
+    for text in texts:
+        words = tokenizeText(text.casefold())
+        for start in range(max(len(words) - size, 0) + 1 if words else 0):
+            hashes.add(zlib.crc32(' '.join(words[start:start+size]).encode('utf-8')))
+
+    return hashes
+
+
+@functools.lru_cache(maxsize=4)
+def _permutations(permutations):
+    """Draw the parameters of the hash functions (a * x + b) % MINHASH_PRIME.
+    They are seeded, so signatures are comparable across processes and
+    runs."""
+    # numpy takes long to import and is only loaded when needed
+    import numpy as np
+
+    rng = np.random.default_rng(MINHASH_SEED)
+    return (rng.integers(1, MINHASH_PRIME, permutations, dtype=np.uint64)[:, None],
+            rng.integers(0, MINHASH_PRIME, permutations, dtype=np.uint64)[:, None])
+
+
+def minhashSignature(hashes, permutations=DEFAULT_PERMUTATIONS):
+    """Compute the MinHash signature of a set of shingle hashes.
+
+    Args:
+        hashes (set): 32 bit shingle hashes, see shingleHashes().
+        permutations (int, optional): number of hash functions.
+
+    Returns:
+        bytes: the signature as little-endian 32 bit values, or None if
+            there are no shingles.
+    """
+    import numpy as np
+
+    if not hashes:
+        return None
+
+    a, b = _permutations(permutations)
+    hashes = np.fromiter(hashes, dtype=np.uint64, count=len(hashes)) % MINHASH_PRIME
+    signature = np.full(permutations, MINHASH_PRIME, dtype=np.uint64)
+    for start in range(0, len(hashes), MINHASH_CHUNKSIZE):
+        # Both factors are below 2**31, so the products cannot overflow
+        values = (a * hashes[start:start+MINHASH_CHUNKSIZE] + b) % MINHASH_PRIME
+        np.minimum(signature, values.min(axis=1), out=signature)
+
+    return signature.astype('<u4').tobytes()
+
+
+def textSignature(texts, size=DEFAULT_SHINGLE_SIZE, permutations=DEFAULT_PERMUTATIONS):
+    """Compute the MinHash signature of texts, see shingleHashes() and
+    minhashSignature()."""
+    return minhashSignature(shingleHashes(texts, size), permutations)
+
+
+def bandKeys(signature, bands=DEFAULT_BANDS):
+    """Cut a signature into bands and hash every band to a key.
+
+    Args:
+        signature (bytes): the signature.
+        bands (int, optional): number of bands.
+
+    Returns:
+        list: the keys, one str per band.
+    """
+
+    width = len(signature) // bands
+    return ['{0}:{1}'.format(band, hashlib.blake2b(signature[band*width:(band+1)*width], digest_size=8).hexdigest())
+            for band in range(bands)]
+
+
+def similarity(signature, other):
+    """Estimate the Jaccard similarity of two documents from their
+    signatures.
+
+    Args:
+        signature (bytes): signature of the first document.
+        other (bytes): signature of the second document.
+
+    Returns:
+        float: the share of equal signature values (0...1).
+    """
+    import numpy as np
+
+    return float(np.mean(np.frombuffer(signature, dtype='<u4') == np.frombuffer(other, dtype='<u4')))
+
+
+def findNearDuplicates(db, signature, threshold=DEFAULT_DUPLICATE_THRESHOLD, exclude=None):
+    """Find the documents of a collection similar to a signature.
+
+    Args:
+        db: a database collection object.
+        signature (bytes): the signature, see textSignature().
+        threshold (float, optional): minimum estimated similarity.
+        exclude (optional): id of a document to leave out, e.g. the one the
+            signature belongs to.
+
+    Returns:
+        list: records of the similar documents from the signature
+            collection, each with its 'similarity', most similar first.
+    """
+
+    matches = []
+    for record in signatureCollection(db).find({'bands': {'$in': bandKeys(signature)}}, {'signature': True, DUPLICATE_FIELD: True}):
+        if record['_id'] != exclude:
+            record['similarity'] = similarity(signature, record['signature'])
+            if record['similarity'] >= threshold:
+                matches.append(record)
+
+    return sorted(matches, key=lambda record: -record['similarity'])
+
+
+def indexSignature(db, document_id, signature, threshold=DEFAULT_DUPLICATE_THRESHOLD):
+    """Add a stored document to the LSH index of its collection. If it is a
+    near-duplicate of an indexed document, the DUPLICATE_FIELD of the
+    document is set to the first document of their cluster.
+
+    Args:
+        db: a database collection object.
+        document_id: id of the document.
+        signature (bytes): signature of the document, see textSignature().
+        threshold (float, optional): minimum estimated similarity of
+            near-duplicates.
+
+    Returns:
+        id of the first document of the cluster, or None if the document
+            is no near-duplicate.
+    """
+
+    # The index is ensured every time, as another process may have dropped
+    # the collection since; this is cheap if it exists
+    signatures = signatureCollection(db)
+    signatures.create_index([('bands', ASCENDING)])
+
+    original = None
+    matches = findNearDuplicates(db, signature, threshold, exclude=document_id)
+    if matches:
+        original = matches[0].get(DUPLICATE_FIELD, matches[0]['_id'])
+        db.update_one({'_id': document_id}, {'$set': {DUPLICATE_FIELD: original}})
+        logger.info('Document {0} is a near-duplicate of {1} ({2:.0%} similar).'.format(document_id, matches[0]['_id'], matches[0]['similarity']))
+
+    record = {'_id': document_id, 'bands': bandKeys(signature), 'signature': signature}
+    if original is not None:
+        record[DUPLICATE_FIELD] = original
+    signatures.replace_one({'_id': document_id}, record, upsert=True)
+
+    return original
+
+
+def removeSignature(db, document_id):
+    """Remove a deleted document from the LSH index of its collection. If it
+    was the first document of a cluster, the earliest imported of the other
+    documents takes its place, see the imported_date of
+    db_helper.storeDocument(). Documents imported at the same time are
+    ordered by their ids.
+
+    Args:
+        db: a database collection object.
+        document_id: id of the document.
+
+    Returns:
+        None
+    """
+
+    signatures = signatureCollection(db)
+    signatures.delete_one({'_id': document_id})
+    members = [record['_id'] for record in signatures.find({DUPLICATE_FIELD: document_id}, {'_id': True})]
+    if not members:
+        return
+
+    dates = {doc['_id']: doc.get('imported_date') or '' for doc in db.find({'_id': {'$in': members}}, {'imported_date': True})}
+    members.sort(key=lambda member: (dates.get(member, ''), member))
+
+    for coll in (db, signatures):
+        coll.update_one({'_id': members[0]}, {'$unset': {DUPLICATE_FIELD: ''}})
+        for member in members[1:]:
+            coll.update_one({'_id': member}, {'$set': {DUPLICATE_FIELD: members[0]}})
+
+
+def duplicateClusters(db, threshold=DEFAULT_DUPLICATE_THRESHOLD):
+    """Group all indexed documents of a collection into clusters of
+    near-duplicates. Unlike the DUPLICATE_FIELD set on import, the clusters
+    are built from all pairs of similar documents, so documents similar
+    through a third one end up in the same cluster.
+
+    Args:
+        db: a database collection object.
+        threshold (float, optional): minimum estimated similarity of
+            near-duplicates.
+
+    Returns:
+        list: the clusters of two or more documents, each a list of
+            (document id, similarity to the first document) tuples in the
+            order of the ids, largest clusters first.
+    """
+
+    signatures, buckets = {}, {}
+    for record in signatureCollection(db).find({}, {'bands': True, 'signature': True}):
+        signatures[record['_id']] = record['signature']
+        for key in record['bands']:
+            buckets.setdefault(key, []).append(record['_id'])
+
+    # Union-find over the candidate pairs which are similar enough
+    parent = {}
+
+    def _root(document_id):
+        while parent.setdefault(document_id, document_id) != document_id:
+            parent[document_id] = parent[parent[document_id]]
+            document_id = parent[document_id]
+        return document_id
+
+    checked = set()
+    for members in buckets.values():
+        for i, first in enumerate(members):
+            for second in members[i+1:]:
+                if (first, second) in checked:
+                    continue
+                checked.add((first, second))
+                if similarity(signatures[first], signatures[second]) >= threshold:
+                    parent[_root(second)] = _root(first)
+
+    clusters = {}
+    for document_id in parent:
+        clusters.setdefault(_root(document_id), set()).add(document_id)
+
+    report = []
+    for members in clusters.values():
+        members = sorted(members)
+        report.append([(member, similarity(signatures[members[0]], signatures[member])) for member in members])
+
+    return sorted(report, key=lambda cluster: (-len(cluster), cluster[0][0]))
+
+
+if __name__ == '__main__':
+    import argparse
+    from lib.db_conf import dbconfig
+    from lib.db_helper import connectClient, rebuildNearDuplicates
+
+    parser = argparse.ArgumentParser(description='Find near-duplicate documents in a document collection.')
+    parser.add_argument('collection', help='collection of the documents')
+    parser.add_argument('--database', default=dbconfig.name, help='database of the collection')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_DUPLICATE_THRESHOLD, help='minimum similarity (0...1)')
+    parser.add_argument('--rebuild', action='store_true', help='index all documents anew before the report')
+    parser.add_argument('--content-field', default='content', help='document field holding the text')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    client = connectClient()
+    coll = client[args.database][args.collection]
+    if args.rebuild:
+        print('Indexed {0} documents.'.format(rebuildNearDuplicates(coll, args.content_field, threshold=args.threshold)))
+
+    clusters = duplicateClusters(coll, args.threshold)
+    for cluster in clusters:
+        print('Cluster of {0} documents:'.format(len(cluster)))
+        for document_id, share in cluster:
+            doc = coll.find_one({'_id': document_id}, {'content_name': True, 'content_URL': True}) or {}
+            print('  {0:>4.0%}  {1}  {2}'.format(share, document_id, doc.get('content_name', '(deleted)')))
+    print('{0} clusters of near-duplicates.'.format(len(clusters)))
+    client.close()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Persistent cache of OCR results.
+
+Recognized text is stored in an sqlite file, keyed by a hash of the content
+of the page together with the rendering resolution and the OCR language.
+The cache is bounded in size; once it grows beyond its limit, the entries
+used least recently are evicted. The total size of the entries is kept in a
+table of its own, so it need not be summed up on every write. Several
+processes may share one cache file.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import hashlib, logging, os, sqlite3, threading, time
+
+# Local modules and packages
+from lib.import_conf import DEFAULT_LOGNAME
+
+# Constants and other objects
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+DEFAULT_CACHE_TIMEOUT = 30
+EVICTION_RATIO = 0.9
+logger = logging.getLogger(DEFAULT_LOGNAME)
+
+# The caches opened by this process, see openOCRCache()
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+# Classes
+class OCRCache:
+    """An on-disk cache of OCR results with hit and miss counters. The
+    counters of the current session are kept in the object, cumulative
+    counters in the cache file.
+    """
+
+    def __init__(self, path, maxsize=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=DEFAULT_CACHE_TIMEOUT, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS ocr (key TEXT PRIMARY KEY, text TEXT, size INTEGER, accessed REAL)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS ocr_accessed ON ocr (accessed)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY, hits INTEGER, misses INTEGER)')
+            self.conn.execute('INSERT OR IGNORE INTO stats VALUES (0, 0, 0)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY, size INTEGER)')
+            if self.conn.execute('SELECT 1 FROM totals WHERE id = 0').fetchone() is None:
+                # Caches written before the totals table are summed up once
+                self.conn.execute('INSERT INTO totals SELECT 0, COALESCE(SUM(size), 0) FROM ocr')
+
+
+    @staticmethod
+    def key(fingerprint, resolution, lang):
+        """Combine a page fingerprint with the OCR settings to a cache key.
+
+        Args:
+            fingerprint (str): hash of the page content.
+            resolution (int): rendering resolution.
+            lang (str): Tesseract language code.
+
+        Returns:
+            str: the cache key.
+        """
+        return hashlib.sha256('{0}|{1}|{2}'.format(fingerprint, resolution, lang).encode()).hexdigest()
+
+
+    def get(self, keys):
+        """Look up several keys at once.
+
+        Args:
+            keys (list): cache keys.
+
+        Returns:
+            dict: keys found in the cache and their text.
+        """
+
+        found = {}
+        keys = list(keys)
+        with self.lock, self.conn:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start+500]
+                rows = self.conn.execute('SELECT key, text FROM ocr WHERE key IN ({0})'.format(','.join('?' * len(batch))), batch).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self.conn.executemany('UPDATE ocr SET accessed = ? WHERE key = ?', [(now, k) for k in found])
+            hits = sum(1 for k in keys if k in found)
+            misses = len(keys) - hits
+            self.conn.execute('UPDATE stats SET hits = hits + ?, misses = misses + ? WHERE id = 0', (hits, misses))
+            self.hits+= hits
+            self.misses+= misses
+
+        return found
+
+
+    def put(self, items):
+        """Store recognized text and evict old entries if the cache is full.
+
+        Args:
+            items (dict): cache keys and their text.
+
+        Returns:
+            None
+        """
+
+        if not items:
+            return
+
+        now = time.time()
+        rows = [(k, text, len(text.encode('utf-8')), now) for k, text in items.items()]
+        keys = list(items)
+        with self.lock, self.conn:
+            # Take the write lock first, so the total stays consistent with
+            # concurrent writers
+            if not self.conn.in_transaction:
+                self.conn.execute('BEGIN IMMEDIATE')
+            replaced = 0
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start+500]
+                replaced+= self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM ocr WHERE key IN ({0})'.format(','.join('?' * len(batch))), batch).fetchone()[0]
+            self.conn.executemany('INSERT OR REPLACE INTO ocr VALUES (?, ?, ?, ?)', rows)
+            self.conn.execute('UPDATE totals SET size = size + ? WHERE id = 0', (sum(row[2] for row in rows) - replaced,))
+            total = self.conn.execute('SELECT size FROM totals WHERE id = 0').fetchone()[0]
+            if total > self.maxsize:
+                self._evict(total)
+
+
+    def _evict(self, total):
+        """Delete the least recently used entries until the cache is filled
+        to EVICTION_RATIO of its maximum size."""
+
+        target = total - self.maxsize * EVICTION_RATIO
+        freed, doomed = 0, []
+        for k, size in self.conn.execute('SELECT key, size FROM ocr ORDER BY accessed'):
+            if freed >= target:
+                break
+            doomed.append((k,))
+            freed+= size
+        self.conn.executemany('DELETE FROM ocr WHERE key = ?', doomed)
+        self.conn.execute('UPDATE totals SET size = size - ? WHERE id = 0', (freed,))
+        logger.info('Evicted {0} entries ({1} bytes) from OCR cache.'.format(len(doomed), freed))
+
+
+    def stats(self):
+        """Report the hit and miss counters.
+
+        Returns:
+            dict: hits and misses of this session and of the cache file in
+                total, plus the number of entries and their size in bytes.
+        """
+
+        with self.lock:
+            hits, misses = self.conn.execute('SELECT hits, misses FROM stats WHERE id = 0').fetchone()
+            entries = self.conn.execute('SELECT COUNT(*) FROM ocr').fetchone()[0]
+            size = self.conn.execute('SELECT size FROM totals WHERE id = 0').fetchone()[0]
+
+        return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'total_hits': hits,
+                'total_misses': misses,
+                'entries': entries,
+                'size': size
+                }
+
+
+# Function definitions
+def openOCRCache(path, maxsize=DEFAULT_CACHE_SIZE):
+    """Return the OCR cache for a file, opening it on first use in the
+    current process. Connections are not shared with forked children.
+
+    Args:
+        path (str): the cache file.
+        maxsize (int, optional): size limit of the cached text in bytes.
+
+    Returns:
+        OCRCache: the cache.
+    """
+
+    key = (os.getpid(), path)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = OCRCache(path, maxsize or DEFAULT_CACHE_SIZE)
+
+    return _caches[key]
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""Helper functions for running OCR on images held in memory.
+
+If the tesserocr package is installed, images are passed to the Tesseract
+API directly. Otherwise, pytesseract is used, which still exchanges the
+image with the Tesseract binary through a temporary file.
+
+Images can also be handed to a long-lived pool of OCR worker processes,
+which accepts jobs from any document and returns the text asynchronously.
+With tesserocr, each worker loads the language model once and keeps it for
+all pages it processes. Without it, the workers fall back to pytesseract,
+which starts Tesseract and loads the model anew for every page; a warning
+is logged when such a pool is started. The pools are closed when the
+process exits.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import atexit, functools, logging, multiprocessing, os, threading
+
+# Local modules and packages
+from lib.import_conf import DEFAULT_LOGNAME
+
+# Constants and other objects
+DEFAULT_OCR_LANGUAGE = 'deu'
+DEFAULT_TESSERACT_CMD = r'C:\Program Files (x86)\Tesseract-OCR\tesseract'
+logger = logging.getLogger(DEFAULT_LOGNAME)
+
+# State of an OCR worker process, populated by _initOCRWorker()
+_worker = {}
+
+# The OCR pools of this process, created by getOCRPool()
+_pool = {}
+_pool_lock = threading.Lock()
+
+# One-time events of this process, like warnings which are logged once
+_notices = set()
+
+
+# Function definitions
+@functools.lru_cache(maxsize=None)
+def loadPytesseract():
+    """Import pytesseract on first use and point it to the Tesseract binary
+    at DEFAULT_TESSERACT_CMD.
+
+    Returns:
+        module: the pytesseract package.
+    """
+
+    import pytesseract as pt
+    pt.pytesseract.tesseract_cmd = DEFAULT_TESSERACT_CMD
+
+    return pt
+
+
+@functools.lru_cache(maxsize=None)
+def loadTesserocr():
+    """Import tesserocr on first use.
+
+    Returns:
+        module: the tesserocr package, or None if it is not installed.
+    """
+
+    try:
+        import tesserocr
+    except ImportError:
+        tesserocr = None
+
+    return tesserocr
+
+
+def setTesseractCmd(cmd):
+    """Set the Tesseract binary used by pytesseract.
+
+    Args:
+        cmd (str): path to the Tesseract binary.
+
+    Returns:
+        None
+    """
+
+    loadPytesseract().pytesseract.tesseract_cmd = cmd
+
+
+def ocrImage(image, lang=DEFAULT_OCR_LANGUAGE):
+    """Recognize the text in an image.
+
+    Args:
+        image (PIL.Image): the image to run OCR on.
+        lang (str, optional): Tesseract language code.
+
+    Returns:
+        str: the recognized text.
+    """
+
+    tesserocr = loadTesserocr()
+    if tesserocr:
+        return tesserocr.image_to_text(image, lang=lang)
+    else:
+        return loadPytesseract().image_to_string(image, lang=lang)
+
+
+def _initOCRWorker(lang):
+    """Set up an OCR worker process. With tesserocr, the Tesseract API and
+    its language model are initialized once for the life of the worker.
+
+    Args:
+        lang (str): Tesseract language code.
+
+    Returns:
+        None
+    """
+
+    _worker['lang'] = lang
+    tesserocr = loadTesserocr()
+    if tesserocr:
+        _worker['api'] = tesserocr.PyTessBaseAPI(lang=lang)
+
+
+def _ocrWorkerImage(image):
+    """Recognize the text in an image in an OCR worker process.
+
+    Args:
+        image (PIL.Image): the image to run OCR on.
+
+    Returns:
+        str: the recognized text.
+    """
+
+    if 'api' in _worker:
+        _worker['api'].SetImage(image)
+        return _worker['api'].GetUTF8Text()
+    else:
+        return ocrImage(image, _worker['lang'])
+
+
+class OCRPool:
+    """A pool of OCR worker processes accepting page images from any number
+    of documents and threads.
+    """
+
+    def __init__(self, processes=None, lang=DEFAULT_OCR_LANGUAGE):
+        self.processes = processes or os.cpu_count()
+        self.lang = lang
+        self.pool = multiprocessing.Pool(
+                processes=self.processes,
+                initializer=_initOCRWorker,
+                initargs=(lang,))
+        logger.info('Started {0} OCR worker processes.'.format(self.processes))
+        if loadTesserocr() is None:
+            logger.warning('tesserocr is not installed. The OCR workers use pytesseract, which starts Tesseract '
+                           'and loads the language model for every page.')
+
+
+    def submit(self, image):
+        """Queue an image for OCR.
+
+        Args:
+            image (PIL.Image): the image to run OCR on.
+
+        Returns:
+            AsyncResult: result object whose get() returns the text.
+        """
+        return self.pool.apply_async(_ocrWorkerImage, (image,))
+
+
+    def close(self):
+        """Let the workers finish all queued jobs and shut them down."""
+        self.pool.close()
+        self.pool.join()
+
+
+def getOCRPool(processes=None, lang=DEFAULT_OCR_LANGUAGE):
+    """Return the OCR pool of the current process for the given settings,
+    starting it on first use.
+    The pool is kept for the life of the process, so the start-up cost of
+    the workers is paid only once.
+
+    Daemonic processes, like the workers of a parallel import, cannot have
+    child processes. For them, None is returned and a warning is logged, so
+    their pages are recognized one at a time without a pool.
+
+    Args:
+        processes (int, optional): number of workers. All cores if None.
+        lang (str, optional): Tesseract language code.
+
+    Returns:
+        OCRPool: the pool, or None if no pool can be used.
+    """
+
+    if multiprocessing.current_process().daemon:
+        if 'daemon' not in _notices:
+            _notices.add('daemon')
+            logger.warning('Process {0} is daemonic and cannot start an OCR pool. Its pages are '
+                           'recognized without the pool.'.format(multiprocessing.current_process().name))
+        return None
+
+    key = (processes, lang)
+    with _pool_lock:
+        if key not in _pool:
+            if 'atexit' not in _notices:
+                _notices.add('atexit')
+                atexit.register(closeOCRPools)
+            _pool[key] = OCRPool(processes, lang)
+
+    return _pool[key]
+
+
+def closeOCRPools():
+    """Close the OCR pools of the current process, letting their workers
+    finish all queued jobs. Registered to run at exit by getOCRPool().
+
+    Returns:
+        None
+    """
+
+    with _pool_lock:
+        pools = list(_pool.values())
+        _pool.clear()
+    for pool in pools:
+        pool.close()
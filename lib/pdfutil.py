@@ -8,19 +8,37 @@ Created on Fri Aug 17 10:25:05 2018
 # Python core modules and packages
 import io, logging, os
 
-# Third party modules and packages
-import PyPDF2
-from wand.image import Image
-
 # Local modules and packages
+import lib.metrics as metrics
 from lib.fileutil import divineImagefile
 
 # Constants and other objects
+DEFAULT_RENDER_BATCH = 8
 DEFAULT_RESOLUTION = 400
+PAGE_SQUARE_INCHES = 8.27 * 11.69
+
+# Pixels rasterized at once, about one A4 page at 600 dpi. ImageMagick holds
+# 8 bytes per pixel in a Q16 build, i.e. roughly 300 MB.
+RENDER_PIXEL_BUDGET = 36 * 1000 * 1000
 logger = logging.getLogger(__name__)
 
 
 # Function definitions
+def renderBatchSize(resolution, budget=RENDER_PIXEL_BUDGET):
+    """Tell how many A4 pages can be rasterized at once at a resolution
+    within a pixel budget.
+
+    Args:
+        resolution (int): the resolution of the rendered images.
+        budget (int, optional): maximum number of pixels held at once.
+
+    Returns:
+        int: the number of pages, at least 1 and at most
+            DEFAULT_RENDER_BATCH.
+    """
+    return max(1, min(DEFAULT_RENDER_BATCH, int(budget // (PAGE_SQUARE_INCHES * resolution ** 2))))
+
+
 def savePDFPageAsImage(src_name, dst_folder, pages, filetype, resolution=DEFAULT_RESOLUTION):
     """Load a PDF file and save the given pages to image files.
     
@@ -35,6 +53,10 @@ def savePDFPageAsImage(src_name, dst_folder, pages, filetype, resolution=DEFAULT
         int: the number of saved files
     """
 
+    # PyPDF2 and wand, which loads ImageMagick, are only imported when needed
+    import PyPDF2
+    from wand.image import Image
+
     if isinstance(pages, int):
         pages = [pages]
 
@@ -60,11 +82,12 @@ def savePDFPageAsImage(src_name, dst_folder, pages, filetype, resolution=DEFAULT
             pdf_bytes.seek(0)
 
             # Convert the PDF to an image
-            img = Image(file=pdf_bytes, resolution=resolution)
-            img.type = 'grayscale'
-            img.gaussian_blur(radius=3, sigma=1)
-            img.compression = 'losslessjpeg'
-            img.convert(typestr)
+            with metrics.stage('render'):
+                img = Image(file=pdf_bytes, resolution=resolution)
+                img.type = 'grayscale'
+                img.gaussian_blur(radius=3, sigma=1)
+                img.compression = 'losslessjpeg'
+                img.convert(typestr)
             
             # Divine a file name, verify folder, and save the image
             imgfile = divineImagefile(
@@ -74,8 +97,73 @@ def savePDFPageAsImage(src_name, dst_folder, pages, filetype, resolution=DEFAULT
                     number_prefix='p',
                     ext='.'+typestr)
             imgfullpath = os.path.join(dst_folder, imgfile)
-            img.save(filename=imgfullpath)
+            with metrics.stage('render_save'):
+                img.save(filename=imgfullpath)
+            if metrics.metricsEnabled():
+                metrics.count('render_bytes', os.path.getsize(imgfullpath))
 
         fb.close()
 
     return imgfullpath
+
+
+def renderPDFPages(src_name, pages, resolution=DEFAULT_RESOLUTION, batchsize=None):
+    """Load a PDF file once and render the given pages to grayscale images in
+    memory. Pages are rasterized in batches of batchsize pages, so that only
+    a few full-resolution bitmaps are held at any time. By default, the
+    batches are sized to RENDER_PIXEL_BUDGET, so at 600 dpi every page is
+    rasterized on its own.
+
+    Args:
+        src_name (str): name of the PDF file.
+        pages (int|list): pages to render.
+        resolution(int, optional): The resolution of the rendered images.
+        batchsize(int, optional): The number of pages rasterized at once.
+            Derived from the resolution if None, see renderBatchSize().
+
+    Yields:
+        tuple: page number and the rendered page as PIL.Image in mode 'L'.
+    """
+
+    import PyPDF2
+    from PIL import Image as PILImage
+    from wand.image import Image
+
+    if isinstance(pages, int):
+        pages = [pages]
+    batchsize = batchsize or renderBatchSize(resolution)
+
+    try:
+        fb = open(src_name, "rb")
+    except IOError as e:
+        logger.error(e)
+    else:
+        src_pdf = PyPDF2.PdfFileReader(fb, strict=False)
+        pages = sorted(pages)
+
+        for start in range(0, len(pages), batchsize):
+            batch = pages[start:start+batchsize]
+
+            # Copy the pages of the batch into a single temporary PDF
+            dst_pdf = PyPDF2.PdfFileWriter()
+            for page in batch:
+                dst_pdf.addPage(src_pdf.getPage(page))
+            pdf_bytes = io.BytesIO()
+            dst_pdf.write(pdf_bytes)
+            pdf_bytes.seek(0)
+
+            # Rasterize all pages of the batch in one go and hand over the
+            # raw pixels
+            with metrics.stage('render'):
+                img = Image(file=pdf_bytes, resolution=resolution)
+            with img:
+                for page, frame in zip(batch, img.sequence):
+                    with metrics.stage('render'):
+                        with Image(image=frame) as page_img:
+                            page_img.type = 'grayscale'
+                            page_img.gaussian_blur(radius=3, sigma=1)
+                            page_img.depth = 8
+                            page_image = PILImage.frombytes('L', page_img.size, page_img.make_blob('gray'))
+                    yield page, page_image
+
+        fb.close()
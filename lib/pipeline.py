@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""Import documents through a pipeline of stages connected by bounded queues.
+
+The parse stage extracts text from the pages of each file and hands pages
+without extractable text to the OCR stage. Once all pages of a document are
+complete, the document is passed to the store stage, which writes it to the
+database. Each stage runs its own number of worker threads, so OCR of
+image-only pages, text extraction of other pages and database inserts
+overlap. Tesseract, ImageMagick and the database driver do their work
+outside the Python interpreter lock, hence threads suffice for the OCR and
+store stages. pdfminer is pure Python and holds the lock while parsing, so
+further parse workers do not parse any faster; parsing on several cores
+takes IMPORTMODE_PROCESSES.
+
+With a journal file set in the ImportOptions, every completed page is
+recorded in the journal and interrupted documents resume with the pages
+recorded there, as in lib.importing.streamPages().
+
+Since all queues are bounded, a slow stage blocks the stages feeding it and
+the number of documents held in memory stays limited. The queue depths
+reveal which stage is the bottleneck.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import logging, queue, threading
+
+# Third party modules and packages
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFResourceManager
+
+# Local modules and packages
+import lib.metrics as metrics
+from lib.db_helper import documentExists
+from lib.fileutil import divineImagefolder
+from lib.import_conf import DEFAULT_IMPORTOPTIONS, DEFAULT_LOGNAME
+from lib.import_helper import countPages
+from lib.importing import duplicateRecord, flushImageStore, iterPages, ocrPages, splitDuplicateFiles, storeExtracted, PageText
+from lib.journal import openJournal
+
+# Constants and other objects
+DEFAULT_MONITOR_INTERVAL = 10
+DEFAULT_PUT_TIMEOUT = 1.0
+STAGES = ('parse', 'ocr', 'store')
+logger = logging.getLogger(DEFAULT_LOGNAME)
+
+
+# Classes
+class PipelineDocument:
+    """A document travelling through the pipeline. Its pages are completed
+    by the parse and the OCR stage in any order.
+    """
+
+    def __init__(self, filename, img_folder):
+        self.filename = filename
+        self.img_folder = img_folder
+        self.pages = {}
+        self.pending = 0
+        self.parsed = False
+        self.failed = False
+        self.lock = threading.Lock()
+
+
+    def setPage(self, page):
+        """Record the text of a page.
+
+        Args:
+            page (PageText): the page.
+
+        Returns:
+            bool: True if this completed the document, False otherwise.
+        """
+        with self.lock:
+            self.pages[page.number] = page
+            if not page.hadtext:
+                self.pending-= 1
+            return self.parsed and not self.pending
+
+
+    def restorePage(self, page):
+        """Record a page completed by an earlier run of the import job.
+
+        Args:
+            page (PageText): the page.
+        """
+        with self.lock:
+            self.pages[page.number] = page
+
+
+    def addPending(self):
+        """Register a page which awaits OCR."""
+        with self.lock:
+            self.pending+= 1
+
+
+    def setParsed(self):
+        """Mark the end of the parse stage for this document.
+
+        Returns:
+            bool: True if no more pages are pending, False otherwise.
+        """
+        with self.lock:
+            self.parsed = True
+            return not self.pending
+
+
+class ImportPipeline:
+    """Import files through the parse, OCR and store stages.
+
+    The number of worker threads per stage is taken from the parseWorkers,
+    ocrWorkers and storeWorkers fields of the ImportOptions; queueSize
+    limits the length of every queue. A single parse worker is enough, see
+    the module description.
+    """
+
+    def __init__(self, db, options=DEFAULT_IMPORTOPTIONS):
+        self.db = db
+        self.options = options
+        self.queues = {stage: queue.Queue(maxsize=options.queueSize) for stage in STAGES}
+        self.workers = {
+                'parse': options.parseWorkers,
+                'ocr': options.ocrWorkers,
+                'store': options.storeWorkers
+                }
+        self.maxdepths = {stage: 0 for stage in STAGES}
+        self.threads = {stage: [] for stage in STAGES}
+        self.results = []
+        self._results_lock = threading.Lock()
+        self._done = threading.Event()
+        self.journal = openJournal(options.journalFile) if options.journalFile else None
+        metrics.enableMetrics(options.metricsFile)
+        if options.parseWorkers > 1:
+            logger.warning('pdfminer parses under the Python interpreter lock, so {0} parse workers '
+                           'are no faster than one.'.format(options.parseWorkers))
+
+
+    def queueDepths(self):
+        """Report the number of items waiting in front of each stage.
+
+        Returns:
+            dict: stage names and queue lengths.
+        """
+        return {stage: self.queues[stage].qsize() for stage in STAGES}
+
+
+    def run(self, files):
+        """Run all files through the pipeline and wait for completion.
+
+        Args:
+            files (list): a list of PDF filenames.
+
+        Returns:
+            list (tuple): filename and whether the file was imported.
+        """
+
+        self.threads = threads = {stage: [threading.Thread(target=getattr(self, '_' + stage + 'Worker'), daemon=True)
+                           for i in range(max(self.workers[stage], 1))] for stage in STAGES}
+        for stage in STAGES:
+            for t in threads[stage]:
+                t.start()
+        monitor = threading.Thread(target=self._monitor, daemon=True)
+        monitor.start()
+
+        # Feed the files, then shut the stages down one after the other. Each
+        # stage only ends after every stage feeding it has ended.
+        files, duplicates = splitDuplicateFiles(files)
+        for f in duplicates:
+            self._addResult(f, False)
+        for f in files:
+            if not self._put('parse', f):
+                break
+        for stage in STAGES:
+            for t in threads[stage]:
+                if not self._put(stage, None):
+                    break
+            for t in threads[stage]:
+                t.join()
+
+        self._done.set()
+        monitor.join()
+
+        # Files left in the queues of dead workers were not imported
+        finished = {filename for filename, imported in self.results}
+        for f in files:
+            if f not in finished:
+                self._addResult(f, False)
+        logger.info('Pipeline finished. Maximum queue depths: {0}'.format(self.maxdepths))
+
+        return self.results
+
+
+    def _put(self, stage, item):
+        """Put an item into the queue of a stage, blocking while it is full.
+
+        Returns:
+            bool: False if the item was dropped, since all workers of the
+                stage have died and the queue stays full.
+        """
+        while True:
+            try:
+                self.queues[stage].put(item, timeout=DEFAULT_PUT_TIMEOUT)
+                break
+            except queue.Full:
+                if not any(t.is_alive() for t in self.threads[stage]):
+                    logger.error('All workers of the {0} stage have stopped.'.format(stage))
+                    return False
+        depth = self.queues[stage].qsize()
+        if depth > self.maxdepths[stage]:
+            self.maxdepths[stage] = depth
+        return True
+
+
+    def _addResult(self, filename, imported):
+        with self._results_lock:
+            self.results.append((filename, imported))
+
+
+    def _monitor(self):
+        """Periodically log the queue depths."""
+        while not self._done.wait(DEFAULT_MONITOR_INTERVAL):
+            logger.info('Pipeline queue depths: {0}'.format(self.queueDepths()))
+
+
+    def _parseWorker(self):
+        """Extract text from files. Pages without text are passed to OCR."""
+        rsrcmgr = PDFResourceManager()
+        while True:
+            filename = self.queues['parse'].get()
+            if filename is None:
+                break
+
+            # A failure here must not end the thread, or feeding would block
+            try:
+                record = duplicateRecord(filename)
+                if documentExists(record, self.db):
+                    logger.warning('Possible duplicate database entry found. Content was not stored in database.\nDuplicate information: ' + str(record))
+                    self._addResult(filename, False)
+                    if self.journal:
+                        self.journal.finishFile(filename)
+                    continue
+
+                logger.info("Processing file: '{0}'".format(filename))
+                metrics.setFile(filename)
+                img_folder = divineImagefolder(
+                    basefolder=self.options.imageFolder,
+                    filename=filename,
+                    as_subfolder=self.options.createSubfolders,
+                    create=True)
+            except Exception as e:
+                logger.error("Preparing '{0}' failed: {1}".format(filename, e), exc_info=True)
+                self._addResult(filename, False)
+                continue
+            doc = PipelineDocument(filename, img_folder)
+            try:
+                with open(filename, 'rb') as fp:
+                    with metrics.stage('parse'):
+                        document = PDFDocument(PDFParser(fp), '')
+                    pages = self._resumePages(doc, document, rsrcmgr)
+                    for page in pages:
+                        if page.hadtext:
+                            if self.journal:
+                                self.journal.recordPage(filename, page)
+                            doc.setPage(page)
+                        else:
+                            doc.addPending()
+                            self._put('ocr', (doc, page))
+            except Exception as e:
+                logger.error("Parsing '{0}' failed: {1}".format(filename, e), exc_info=True)
+                doc.failed = True
+            flushImageStore(self.options)
+
+            if doc.setParsed() and not self._put('store', doc):
+                self._addResult(doc.filename, False)
+
+
+    def _resumePages(self, doc, document, rsrcmgr):
+        """Restore the pages of a document recorded in the journal and
+        return an iterator over the remaining pages."""
+        pagenos = None
+        if self.journal:
+            journaled = self.journal.pages(doc.filename)
+            for page in journaled.values():
+                doc.restorePage(PageText(*page))
+            if journaled:
+                logger.info("Resuming '{0}' with {1} pages from the journal.".format(doc.filename, len(journaled)))
+                pagenos = set(range(countPages(document))) - set(journaled)
+                if not pagenos:
+                    return iter(())
+
+        return iterPages(document, doc.filename, doc.img_folder, self.options, pagenos, rsrcmgr, ocr=False)
+
+
+    def _ocrWorker(self):
+        """Run OCR on single pages."""
+        while True:
+            job = self.queues['ocr'].get()
+            if job is None:
+                break
+
+            doc, page = job
+            page_number = page.number
+            metrics.setFile(doc.filename)
+            logger.info("Page {0} of '{1}' had no extractable text. Trying OCR.".format(page_number+1, doc.filename))
+            try:
+                text = ocrPages(doc.filename, [page_number], doc.img_folder, self.options, {page_number: page.fingerprint}).get(page_number, '')
+            except Exception as e:
+                logger.error("OCR of p. {0} of '{1}' failed: {2}".format(page_number+1, doc.filename, e), exc_info=True)
+                text = ''
+            page = page._replace(text=page.text + text)
+            if self.journal:
+                self.journal.recordPage(doc.filename, page)
+            if doc.setPage(page) and not self._put('store', doc):
+                self._addResult(doc.filename, False)
+
+
+    def _storeWorker(self):
+        """Assemble completed documents in page order and store them."""
+        while True:
+            doc = self.queues['store'].get()
+            if doc is None:
+                break
+
+            stored = False
+            metrics.setFile(doc.filename)
+            if not doc.failed:
+                try:
+                    stored = storeExtracted(doc.pages.values(), doc.filename, self.db, self.options)
+                    # Documents queued with a buffered writer are marked as
+                    # completed by the writer once they are written
+                    if self.journal and not (stored and self.options.writeBatchSize):
+                        self.journal.finishFile(doc.filename)
+                except Exception as e:
+                    logger.error("Storing '{0}' failed: {1}".format(doc.filename, e), exc_info=True)
+            metrics.finishFile(doc.filename)
+            self._addResult(doc.filename, stored)
@@ -1,23 +1,101 @@
 # -*- coding: utf-8 -*-
 """Helper functions for text processing.
 
+Sets of characters are turned into lookup tables and compiled patterns once
+and cached, so cleaning a text does not build anything per call.
+
 @author: Malte Persike
 """
 
 # Python core modules and packages
-import re
+import functools, os, re
+from collections import Counter
 
 # Local modules and packages
-from lib.constants import CONTROL_CHARS_UNICODE
+from lib.constants import CONTROL_CHARS_UNICODE, DEFAULT_COMMENTTOKEN
+
+# Constants and other objects
+DEFAULT_CLEANER_REPLACEMENTS = 64
+DEFAULT_STOPWORDS = ('german',)
+DIGIT_CHARS = '1234567890'
+PUNCTUATION_CHARS = '!„"#$%&\'()*+,-–./:;<=>?@[\\]^_`{|}~'
+STOPWORDS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# Quotation marks and dashes which nltk.word_tokenize() splits words at
+TOKEN_SEPARATOR_CHARS = '«“‘„»”’\u2012\u2013\u2014\u2015'
+
+# Contractions split by nltk.word_tokenize(), in its order. Those containing
+# an apostrophe cannot occur once punctuation is removed.
+CONTRACTIONS_RE = [re.compile(pattern) for pattern in (
+        r'(?i)\b(can)(not)\b', r'(?i)\b(gim)(me)\b', r'(?i)\b(gon)(na)\b',
+        r'(?i)\b(got)(ta)\b', r'(?i)\b(lem)(me)\b', r'(?i)\b(wan)(na)(?=\s)')]
+CONTRACTION_CANDIDATES_RE = re.compile(r'(?i)cannot|gimme|gonna|gotta|lemme|wanna')
 
 
 # Function definitions
+def _replaceChar(char, replacewith, text):
+    """Replace a character in a text, with the argument order of re.sub()."""
+    return text.replace(char, replacewith)
+
+
+@functools.lru_cache(maxsize=64)
+def _stripPattern(stripchars):
+    """Compile the pattern matching runs of a set of characters."""
+    return re.compile('[{0}]+'.format(re.escape(stripchars)))
+
+
+@functools.lru_cache(maxsize=64)
+def compileCleaner(removechars='', spacechars=''):
+    """Build a function which removes one set of characters from a text and
+    replaces every character of another set with a space. Cleaners are cached,
+    so a set of characters is only prepared once.
+
+    ASCII characters are handled by bytes.translate() on the UTF-8 encoded
+    text, which uses a plain lookup table. Other characters are replaced
+    before, which is skipped for texts that are pure ASCII.
+
+    Args:
+        removechars (str, optional): characters to remove.
+        spacechars (str, optional): characters to replace with a space.
+
+    Returns:
+        callable: the cleaner, taking and returning a str.
+    """
+
+    spacechars = ''.join(c for c in spacechars if c not in removechars)
+    table = bytearray(range(256))
+    for c in spacechars:
+        if c.isascii():
+            table[ord(c)] = ord(' ')
+    table = bytes(table)
+    delete = bytes(ord(c) for c in removechars if c.isascii())
+
+    # Characters beyond ASCII span several bytes in UTF-8 and cannot go into
+    # the table. A few of them are replaced one by one, which is a fast scan
+    # when they do not occur, larger sets by a precompiled pattern.
+    replacements = []
+    for chars, replacewith in ((removechars, ''), (spacechars, ' ')):
+        chars = ''.join(c for c in chars if not c.isascii())
+        if len(chars) > DEFAULT_CLEANER_REPLACEMENTS:
+            replacements.append((re.compile('[{0}]'.format(re.escape(chars))).sub, replacewith))
+        else:
+            replacements.extend((functools.partial(_replaceChar, c), replacewith) for c in chars)
+
+    def _clean(text):
+        if replacements and not text.isascii():
+            for replace, replacewith in replacements:
+                text = replace(replacewith, text)
+        return text.encode('utf-8', 'surrogatepass').translate(table, delete).decode('utf-8', 'surrogatepass')
+
+    return _clean
+
+
 def stripChars(text, stripchars=CONTROL_CHARS_UNICODE, replacewith=''):
     """Replace a set of characters in a string with a single replacement token.
     If no set of characters is given, all non-printable characters will be
     replaced. If no replacement token is given, the set of characters will be
     removed from the string.
-    
+
     Args:
         text (str): the string on which to perform search-and-replace.
         stripchars (str): list of characters to replace or remove.
@@ -27,6 +105,177 @@ def stripChars(text, stripchars=CONTROL_CHARS_UNICODE, replacewith=''):
         str: the resulting string.
     """
 
-    control_char_re = re.compile('[{0}]+'.format(re.escape(stripchars)))
+    if not replacewith:
+        return compileCleaner(removechars=stripchars)(text)
+
+    # Every run of characters is replaced by a single token
+    return _stripPattern(stripchars).sub(replacewith, text)
+
+
+def _normalizer(control, punctuation, digits, separators):
+    """Return the cached cleaner for the options of normalizeText()."""
+    return compileCleaner(
+            removechars=(PUNCTUATION_CHARS if punctuation else '') + (DIGIT_CHARS if digits else ''),
+            spacechars=(CONTROL_CHARS_UNICODE if control else '') + (TOKEN_SEPARATOR_CHARS if separators else ''))
+
+
+def normalizeText(text, control=True, punctuation=True, digits=True, casefold=False, separators=False):
+    """Clean a text for tokenization with a cached cleaner. Control
+    characters become spaces, punctuation and digits are removed. This gives
+    the same words as stripping control characters with stripChars(text,
+    replacewith=' ') and then punctuation and digits with stripChars(text,
+    stripchars=PUNCTUATION_CHARS+DIGIT_CHARS), except that runs of control
+    characters become several spaces instead of one.
+
+    Args:
+        text (str): the text.
+        control (bool, optional): replace control characters with spaces.
+        punctuation (bool, optional): remove PUNCTUATION_CHARS.
+        digits (bool, optional): remove DIGIT_CHARS.
+        casefold (bool, optional): casefold the text.
+        separators (bool, optional): replace TOKEN_SEPARATOR_CHARS with
+            spaces.
+
+    Returns:
+        str: the normalized text.
+    """
+
+    text = _normalizer(control, punctuation, digits, separators)(text)
+
+    return text.casefold() if casefold else text
+
+
+def normalizeTexts(texts, control=True, punctuation=True, digits=True, casefold=False, separators=False):
+    """Normalize a batch of texts with one cleaner, see
+    normalizeText().
+
+    Args:
+        texts (iterable): the texts.
+        control, punctuation, digits, casefold, separators: see
+            normalizeText().
+
+    Yields:
+        str: the normalized texts, in order.
+    """
+
+    clean = _normalizer(control, punctuation, digits, separators)
+    for text in texts:
+        text = clean(text)
+        yield text.casefold() if casefold else text
+
+
+def tokenizeText(text):
+    """Split a text into words after normalizing it with normalizeText().
+    This gives the words of nltk.word_tokenize() on the normalized text,
+    without the quotation marks and dashes it returns as tokens of their own
+    and with contractions left whole, see splitContractions().
+
+    Args:
+        text (str): the text.
+
+    Returns:
+        list: the words.
+    """
+
+    return _normalizer(True, True, True, True)(text).split()
+
+
+def splitContractions(word):
+    """Split a word into the parts nltk.word_tokenize() makes of it, as in
+    'can not' for 'cannot'.
+
+    Args:
+        word (str): a word from tokenizeText().
+
+    Returns:
+        list: the parts of the word, or the word alone.
+    """
+
+    if not CONTRACTION_CANDIDATES_RE.search(word):
+        return [word]
+
+    text = ' ' + word + ' '
+    for pattern in CONTRACTIONS_RE:
+        text = pattern.sub(r' \1 \2 ', text)
+
+    return text.split()
+
+
+def countWords(texts, stopwords=frozenset()):
+    """Count the words in texts. Words are found as with nltk.word_tokenize()
+    after removing control characters, punctuation and digits, casefolded,
+    and dropped if they are stopwords or single characters.
+
+    Tokens are counted as they are first, so that casefolding, contractions
+    and the stopword test only deal with every distinct token once.
+
+    Args:
+        texts (iterable): the texts, e.g. the pages of a document.
+        stopwords (set, optional): casefolded words to leave out.
+
+    Returns:
+        Counter: words and their counts.
+    """
+
+    tokens = Counter()
+    for text in texts:
+        tokens.update(tokenizeText(text))
+
+    counts = Counter()
+    for token, count in tokens.items():
+        for word in splitContractions(token):
+            if len(word) > 1:
+                word = word.casefold()
+                if word not in stopwords:
+                    counts[word]+= count
+
+    return counts
+
+
+def stopwordsFile(name):
+    """Resolve the name of a stopword list to its file. Names without a
+    folder or extension, like 'german', refer to the lists stopwords_*.txt
+    next to this module; anything else is taken as a path.
+
+    Args:
+        name (str): name or path of the stopword list.
+
+    Returns:
+        str: path of the stopword file.
+    """
+
+    if os.path.dirname(name) or os.path.splitext(name)[1]:
+        return name
+    return os.path.join(STOPWORDS_FOLDER, 'stopwords_{0}.txt'.format(name))
+
+
+@functools.lru_cache(maxsize=16)
+def _readStopwords(fullpath, mtime):
+    """Read a stopword file, skipping comment lines. Cached per modification
+    time, so an edited list is read again."""
+    comment_re = re.compile(r'\s*[{0}]'.format(DEFAULT_COMMENTTOKEN))
+    with open(fullpath, encoding='utf-8') as fr:
+        return frozenset(line.strip() for line in fr if not comment_re.match(line))
+
+
+def loadStopwords(lists=DEFAULT_STOPWORDS):
+    """Load stopword lists. Every file is read once per process and kept as
+    long as it does not change.
+
+    Args:
+        lists (str|list, optional): names or paths of stopword lists, see
+            stopwordsFile().
+
+    Returns:
+        frozenset: the stopwords of all lists.
+    """
+
+    if isinstance(lists, str):
+        lists = [lists]
+
+    stopwords = frozenset()
+    for name in lists:
+        fullpath = os.path.abspath(stopwordsFile(name))
+        stopwords|= _readStopwords(fullpath, os.path.getmtime(fullpath))
 
-    return control_char_re.sub(replacewith, text)
+    return stopwords
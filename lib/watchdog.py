@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Run jobs in child processes which are abandoned when they exceed a time
+budget.
+
+pdfminer and ImageMagick occasionally spin for a very long time on malformed
+files. Since such work cannot be interrupted from within the interpreter,
+every job runs in a child process of its own, which is terminated once the
+job takes longer than the per-file budget or the current page takes longer
+than the per-page budget. Code running in a watched child reports the start
+of each page by calling heartbeat(); elsewhere, heartbeat() does nothing.
+
+On POSIX systems, every child leads a process group of its own, which the
+programs it starts, e.g. Tesseract or ImageMagick, inherit. An abandoned
+child is killed together with its group, so that none of them are left
+running. Elsewhere, only the child itself is terminated.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import logging, multiprocessing, os, signal, time
+from multiprocessing.connection import wait
+
+# Local modules and packages
+from lib.import_conf import DEFAULT_LOGNAME
+
+# Constants and other objects
+DEFAULT_POLL_INTERVAL = 1.0
+logger = logging.getLogger(DEFAULT_LOGNAME)
+
+# Shared progress values of a watched child, set up by _runChild()
+_progress = {}
+
+
+# Function definitions
+def heartbeat(page_number):
+    """Report the start of work on a page to the watchdog, if any.
+
+    Args:
+        page_number (int): zero-based number of the page.
+
+    Returns:
+        None
+    """
+
+    if _progress:
+        _progress['page'].value = page_number
+        _progress['started'].value = time.time()
+
+
+def _runChild(conn, page, started, target, args):
+    """Entry point of a watched child process. Sends a tuple of a success
+    flag and the return value or the error message to the parent.
+    """
+
+    # Programs started by the job join the process group of the child, so
+    # they can be killed with it, see _killChild()
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    _progress['page'] = page
+    _progress['started'] = started
+    try:
+        result = (True, target(*args))
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        result = (False, repr(e))
+    conn.send(result)
+    conn.close()
+
+
+def _killChild(proc):
+    """Kill a watched child process together with its process group. If
+    the group cannot be killed, e.g. on Windows or before the child has set
+    it up, the child alone is terminated.
+    """
+
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (AttributeError, OSError):
+        if proc.is_alive():
+            proc.terminate()
+
+
+def runWatched(jobs, target, processes=1, file_timeout=None, page_timeout=None, poll=DEFAULT_POLL_INTERVAL):
+    """Run jobs in watched child processes, at most a given number at a time.
+
+    Children are daemonic, so work inside them cannot be split across further
+    processes and every heartbeat() reaches the watchdog.
+
+    Args:
+        jobs (iterable): tuples of a job key and the arguments for target.
+        target (function): a module level function run for each job.
+        processes (int, optional): maximum number of concurrent children.
+        file_timeout (float, optional): time budget per job in seconds.
+        page_timeout (float, optional): time budget per page in seconds.
+        poll (float, optional): interval in seconds for checking budgets.
+
+    Yields:
+        tuple: job key, return value of target (None on failure) and the
+            reason of the failure (None on success).
+    """
+
+    pending = iter(jobs)
+    running = {}
+    try:
+        yield from _watchChildren(pending, running, target, processes, file_timeout, page_timeout, poll)
+    finally:
+        # Children still running when the caller stops, e.g. on an
+        # interrupt, are abandoned as well
+        for proc, conn, page, started, begun in running.values():
+            _killChild(proc)
+            proc.join()
+            conn.close()
+
+
+def _watchChildren(pending, running, target, processes, file_timeout, page_timeout, poll):
+    """Start and watch the children of runWatched(), keeping track of them
+    in running."""
+
+    exhausted = False
+    while True:
+        # Start new children while there is capacity
+        while not exhausted and len(running) < max(processes, 1):
+            try:
+                key, args = next(pending)
+            except StopIteration:
+                exhausted = True
+                break
+            parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+            page = multiprocessing.Value('i', -1, lock=False)
+            started = multiprocessing.Value('d', time.time(), lock=False)
+            proc = multiprocessing.Process(target=_runChild, args=(child_conn, page, started, target, args), daemon=True)
+            proc.start()
+            child_conn.close()
+            running[key] = (proc, parent_conn, page, started, time.time())
+
+        if not running:
+            break
+
+        wait([entry[1] for entry in running.values()] + [entry[0].sentinel for entry in running.values()], timeout=poll)
+
+        # Collect finished children and abandon those over budget
+        now = time.time()
+        for key in list(running):
+            proc, conn, page, started, begun = running[key]
+            result, reason = None, None
+            if conn.poll():
+                try:
+                    ok, value = conn.recv()
+                except EOFError:
+                    ok, value = False, 'child process ended without result'
+                if ok:
+                    result = value
+                else:
+                    reason = 'failed: {0}'.format(value)
+            elif not proc.is_alive():
+                reason = 'crashed with exit code {0}'.format(proc.exitcode)
+            elif file_timeout and now - begun > file_timeout:
+                reason = 'exceeded file time budget of {0} s'.format(file_timeout)
+            elif page_timeout and page.value >= 0 and now - started.value > page_timeout:
+                reason = 'exceeded page time budget of {0} s on p. {1}'.format(page_timeout, page.value+1)
+            else:
+                continue
+
+            if reason:
+                _killChild(proc)
+            proc.join()
+            conn.close()
+            del running[key]
+            yield key, result, reason
@@ -4,12 +4,6 @@
 @author: Malte Persike
 """
 
-# Third party modules and packages
-import numpy as np
-from PIL import Image
-import wordcloud
-
-
 # Function definitions
 def createWordcloud(freqs, fullpath, maskfile, maxwords=100):
     """Create a word cloud from a given dictionary of word frequencies. The
@@ -27,6 +21,11 @@ def createWordcloud(freqs, fullpath, maskfile, maxwords=100):
     Returns:
         None
     """
+    # numpy and wordcloud take long to import and are only loaded when needed
+    import numpy as np
+    import wordcloud
+    from PIL import Image
+
     mask = np.array(Image.open(maskfile))
     wc = wordcloud.WordCloud(
             background_color='white',
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Shared fixtures of the GLKminer tests.
+
+The tests run offline: database collections are mocked with mongomock, and
+sqlite files are created in temporary folders. Tests needing mongomock are
+skipped if it is not installed.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import os, sys
+
+# Run from the repository root, as GLKminer itself does
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Third party modules and packages
+import pytest
+
+
+# Function definitions
+@pytest.fixture
+def collection():
+    """An empty mock document collection."""
+    mongomock = pytest.importorskip('mongomock')
+    return mongomock.MongoClient().glkminer.documents
+
+
+@pytest.fixture
+def sourcefile(tmp_path):
+    """Return a function creating a file to import, whose name and creation
+    date identify a document, see db_helper.DB_DUPLICATE_FIELDS."""
+
+    def _sourcefile(name='application.pdf'):
+        path = tmp_path / name
+        path.write_bytes(b'%PDF-1.4\n')
+        return str(path)
+
+    return _sourcefile
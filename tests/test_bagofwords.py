@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Tests of lib.bagofwords and lib.corpus_view against a mongomock
+collection. Frequencies counted from the text, summed from stored term
+counts and read from the corpus view must agree.
+
+@author: Malte Persike
+"""
+
+# Third party modules and packages
+import pytest
+
+# Local modules and packages
+from lib.bagofwords import aggregateFrequencies, collectFrequencies
+from lib.corpus_view import initCorpusView
+from lib.db_helper import deleteDocuments, rebuildTermCounts, storeDocument
+from lib.import_conf import DEFAULT_IMPORTOPTIONS
+from lib.txt_helper import countWords, loadStopwords
+
+# Constants and other objects
+DOCUMENTS = [
+        ('Die Lehre und die Forschung. Lehre 2019!', 'Text'),
+        ('Forschung, Transfer und „Praxis“', 'OCR'),
+        ('Lehre – digital', 'Text')
+        ]
+OPTIONS = DEFAULT_IMPORTOPTIONS._replace(countProcesses=1)
+
+
+# Function definitions
+def _store(collection, sourcefile, termcounts, view=False):
+    """Store the documents, with or without term counts and corpus view."""
+    if view:
+        initCorpusView(collection)
+    for number, (content, source) in enumerate(DOCUMENTS):
+        storeDocument(content, source, sourcefile('{0}.pdf'.format(number)), collection,
+                      term_counts=countWords([content]) if termcounts else None)
+
+
+def _expected(documents=DOCUMENTS):
+    """Relative frequencies, each document contributing 1.0 in total."""
+    stopwords = loadStopwords()
+    freqs = {}
+    for content, source in documents:
+        counts = {word: count for word, count in countWords([content]).items() if word not in stopwords}
+        for word, count in counts.items():
+            freqs[word] = freqs.get(word, 0) + count / sum(counts.values())
+    return freqs
+
+
+def test_counts_from_text(collection, sourcefile):
+    _store(collection, sourcefile, termcounts=False)
+    assert collectFrequencies(collection, 'content', {}, OPTIONS) == pytest.approx(_expected())
+    assert collectFrequencies(collection, 'content', {}, OPTIONS._replace(termCounts=True)) == pytest.approx(_expected())
+
+
+def test_counts_from_term_counts(collection, sourcefile):
+    _store(collection, sourcefile, termcounts=True)
+    assert aggregateFrequencies(collection, {}, loadStopwords()) == pytest.approx(_expected())
+    assert collectFrequencies(collection, 'content', {'content_source': 'Text'}, OPTIONS._replace(termCounts=True)) == pytest.approx(_expected(DOCUMENTS[::2]))
+
+
+def test_counts_from_corpus_view(collection, sourcefile):
+    _store(collection, sourcefile, termcounts=True, view=True)
+    options = OPTIONS._replace(termCounts=True)
+    assert collectFrequencies(collection, 'content', {}, options) == pytest.approx(_expected())
+    assert collectFrequencies(collection, 'content', {'content_source': 'OCR'}, options) == pytest.approx(_expected(DOCUMENTS[1:2]))
+
+    deleteDocuments(collection, {'content_source': 'OCR'})
+    assert collectFrequencies(collection, 'content', {}, options) == pytest.approx(_expected(DOCUMENTS[::2]))
+
+
+def test_rebuilt_term_counts_feed_the_view(collection, sourcefile):
+    _store(collection, sourcefile, termcounts=False, view=True)
+    assert rebuildTermCounts(collection) == len(DOCUMENTS)
+    assert collectFrequencies(collection, 'content', {}, OPTIONS._replace(termCounts=True)) == pytest.approx(_expected())
+
+
+def test_view_is_not_used_for_documents_without_term_counts(collection, sourcefile):
+    _store(collection, sourcefile, termcounts=True, view=True)
+    storeDocument('Nachhaltigkeit der Lehre', 'Text', sourcefile('late.pdf'), collection)
+    documents = DOCUMENTS + [('Nachhaltigkeit der Lehre', 'Text')]
+    assert collectFrequencies(collection, 'content', {}, OPTIONS._replace(termCounts=True)) == pytest.approx(_expected(documents))
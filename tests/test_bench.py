@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""Smoke test of the benchmark suite of bench.run on a tiny corpus.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import os
+
+# Local modules and packages
+from bench.corpus import makeCorpus
+from bench.run import compareBaseline, runBenchmarks
+
+
+# Function definitions
+def test_benchmarks_run_offline(tmp_path):
+    corpus = makeCorpus(str(tmp_path / 'corpus'), kinds=('text',), sizes={'small': 2}, per_size=2)
+    assert all(os.path.exists(f) for f in corpus['text'])
+    assert makeCorpus(str(tmp_path / 'corpus'), kinds=('text',), sizes={'small': 2}, per_size=2) == corpus
+
+    results = runBenchmarks(corpus, str(tmp_path), repeat=1, only=['import_text', 'stripchars', 'frequencies'])
+    assert set(results) == {'import_text', 'stripchars', 'frequencies'}
+    assert results['import_text']['unit'] == 'pages/s' and results['import_text']['throughput'] > 0
+    assert all(result['median'] > 0 for result in results.values())
+
+    # Twice as slow as the baseline is a regression
+    baseline = {name: {'median': result['median'] / 2} for name, result in results.items()}
+    assert set(compareBaseline(results, baseline)) == set(results)
+    assert compareBaseline(results, results) == {}
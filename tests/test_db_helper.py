@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""Tests of lib.db_helper against a mongomock collection.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import time
+
+# Third party modules and packages
+from pymongo.errors import AutoReconnect
+
+# Local modules and packages
+from lib.db_helper import combineFilter, newDocumentId, pageCollection, rebuildTermCounts, storeDocument, storePage, BufferedWriter, DB_TERMCOUNTS_FIELD
+from lib.import_conf import STORAGE_PAGES
+from lib.journal import ImportJournal
+
+
+# Function definitions
+def _pagedDocument(collection, filename, text='Seite eins'):
+    """Store the page of a document stored page by page and return the
+    metadata and id for storeDocument()."""
+    document_id = newDocumentId()
+    storePage(document_id, 0, 'Text', text, collection)
+    return {'content_storage': STORAGE_PAGES, 'content_pages': 1}, document_id
+
+
+def test_combinefilter():
+    assert combineFilter(None, 'a', 1) == {'a': 1}
+    assert combineFilter({'b': 2}, 'a', 1) == {'b': 2, 'a': 1}
+    assert combineFilter({'a': {'$gt': 0}}, 'a', 1) == {'$and': [{'a': {'$gt': 0}}, {'a': 1}]}
+
+
+def test_storedocument_skips_duplicates(collection, sourcefile):
+    filename = sourcefile()
+    assert storeDocument('Lehre und Forschung', 'Text', filename, collection, skipduplicate=True)
+    assert not storeDocument('Lehre und Forschung', 'Text', filename, collection, skipduplicate=True)
+    assert collection.count_documents({}) == 1
+
+
+def test_storedocument_deletes_pages_of_duplicates(collection, sourcefile):
+    filename = sourcefile()
+    for expected in (True, False):
+        metadata, document_id = _pagedDocument(collection, filename)
+        assert storeDocument(None, 'Text', filename, collection, skipduplicate=True, metadata=metadata, document_id=document_id) == expected
+    assert collection.count_documents({}) == 1
+    assert pageCollection(collection).count_documents({}) == 1
+
+
+def test_bufferedwriter_flushes_full_batches(collection, sourcefile):
+    writer = BufferedWriter(collection, batchsize=2, interval=60)
+    for name in ('a.pdf', 'b.pdf'):
+        storeDocument('Text von ' + name, 'Text', sourcefile(name), collection, writer=writer)
+    assert collection.count_documents({}) == 2
+    assert writer.stats() == {'inserted': 2, 'duplicates': [], 'failed': []}
+
+
+def test_bufferedwriter_reports_duplicates(collection, sourcefile):
+    filename = sourcefile()
+    writer = BufferedWriter(collection, batchsize=10, interval=60)
+    for content in ('erste Fassung', 'zweite Fassung'):
+        storeDocument(content, 'Text', filename, collection, writer=writer)
+    writer.flush()
+    assert collection.count_documents({}) == 1
+    assert collection.find_one()['content'] == 'erste Fassung'
+    assert writer.stats() == {'inserted': 1, 'duplicates': [filename], 'failed': []}
+
+
+def test_bufferedwriter_deletes_pages_of_duplicates(collection, sourcefile):
+    filename = sourcefile()
+    writer = BufferedWriter(collection, batchsize=10, interval=60)
+    for _ in range(2):
+        metadata, document_id = _pagedDocument(collection, filename)
+        storeDocument(None, 'Text', filename, collection, metadata=metadata, document_id=document_id, writer=writer)
+    writer.flush()
+    assert collection.count_documents({}) == 1
+    assert pageCollection(collection).count_documents({}) == 1
+    assert pageCollection(collection).find_one()['document_id'] == collection.find_one()['_id']
+
+
+def test_bufferedwriter_flushes_on_timer(collection, sourcefile):
+    writer = BufferedWriter(collection, batchsize=10, interval=0.2)
+    storeDocument('Ein einzelnes Dokument', 'Text', sourcefile(), collection, writer=writer)
+    deadline = time.monotonic() + 5
+    while not collection.count_documents({}) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert writer.stats()['inserted'] == 1
+
+
+def _failingBulkWrite(operations, ordered=True):
+    raise AutoReconnect('connection lost')
+
+
+def test_bufferedwriter_completes_journal_after_write(tmp_path, collection, sourcefile):
+    filename = sourcefile()
+    journal = ImportJournal(str(tmp_path / 'journal.db'))
+    journal.recordPage(filename, (0, 'Text', True, None, None))
+    writer = BufferedWriter(collection, batchsize=10, interval=60, journal=journal)
+    storeDocument('Text', 'Text', filename, collection, writer=writer)
+    assert journal.completed() == set()
+
+    writer.flush()
+    assert journal.completed() == {filename}
+
+
+def test_bufferedwriter_reports_failed_writes(tmp_path, collection, sourcefile, monkeypatch):
+    filename = sourcefile()
+    journal = ImportJournal(str(tmp_path / 'journal.db'))
+    journal.recordPage(filename, (0, 'Text', True, None, None))
+    monkeypatch.setattr(collection, 'bulk_write', _failingBulkWrite)
+    writer = BufferedWriter(collection, batchsize=10, interval=60, journal=journal)
+    metadata, document_id = _pagedDocument(collection, filename)
+    storeDocument(None, 'Text', filename, collection, metadata=metadata, document_id=document_id, writer=writer)
+    writer.flush()
+
+    assert writer.stats() == {'inserted': 0, 'duplicates': [], 'failed': [(filename, 'connection lost')]}
+    assert pageCollection(collection).count_documents({}) == 0
+    assert journal.completed() == set() and journal.pages(filename) == {}
+
+
+def test_bufferedwriter_reports_failed_timer_flush(collection, sourcefile, monkeypatch):
+    filename = sourcefile()
+    monkeypatch.setattr(collection, 'bulk_write', _failingBulkWrite)
+    writer = BufferedWriter(collection, batchsize=10, interval=0.2)
+    storeDocument('Ein einzelnes Dokument', 'Text', filename, collection, writer=writer)
+    deadline = time.monotonic() + 5
+    while not writer.stats()['failed'] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert writer.stats()['failed'] == [(filename, 'connection lost')]
+
+    # The writer keeps working after the failure
+    monkeypatch.undo()
+    storeDocument('Ein weiteres Dokument', 'Text', sourcefile('b.pdf'), collection, writer=writer)
+    writer.flush()
+    assert writer.stats()['inserted'] == 1
+
+
+def test_rebuildtermcounts(collection, sourcefile):
+    storeDocument('Lehre Lehre Forschung', 'Text', sourcefile('a.pdf'), collection)
+    storeDocument('Lehre', 'Text', sourcefile('b.pdf'), collection, term_counts={'lehre': 1})
+    assert rebuildTermCounts(collection) == 1
+    counts = {doc['content_name']: doc[DB_TERMCOUNTS_FIELD] for doc in collection.find()}
+    assert counts == {'a.pdf': {'lehre': 2, 'forschung': 1}, 'b.pdf': {'lehre': 1}}
+    assert rebuildTermCounts(collection) == 0
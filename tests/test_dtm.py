@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Tests of lib.dtm.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import json, os
+
+# Third party modules and packages
+import numpy as np
+import pytest
+
+# Local modules and packages
+from lib.db_helper import storeDocument
+from lib.dtm import updateMatrix, DocumentTermMatrix, DTM_INFO_FILE
+
+
+# Function definitions
+def _dense(matrix):
+    """Return a matrix as a dense array."""
+    data, indices, indptr = matrix.arrays()
+    dense = np.zeros(matrix.shape, dtype=np.int64)
+    for row in range(len(matrix)):
+        dense[row, indices[indptr[row]:indptr[row+1]]] = data[indptr[row]:indptr[row+1]]
+    return dense
+
+
+def test_add_document():
+    matrix = DocumentTermMatrix()
+    assert matrix.addDocument('a', {'lehre': 2, 'forschung': 1}, 'Text')
+    assert matrix.addDocument('b', {'transfer': 3, 'lehre': 1})
+    assert not matrix.addDocument('a', {'lehre': 5})
+    assert matrix.shape == (2, 3)
+    assert matrix.terms == ['lehre', 'forschung', 'transfer']
+    assert 'b' in matrix and matrix.row('b') == 1 and matrix.row('c') is None
+    assert _dense(matrix).tolist() == [[2, 1, 0], [1, 0, 3]]
+    data, indices, indptr = matrix.arrays()
+    assert indices[indptr[1]:indptr[2]].tolist() == [0, 2]
+
+
+def test_save_load_append(tmp_path):
+    folder = str(tmp_path / 'dtm')
+    matrix = DocumentTermMatrix()
+    matrix.addDocument('a', {'lehre': 2, 'forschung': 1}, 'Text')
+    matrix.save(folder)
+
+    for name in ('data', 'indices', 'indptr'):
+        assert np.load(os.path.join(folder, name + '.npy')).shape == (2,)
+
+    loaded = DocumentTermMatrix.load(folder)
+    assert loaded.addDocument('b', {'transfer': 3, 'lehre': 1}, 'OCR')
+    loaded.save()
+    with open(os.path.join(folder, DTM_INFO_FILE), encoding='utf-8') as fr:
+        info = json.load(fr)
+    assert (info['rows'], info['nnz']) == (2, 4)
+
+    # The appended files are valid .npy files, read with and without mmap
+    for mmap in (True, False):
+        again = DocumentTermMatrix.load(folder, mmap=mmap)
+        assert again.documents == ['a', 'b'] and again.sources == ['Text', 'OCR']
+        assert _dense(again).tolist() == [[2, 1, 0], [1, 0, 3]]
+    assert np.load(os.path.join(folder, 'indptr.npy')).tolist() == [0, 2, 4]
+
+
+def test_load_rejects_unknown_format(tmp_path):
+    folder = str(tmp_path)
+    matrix = DocumentTermMatrix()
+    matrix.addDocument('a', {'lehre': 1})
+    matrix.save(folder)
+    with open(os.path.join(folder, DTM_INFO_FILE), 'r+', encoding='utf-8') as fp:
+        info = json.load(fp)
+        info['format'] = 99
+        fp.seek(0)
+        fp.truncate()
+        json.dump(info, fp)
+    with pytest.raises(ValueError):
+        DocumentTermMatrix.load(folder)
+
+
+def test_tocsr():
+    pytest.importorskip('scipy')
+    matrix = DocumentTermMatrix()
+    matrix.addDocument('a', {'lehre': 2, 'forschung': 1})
+    matrix.addDocument('b', {'transfer': 3})
+    assert matrix.tocsr().toarray().tolist() == _dense(matrix).tolist()
+
+
+def test_update_matrix(collection, sourcefile, tmp_path):
+    folder = str(tmp_path / 'dtm')
+    storeDocument('Lehre Lehre Forschung', 'Text', sourcefile('a.pdf'), collection, term_counts={'lehre': 2, 'forschung': 1})
+    storeDocument('Lehre und Transfer', 'OCR', sourcefile('b.pdf'), collection)
+    assert updateMatrix(collection, folder).shape == (2, 4)
+
+    storeDocument('Transfer', 'Text', sourcefile('c.pdf'), collection)
+    matrix = updateMatrix(collection, folder)
+    assert matrix.shape == (3, 4)
+    assert _dense(matrix)[matrix.row(collection.find_one({'content_name': 'b.pdf'})['_id'])].tolist() == [1, 0, 1, 1]
+    assert matrix.sources == ['Text', 'OCR', 'Text']
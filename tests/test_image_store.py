@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Tests of lib.image_store.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import os, sqlite3
+
+# Local modules and packages
+from lib.image_store import DEFAULT_INDEXFILE, ImageStore
+
+
+# Function definitions
+def test_images_are_stored_once(tmp_path):
+    store = ImageStore(str(tmp_path))
+    first = store.add(b'image', '.png', 'a.pdf', 0)
+    second = store.add(b'image', '.png', 'b.pdf', 3)
+    store.flush()
+
+    assert first == second
+    assert os.path.exists(os.path.join(str(tmp_path), first))
+    assert store.references('b.pdf') == [(3, first)]
+
+
+def test_references_are_unique(tmp_path):
+    store = ImageStore(str(tmp_path))
+    path = store.add(b'image', '.png', 'a.pdf', 0)
+    store.add(b'image', '.png', 'a.pdf', 0)
+    store.flush()
+    store.add(b'image', '.png', 'a.pdf', 0)
+    store.flush()
+
+    assert store.references('a.pdf') == [(0, path)]
+
+
+def test_duplicate_references_of_older_index_are_removed(tmp_path):
+    conn = sqlite3.connect(os.path.join(str(tmp_path), DEFAULT_INDEXFILE))
+    with conn:
+        conn.execute('CREATE TABLE images (hash TEXT PRIMARY KEY, path TEXT, size INTEGER)')
+        conn.execute('CREATE TABLE refs (document TEXT, page INTEGER, hash TEXT)')
+        conn.execute("INSERT INTO images VALUES ('ab', 'ab/ab.png', 5)")
+        conn.executemany('INSERT INTO refs VALUES (?, ?, ?)', [('a.pdf', 0, 'ab')]*3)
+    conn.close()
+
+    store = ImageStore(str(tmp_path))
+    assert store.references('a.pdf') == [(0, 'ab/ab.png')]
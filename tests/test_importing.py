@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Smoke tests of lib.importing, importing small generated PDF files into a
+mongomock collection in each import mode.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import sqlite3, time
+
+# Third party modules and packages
+from pymongo.errors import AutoReconnect
+import pytest
+
+# Local modules and packages
+from bench.corpus import writePDF
+from lib.db_helper import iterDocumentText, pageCollection, DB_TERMCOUNTS_FIELD
+import lib.importing as importing
+from lib.import_conf import DEFAULT_IMPORTOPTIONS, IMPORTMODE_PIPELINE, IMPORTMODE_PROCESSES, STORAGE_DOCUMENT, STORAGE_PAGES
+from lib.importing import importFiles
+from lib.journal import openJournal
+from lib.manifest import STATUS_FAILED, STATUS_IMPORTED
+from lib.txt_helper import countWords
+
+
+# Function definitions
+@pytest.fixture
+def pdffiles(tmp_path):
+    """Two text PDF files of one and two pages."""
+    files = [str(tmp_path / 'antrag_a.pdf'), str(tmp_path / 'antrag_b.pdf')]
+    writePDF(files[0], [('text', ['Forschung und Lehre'])])
+    writePDF(files[1], [('text', ['Erste Seite']), ('text', ['Zweite Seite'])])
+    return files
+
+
+@pytest.fixture
+def options(tmp_path):
+    """Import options writing images to the test folder."""
+    return DEFAULT_IMPORTOPTIONS._replace(imageFolder=str(tmp_path / 'img'))
+
+
+@pytest.fixture
+def workerclient(monkeypatch):
+    """Let worker processes connect to a mock database. Documents stored by
+    a worker stay in its own mock database, so only the results reported to
+    the parent can be checked."""
+    mongomock = pytest.importorskip('mongomock')
+    monkeypatch.setattr(importing, 'connectClient', lambda: mongomock.MongoClient())
+
+
+def _manifest(options):
+    """Read the statuses recorded in the manifest, by file."""
+    conn = sqlite3.connect(options.manifestFile)
+    statuses = dict(conn.execute('SELECT path, status FROM files'))
+    conn.close()
+    return statuses
+
+
+def test_import_serial(collection, pdffiles, options):
+    assert importFiles(pdffiles, collection, options) == 2
+    contents = {doc['content_name']: doc['content'] for doc in collection.find()}
+    assert 'Forschung und Lehre' in contents['antrag_a.pdf']
+    assert 'Zweite Seite' in contents['antrag_b.pdf']
+
+    # Imported files are duplicates the second time
+    assert importFiles(pdffiles, collection, options) == 0
+
+
+def test_buffered_import_completes_journal_and_manifest(tmp_path, collection, pdffiles, options):
+    options = options._replace(writeBatchSize=10, journalFile=str(tmp_path / 'journal.db'), manifestFile=str(tmp_path / 'manifest.db'))
+    assert importFiles(pdffiles, collection, options) == 2
+    assert collection.count_documents({}) == 2
+    assert openJournal(options.journalFile).completed() == set(pdffiles)
+    assert _manifest(options) == {f: STATUS_IMPORTED for f in pdffiles}
+
+
+def test_failed_buffered_import_is_not_completed(tmp_path, collection, pdffiles, options, monkeypatch):
+    def _failingBulkWrite(operations, ordered=True):
+        raise AutoReconnect('connection lost')
+    monkeypatch.setattr(collection, 'bulk_write', _failingBulkWrite)
+    options = options._replace(writeBatchSize=10, journalFile=str(tmp_path / 'journal.db'), manifestFile=str(tmp_path / 'manifest.db'))
+    failed = []
+
+    assert importFiles(pdffiles, collection, options, failed) == 0
+    assert sorted(failed) == [(f, 'connection lost') for f in pdffiles]
+    assert openJournal(options.journalFile).completed() == set()
+    assert _manifest(options) == {f: STATUS_FAILED for f in pdffiles}
+
+    # The next run imports the files again
+    monkeypatch.undo()
+    assert importFiles(pdffiles, collection, options) == 2
+    assert _manifest(options) == {f: STATUS_IMPORTED for f in pdffiles}
+
+
+@pytest.mark.parametrize('batchsize', [0, 10])
+def test_import_processes(collection, pdffiles, options, workerclient, batchsize):
+    options = options._replace(importMode=IMPORTMODE_PROCESSES, processes=2, writeBatchSize=batchsize)
+    # A file listed twice is imported once
+    assert importFiles(pdffiles + pdffiles[:1], collection, options) == 2
+
+
+def test_import_pipeline(collection, pdffiles, options):
+    options = options._replace(importMode=IMPORTMODE_PIPELINE, queueSize=1, storeWorkers=2)
+    assert importFiles(pdffiles + pdffiles[:1], collection, options) == 2
+    contents = {doc['content_name']: doc['content'] for doc in collection.find()}
+    assert 'Erste Seite' in contents['antrag_b.pdf'] and 'Zweite Seite' in contents['antrag_b.pdf']
+
+
+def test_import_pipeline_by_pages(tmp_path, collection, pdffiles, options):
+    options = options._replace(importMode=IMPORTMODE_PIPELINE, storageMode=STORAGE_PAGES, writeBatchSize=10,
+                               journalFile=str(tmp_path / 'journal.db'))
+    assert importFiles(pdffiles, collection, options) == 2
+    assert pageCollection(collection).count_documents({}) == 3
+    assert openJournal(options.journalFile).completed() == set(pdffiles)
+
+
+def test_import_pipeline_ignores_time_budgets(collection, pdffiles, options, caplog):
+    options = options._replace(importMode=IMPORTMODE_PIPELINE, fileTimeout=60)
+    assert importFiles(pdffiles, collection, options) == 2
+    assert 'fileTimeout and pageTimeout are ignored' in caplog.text
+
+
+def test_import_watched(tmp_path, collection, pdffiles, options, workerclient, monkeypatch):
+    slowfile = str(tmp_path / 'langsam.pdf')
+    writePDF(slowfile, [('text', ['Seite ohne Ende'])])
+    readFromPDF = importing.readFromPDF
+    def _readFromPDF(filename, *args, **kwargs):
+        if filename == slowfile:
+            time.sleep(60)
+        return readFromPDF(filename, *args, **kwargs)
+    monkeypatch.setattr(importing, 'readFromPDF', _readFromPDF)
+    options = options._replace(importMode=IMPORTMODE_PROCESSES, processes=2, fileTimeout=1, manifestFile=str(tmp_path / 'manifest.db'))
+    failed = []
+
+    assert importFiles(pdffiles + [slowfile], collection, options, failed) == 2
+    assert [f for f, reason in failed] == [slowfile]
+    assert _manifest(options) == {pdffiles[0]: STATUS_IMPORTED, pdffiles[1]: STATUS_IMPORTED, slowfile: STATUS_FAILED}
+
+
+@pytest.mark.parametrize('storage', [STORAGE_DOCUMENT, STORAGE_PAGES])
+def test_import_counts_normalized_terms(tmp_path, collection, options, storage):
+    filename = str(tmp_path / 'antrag.pdf')
+    writePDF(filename, [('text', ['Forschung, Lehre 2019!']), ('text', ['LEHRE und Transfer.'])])
+    options = options._replace(storageMode=storage, termCounts=True)
+    assert importFiles([filename], collection, options) == 1
+
+    # Counted page by page or over the whole text, the terms are the same
+    document = collection.find_one()
+    term_counts = document[DB_TERMCOUNTS_FIELD]
+    assert term_counts == dict(countWords(iterDocumentText(document, collection)))
+    assert term_counts['lehre'] == 2 and '2019' not in term_counts and 'forschung,' not in term_counts
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Tests of lib.journal and of resuming an import from it.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import os
+
+# Third party modules and packages
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfparser import PDFParser
+
+# Local modules and packages
+from bench.corpus import writePDF
+from lib.db_helper import pageCollection, storePage
+from lib.import_conf import DEFAULT_IMPORTOPTIONS, STORAGE_PAGES
+from lib.importing import PageText, storeExtracted, streamPages
+from lib.journal import openJournal, ImportJournal
+
+
+# Function definitions
+def test_record_and_finish(tmp_path):
+    journal = ImportJournal(str(tmp_path / 'journal.db'))
+    journal.recordPage('a.pdf', (1, 'Seite zwei', True, 'f1', 'text'))
+    journal.recordPage('a.pdf', (0, 'Seite eins', False, 'f0', 'image'))
+    journal.recordPage('a.pdf', (0, 'Seite eins neu', False, 'f0', 'image'))
+    assert journal.pages('a.pdf') == {0: (0, 'Seite eins neu', False, 'f0', 'image'), 1: (1, 'Seite zwei', True, 'f1', 'text')}
+    assert journal.completed() == set()
+
+    journal.finishFile('a.pdf')
+    assert journal.completed() == {os.path.abspath('a.pdf')}
+    assert journal.pages('a.pdf') == {}
+
+
+def test_forget_file(tmp_path):
+    journal = ImportJournal(str(tmp_path / 'journal.db'))
+    journal.recordPage('a.pdf', (0, 'Text', True, None, None))
+    journal.finishFile('b.pdf')
+    journal.forgetFile('a.pdf')
+    journal.forgetFile('b.pdf')
+    assert journal.pages('a.pdf') == {} and journal.completed() == set()
+
+
+def test_document_id(tmp_path):
+    journal = ImportJournal(str(tmp_path / 'journal.db'))
+    journal.recordDocument('a.pdf', 'id-a')
+    journal.recordDocument('b.pdf', 'id-b')
+    assert journal.documentId('a.pdf') == 'id-a'
+    assert journal.completed() == set()
+
+    journal.finishFile('a.pdf')
+    journal.forgetFile('b.pdf')
+    assert journal.documentId('a.pdf') is None and journal.documentId('b.pdf') is None
+
+
+def test_journal_survives_reopening(tmp_path):
+    path = str(tmp_path / 'journal.db')
+    journal = openJournal(path)
+    assert openJournal(path) is journal
+    journal.recordPage('a.pdf', (0, 'Text', True, None, None))
+    journal.finishFile('b.pdf')
+    journal.conn.close()
+
+    journal = ImportJournal(path)
+    assert journal.pages('a.pdf') == {0: (0, 'Text', True, None, None)}
+    assert journal.completed() == {os.path.abspath('b.pdf')}
+
+
+def test_resume_skips_recorded_pages(tmp_path):
+    filename = str(tmp_path / 'antrag.pdf')
+    writePDF(filename, [('text', ['Erste Seite']), ('text', ['Zweite Seite'])])
+    options = DEFAULT_IMPORTOPTIONS._replace(journalFile=str(tmp_path / 'journal.db'))
+    journal = openJournal(options.journalFile)
+    journal.recordPage(filename, (0, 'aus dem Journal', True, None, None))
+
+    with open(filename, 'rb') as fp:
+        document = PDFDocument(PDFParser(fp), '')
+        pages = {page.number: page.text for page in streamPages(document, filename, str(tmp_path), options)}
+
+    assert pages[0] == 'aus dem Journal'
+    assert 'Zweite Seite' in pages[1]
+    assert 'Zweite Seite' in journal.pages(filename)[1][1]
+
+
+def test_resume_replaces_pages_of_interrupted_run(tmp_path, collection, sourcefile):
+    filename = sourcefile()
+    options = DEFAULT_IMPORTOPTIONS._replace(storageMode=STORAGE_PAGES, journalFile=str(tmp_path / 'journal.db'))
+    pages = [PageText(0, 'Erste Seite', True, None, None), PageText(1, 'Zweite Seite', True, None, None)]
+
+    # The interrupted run recorded its document id and stored one page
+    def interrupted():
+        yield pages[0]
+        raise KeyboardInterrupt
+    try:
+        storeExtracted(interrupted(), filename, collection, options)
+    except KeyboardInterrupt:
+        pass
+    document_id = openJournal(options.journalFile).documentId(filename)
+    assert pageCollection(collection).count_documents({}) == 1
+
+    assert storeExtracted(pages, filename, collection, options)
+    document = collection.find_one()
+    assert str(document['_id']) == document_id
+    assert sorted(page['page'] for page in pageCollection(collection).find()) == [0, 1]
+    assert pageCollection(collection).count_documents({'document_id': {'$ne': document['_id']}}) == 0
+
+
+def test_resume_does_not_reuse_stored_document_id(tmp_path, collection, sourcefile):
+    filename = sourcefile()
+    options = DEFAULT_IMPORTOPTIONS._replace(storageMode=STORAGE_PAGES, journalFile=str(tmp_path / 'journal.db'))
+    journal = openJournal(options.journalFile)
+    document_id = collection.insert_one({'filename': 'other.pdf'}).inserted_id
+    storePage(document_id, 0, 'Text', 'Andere Seite', collection)
+    journal.recordDocument(filename, document_id)
+
+    assert storeExtracted([PageText(0, 'Erste Seite', True, None, None)], filename, collection, options)
+    assert pageCollection(collection).count_documents({'document_id': document_id}) == 1
+    assert collection.count_documents({}) == 2
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Tests of lib.keywords against a plain implementation of TF-IDF.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import math
+
+# Third party modules and packages
+import numpy as np
+import pytest
+
+# Local modules and packages
+from lib.dtm import DocumentTermMatrix
+from lib.keywords import corpusKeywords, documentKeywords, sourceRows, tfidfWeights
+
+# Constants and other objects
+DOCUMENTS = {
+        'a': ({'lehre': 4, 'digital': 2, 'und': 5}, 'Text'),
+        'b': ({'lehre': 1, 'forschung': 3, 'und': 2}, 'OCR'),
+        'c': ({'transfer': 2, 'forschung': 1, 'praxis': 1}, 'Text'),
+        'd': ({}, 'Text')
+        }
+
+
+# Function definitions
+@pytest.fixture
+def matrix():
+    matrix = DocumentTermMatrix()
+    for document_id, (term_counts, source) in DOCUMENTS.items():
+        matrix.addDocument(document_id, term_counts, source)
+    return matrix
+
+
+@pytest.fixture
+def stopwords(tmp_path):
+    path = tmp_path / 'stopwords.txt'
+    path.write_text('# Test list\nund\n', encoding='utf-8')
+    return [str(path)]
+
+
+def _plainWeights(stopwords, sublinear=False):
+    """Compute normalized TF-IDF weights document by document."""
+    n = len(DOCUMENTS)
+    df = {}
+    for term_counts, source in DOCUMENTS.values():
+        for word in term_counts:
+            if word not in stopwords:
+                df[word] = df.get(word, 0) + 1
+
+    weights = {}
+    for document_id, (term_counts, source) in DOCUMENTS.items():
+        counts = {word: count for word, count in term_counts.items() if word not in stopwords}
+        total = sum(counts.values())
+        tf = {word: (1 + math.log(count) if sublinear else count / total) for word, count in counts.items()}
+        raw = {word: tf[word] * (math.log((1 + n) / (1 + df[word])) + 1) for word in counts}
+        norm = math.sqrt(sum(weight * weight for weight in raw.values()))
+        weights[document_id] = {word: weight / norm for word, weight in raw.items()}
+
+    return weights
+
+
+@pytest.mark.parametrize('sublinear', [False, True])
+def test_tfidf_weights(matrix, stopwords, sublinear):
+    expected = _plainWeights({'und'}, sublinear)
+    weights = tfidfWeights(matrix, stopwords, sublinear)
+    data, indices, indptr = matrix.arrays()
+    for row, document_id in enumerate(matrix.documents):
+        for entry in range(indptr[row], indptr[row+1]):
+            word = matrix.terms[indices[entry]]
+            assert weights[entry] == pytest.approx(expected[document_id].get(word, 0.0))
+
+
+def test_document_keywords(matrix, stopwords):
+    expected = _plainWeights({'und'})
+    keywords = documentKeywords(matrix, k=2, stopwords=stopwords)
+    assert list(keywords) == ['a', 'b', 'c', 'd']
+    for document_id, words in keywords.items():
+        top = sorted(expected[document_id].items(), key=lambda item: -item[1])[:2]
+        assert list(words) == [word for word, weight in top]
+        assert list(words.values()) == pytest.approx([weight for word, weight in top])
+    assert keywords['d'] == {}
+
+
+def test_document_keywords_of_selected_rows(matrix, stopwords):
+    rows = sourceRows(matrix, 'ocr')
+    assert rows.tolist() == [1]
+    assert list(documentKeywords(matrix, rows=rows, stopwords=stopwords)) == ['b']
+
+
+def test_corpus_keywords(matrix, stopwords):
+    expected = {}
+    for words in _plainWeights({'und'}).values():
+        for word, weight in words.items():
+            expected[word] = expected.get(word, 0) + weight
+    keywords = corpusKeywords(matrix, k=3, stopwords=stopwords)
+    top = sorted(expected.items(), key=lambda item: -item[1])[:3]
+    assert list(keywords) == [word for word, weight in top]
+    assert list(keywords.values()) == pytest.approx([weight for word, weight in top])
+    assert 'und' not in corpusKeywords(matrix, stopwords=stopwords)
+
+
+def test_corpus_keywords_of_selected_rows(matrix, stopwords):
+    keywords = corpusKeywords(matrix, rows=np.array([2]), stopwords=stopwords)
+    assert set(keywords) == {'transfer', 'forschung', 'praxis'}
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Tests of lib.manifest.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import os
+
+# Third party modules and packages
+import pytest
+
+# Local modules and packages
+from lib.manifest import changeReport, ImportManifest, STATUS_FAILED, STATUS_IMPORTED
+
+
+# Function definitions
+@pytest.fixture
+def folder(tmp_path):
+    folder = tmp_path / 'files'
+    folder.mkdir()
+    for name in ('a.pdf', 'b.pdf', 'c.pdf'):
+        (folder / name).write_bytes(name.encode() * 10)
+    return folder
+
+
+def _files(folder):
+    return sorted(str(path) for path in folder.iterdir())
+
+
+def _touch(path, offset=10):
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + offset))
+
+
+def test_plan(tmp_path, folder):
+    manifest = ImportManifest(str(tmp_path / 'manifest.db'))
+    files = _files(folder)
+    assert manifest.plan(files, str(folder)).new == files
+
+    for f in files:
+        manifest.record(f, STATUS_FAILED if f.endswith('c.pdf') else STATUS_IMPORTED)
+    manifest.close()
+
+    (folder / 'a.pdf').write_bytes(b'changed content')
+    _touch(folder / 'b.pdf')
+    (folder / 'd.pdf').write_bytes(b'new')
+    os.remove(folder / 'c.pdf')
+    (folder / 'e.pdf').write_bytes(b'new')
+
+    manifest = ImportManifest(str(tmp_path / 'manifest.db'))
+    plan = manifest.plan(_files(folder), str(folder))
+    assert plan.modified == [str(folder / 'a.pdf')]
+    assert plan.unchanged == [str(folder / 'b.pdf')]
+    assert plan.new == [str(folder / 'd.pdf'), str(folder / 'e.pdf')]
+    assert plan.missing == [str(folder / 'c.pdf')]
+    assert plan.retry == []
+    assert changeReport(plan).startswith('2 new, 1 modified, 1 missing, 0 to retry, 1 unchanged files.')
+
+    manifest.forget(plan.missing)
+    assert manifest.plan(_files(folder), str(folder)).missing == []
+
+
+def test_touched_file_with_new_content_is_modified(tmp_path, folder):
+    manifest = ImportManifest(str(tmp_path / 'manifest.db'))
+    path = folder / 'a.pdf'
+    manifest.record(str(path), STATUS_IMPORTED)
+    path.write_bytes(b'b.pdf' * 10)
+    _touch(path)
+    assert manifest.plan([str(path)]).modified == [str(path)]
+
+
+def test_failed_files_are_retried(tmp_path, folder):
+    manifest = ImportManifest(str(tmp_path / 'manifest.db'))
+    files = _files(folder)
+    for f in files:
+        manifest.record(f, STATUS_FAILED)
+    plan = manifest.plan(files)
+    assert plan.retry == files and plan.missing == []
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Tests of lib.metrics and of the instrumentation of the import.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import time
+
+# Third party modules and packages
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfparser import PDFParser
+import pytest
+
+# Local modules and packages
+import lib.metrics as metrics
+from bench.corpus import writePDF
+from lib.import_conf import DEFAULT_IMPORTOPTIONS
+from lib.importing import streamPages
+
+
+# Function definitions
+@pytest.fixture
+def metricsfile(tmp_path):
+    """Switch instrumentation on for a test and off again afterwards."""
+    path = str(tmp_path / 'metrics.jsonl')
+    metrics.enableMetrics(path)
+    yield path
+    metrics.enableMetrics(None)
+
+
+def test_metrics_can_be_switched_off(metricsfile):
+    start = time.time()
+    with metrics.stage('parse'):
+        metrics.count('pages', 2)
+    assert metrics.metricsEnabled()
+    assert metrics.summarizeMetrics(start, write=False)['counters'] == {'pages': 2}
+
+    metrics.enableMetrics(None)
+    assert not metrics.metricsEnabled()
+    with metrics.stage('parse'):
+        metrics.count('pages')
+    assert metrics.summarizeMetrics(start) is None
+
+
+def test_pages_are_classified_only_if_requested(tmp_path, metricsfile):
+    filename = str(tmp_path / 'antrag.pdf')
+    writePDF(filename, [('text', ['Erste Seite'])])
+    start = time.time()
+
+    for classify in (False, True):
+        options = DEFAULT_IMPORTOPTIONS._replace(classifyPages=classify, metricsFile=metricsfile)
+        with open(filename, 'rb') as fp:
+            list(streamPages(PDFDocument(PDFParser(fp), ''), filename, str(tmp_path), options))
+        metrics.finishFile(filename)
+        stages = metrics.summarizeMetrics(start, write=False)['stages']
+        assert ('classify' in stages) == classify
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Tests of lib.near_duplicates against a mongomock collection.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import random, string
+
+# Third party modules and packages
+import pytest
+
+# Local modules and packages
+from lib.db_helper import deleteDocuments, rebuildNearDuplicates, storeDocument
+from lib.near_duplicates import (duplicateClusters, findNearDuplicates, indexSignature, removeSignature, shingleHashes, signatureCollection,
+                                 similarity, textSignature, DUPLICATE_FIELD, MINHASH_FIELD)
+
+# Constants and other objects
+WORDS = 800
+
+
+# Function definitions
+@pytest.fixture
+def texts():
+    """Three unrelated texts and a slightly edited copy of the first."""
+    rng = random.Random(1)
+    vocabulary = [''.join(rng.choice(string.ascii_lowercase) for _ in range(6)) for _ in range(3000)]
+    texts = [[rng.choice(vocabulary) for _ in range(WORDS)] for _ in range(3)]
+    edited = list(texts[0])
+    for _ in range(8):
+        edited[rng.randrange(WORDS)] = rng.choice(vocabulary)
+    return [' '.join(words) for words in texts + [edited]]
+
+
+def _store(collection, sourcefile, texts, signatures=True):
+    """Store texts as documents and return their ids."""
+    for number, text in enumerate(texts):
+        storeDocument(text, 'Text', sourcefile('{0}.pdf'.format(number)), collection, signature=textSignature([text]) if signatures else None)
+    return [doc['_id'] for doc in collection.find().sort('_id', 1)]
+
+
+def test_shinglehashes():
+    assert len(shingleHashes(['a b c d e f'], size=5)) == 2
+    assert len(shingleHashes(['a b'], size=5)) == 1
+    assert shingleHashes(['A B C D E'], size=5) == shingleHashes(['a b c d e'], size=5)
+    assert shingleHashes(['', '  ']) == set()
+    assert textSignature(['']) is None
+
+
+def test_similarity_estimate(texts):
+    signatures = [textSignature([text]) for text in texts]
+    assert similarity(signatures[0], signatures[0]) == 1.0
+    assert similarity(signatures[0], signatures[3]) > 0.8
+    assert similarity(signatures[0], signatures[1]) < 0.2
+
+
+def test_import_marks_near_duplicates(collection, sourcefile, texts):
+    ids = _store(collection, sourcefile, texts)
+    marked = {doc['_id']: doc[DUPLICATE_FIELD] for doc in collection.find({DUPLICATE_FIELD: {'$exists': True}})}
+    assert marked == {ids[3]: ids[0]}
+    assert [record['_id'] for record in findNearDuplicates(collection, collection.find_one({'_id': ids[3]})[MINHASH_FIELD], exclude=ids[3])] == [ids[0]]
+
+
+def test_duplicate_clusters(collection, sourcefile, texts):
+    ids = _store(collection, sourcefile, texts + [texts[0]])
+    clusters = duplicateClusters(collection)
+    assert len(clusters) == 1
+    assert [member for member, share in clusters[0]] == [ids[0], ids[3], ids[4]]
+    assert clusters[0][2][1] == 1.0
+
+
+def test_index_is_recreated_after_clearing(collection, sourcefile, texts):
+    ids = _store(collection, sourcefile, texts[:1])
+    signatureCollection(collection).drop()
+    indexSignature(collection, ids[0], textSignature([texts[0]]))
+    assert any(key == [('bands', 1)] for key in (index['key'] for index in signatureCollection(collection).index_information().values()))
+
+
+def test_remove_promotes_earliest_import(collection, sourcefile, texts):
+    ids = _store(collection, sourcefile, [texts[0], texts[3], texts[0]])
+    collection.update_one({'_id': ids[1]}, {'$set': {'imported_date': '2099-01-01 00:00:00'}})
+    collection.delete_one({'_id': ids[0]})
+    removeSignature(collection, ids[0])
+    assert DUPLICATE_FIELD not in collection.find_one({'_id': ids[2]})
+    assert collection.find_one({'_id': ids[1]})[DUPLICATE_FIELD] == ids[2]
+
+
+def test_delete_documents_updates_index(collection, sourcefile, texts):
+    ids = _store(collection, sourcefile, texts)
+    assert deleteDocuments(collection, {'_id': ids[0]}) == 1
+    assert signatureCollection(collection).count_documents({'_id': ids[0]}) == 0
+    assert collection.count_documents({DUPLICATE_FIELD: {'$exists': True}}) == 0
+
+
+def test_rebuild_computes_missing_signatures(collection, sourcefile, texts):
+    ids = _store(collection, sourcefile, texts, signatures=False)
+    assert collection.count_documents({DUPLICATE_FIELD: {'$exists': True}}) == 0
+    assert rebuildNearDuplicates(collection) == len(texts)
+    assert collection.count_documents({MINHASH_FIELD: {'$exists': True}}) == len(texts)
+    assert collection.find_one({'_id': ids[3]})[DUPLICATE_FIELD] == ids[0]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Tests of lib.ocr_cache.
+
+@author: Malte Persike
+"""
+
+# Python core modules and packages
+import os
+
+# Local modules and packages
+import lib.importing as importing
+from lib.import_conf import DEFAULT_IMPORTOPTIONS, OCRMODE_FILES
+from lib.ocr_cache import openOCRCache, OCRCache
+
+
+# Function definitions
+def test_key_depends_on_settings():
+    key = OCRCache.key('abc', 300, 'deu')
+    assert key == OCRCache.key('abc', 300, 'deu')
+    assert len({key, OCRCache.key('abd', 300, 'deu'), OCRCache.key('abc', 200, 'deu'), OCRCache.key('abc', 300, 'eng')}) == 4
+
+
+def test_get_and_put(tmp_path):
+    cache = OCRCache(str(tmp_path / 'ocr.db'))
+    cache.put({'a': 'Seite eins', 'b': 'Seite zwei'})
+    cache.put({})
+    assert cache.get(['a', 'c']) == {'a': 'Seite eins'}
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'total_hits': 1, 'total_misses': 1, 'entries': 2, 'size': 20}
+
+
+def test_counters_persist(tmp_path):
+    path = str(tmp_path / 'ocr.db')
+    cache = OCRCache(path)
+    cache.put({'a': 'Text'})
+    cache.get(['a', 'b'])
+    cache.conn.close()
+
+    cache = OCRCache(path)
+    assert cache.get(['a']) == {'a': 'Text'}
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['total_hits'], stats['total_misses']) == (1, 0, 2, 1)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = OCRCache(str(tmp_path / 'ocr.db'), maxsize=35)
+    for key in 'abc':
+        cache.put({key: key * 10})
+        # Entries are told apart by their access time
+        cache.conn.execute('UPDATE ocr SET accessed = accessed - ? WHERE key = ?', (10 - 'abc'.index(key), key))
+    cache.get(['a'])
+    cache.put({'d': 'd' * 10})
+    assert set(cache.get(['a', 'b', 'c', 'd'])) == {'a', 'c', 'd'}
+    assert cache.stats()['size'] == 30
+
+
+def test_open_cache_once_per_process(tmp_path):
+    path = str(tmp_path / 'ocr.db')
+    assert openOCRCache(path) is openOCRCache(path)
+    assert os.path.exists(path)
+
+
+def test_total_size_is_kept(tmp_path):
+    path = str(tmp_path / 'ocr.db')
+    cache = OCRCache(path)
+    cache.put({'a': 'x' * 10, 'b': 'x' * 5})
+    cache.put({'a': 'x' * 3})
+    assert cache.stats()['size'] == 8
+    assert cache.conn.execute('SELECT SUM(size) FROM ocr').fetchone()[0] == 8
+
+    # Caches written before the totals table are summed up on opening
+    cache.conn.execute('DROP TABLE totals')
+    cache.conn.commit()
+    cache.conn.close()
+    assert OCRCache(path).stats()['size'] == 8
+
+
+def test_empty_text_is_not_cached(tmp_path, monkeypatch):
+    texts = iter(['', 'Erkannter Text'])
+    monkeypatch.setattr(importing, 'runOCRonPDF', lambda **kwargs: next(texts))
+    options = DEFAULT_IMPORTOPTIONS._replace(ocrCacheFile=str(tmp_path / 'ocr.db'), ocrMode=OCRMODE_FILES)
+    for expected in ('', 'Erkannter Text', 'Erkannter Text'):
+        assert importing.ocrPages('scan.pdf', [0], str(tmp_path), options, {0: 'fingerprint'}) == {0: expected}
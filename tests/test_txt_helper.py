@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Tests of lib.txt_helper.
+
+@author: Malte Persike
+"""
+
+# Third party modules and packages
+import pytest
+
+# Local modules and packages
+from lib.constants import CONTROL_CHARS_UNICODE
+from lib.txt_helper import countWords, normalizeText, normalizeTexts, splitContractions, stripChars, tokenizeText, DIGIT_CHARS, PUNCTUATION_CHARS
+
+# Constants and other objects
+TRICKY_TEXTS = [
+        'Die Lehre im Fach „Psychologie“ wird 2019 digital.\nNeue Wege!',
+        'Studierende\tlernen: Theorie–Praxis—Transfer (sog. "Blended Learning").',
+        "Don't stop; we cannot wait, gonna go — wanna see?",
+        'a b c dd EE Ee ee ÄÖÜ äöü ß STRASSE Straße',
+        '  leading\x00and\x07control\x1fchars  ',
+        '«Zitat» ‹innen› ‚einfach‘ und ’Apostroph’ 100% §7 e-Learning',
+        ''
+        ]
+
+
+# Function definitions
+def _baselineCount(text):
+    """Count words as bagofwords did before countWords(): strip control
+    characters, punctuation and digits, tokenize with nltk, drop single
+    characters and casefold. Sentence splitting is left out, as it has no
+    effect once the sentence punctuation is stripped."""
+    nltk_tokenize = pytest.importorskip('nltk.tokenize')
+
+    text = stripChars(text, replacewith=' ')
+    text = stripChars(text, stripchars=PUNCTUATION_CHARS + DIGIT_CHARS)
+    words = {}
+    for word in nltk_tokenize.NLTKWordTokenizer().tokenize(text):
+        if len(word) > 1:
+            words[word.casefold()] = words.get(word.casefold(), 0) + 1
+
+    return words
+
+
+def test_stripchars_removes_control_characters():
+    assert stripChars('a\x00b\x07c') == 'abc'
+    assert stripChars('a\x00\x07b', replacewith=' ') == 'a b'
+    assert stripChars('x1y2z3', stripchars=DIGIT_CHARS) == 'xyz'
+
+
+@pytest.mark.parametrize('text', TRICKY_TEXTS)
+def test_normalizetext_matches_stripchars(text):
+    expected = stripChars(stripChars(text, replacewith=' '), stripchars=PUNCTUATION_CHARS + DIGIT_CHARS)
+    assert normalizeText(text).split() == expected.split()
+
+
+def test_normalizetexts_matches_normalizetext():
+    assert list(normalizeTexts(TRICKY_TEXTS, casefold=True)) == [normalizeText(text, casefold=True) for text in TRICKY_TEXTS]
+
+
+def test_normalizetext_options():
+    assert normalizeText('A1, b2.', punctuation=False) == 'A, b.'
+    assert normalizeText('A1, b2.', digits=False) == 'A1 b2'
+    assert normalizeText('Ä\x00B', casefold=True) == 'ä b'
+    assert normalizeText('a—b', separators=True) == 'a b'
+
+
+def test_tokenizetext():
+    assert tokenizeText('„Lehre“ – im Wandel, 2019!') == ['Lehre', 'im', 'Wandel']
+    assert tokenizeText(CONTROL_CHARS_UNICODE[:5]) == []
+
+
+def test_splitcontractions():
+    assert splitContractions('cannot') == ['can', 'not']
+    assert splitContractions('Gonna') == ['Gon', 'na']
+    assert splitContractions('Lehre') == ['Lehre']
+
+
+@pytest.mark.parametrize('text', TRICKY_TEXTS)
+def test_countwords_matches_baseline(text):
+    assert dict(countWords([text])) == _baselineCount(text)
+
+
+def test_countwords_stopwords_and_pages():
+    counts = countWords(['Die Lehre und die', 'Forschung und Lehre'], stopwords={'die', 'und'})
+    assert counts == {'lehre': 2, 'forschung': 1}